@@ -1,54 +1,167 @@
 import asyncio
 import json
 import argparse
-import requests
+import hashlib
+import httpx
+import io
 import os
 import dotenv
+import unicodedata
 import uuid
 from pathlib import Path
+from typing import AsyncIterator
+from telemetry.metrics import ELEVEN_LABS_CHARACTERS
+from telemetry.tracing import span
+from .rate_limit import eleven_labs_limiter
+from .resilience import ELEVEN_LABS_HEDGE, ResilientProvider
 
 dotenv_file = ".env"
 if os.path.isfile(dotenv_file):
     dotenv.load_dotenv(dotenv_file)
 ELEVEN_LABS_API_KEY = os.environ.get("ELEVEN_LABS_KEY")
 
+#CLIENT SETTINGS
+ELEVEN_LABS_BASE_URL = os.environ.get("ELEVEN_LABS_BASE_URL", "https://api.elevenlabs.io")
+ELEVEN_LABS_TIMEOUT = float(os.environ.get("ELEVEN_LABS_TIMEOUT", "60"))
+ELEVEN_LABS_MAX_CONNECTIONS = int(os.environ.get("ELEVEN_LABS_MAX_CONNECTIONS", "20"))
+ELEVEN_LABS_MAX_KEEPALIVE = int(os.environ.get("ELEVEN_LABS_MAX_KEEPALIVE", "10"))
+ELEVEN_LABS_MODEL_ID = "eleven_multilingual_v2"
+ELEVEN_LABS_VOICE_SETTINGS = {
+    "stability": 0.5,
+    "similarity_boost": 0.7
+}
+
+#HTTP/2 needs the optional h2 package, fall back to HTTP/1.1 keep-alive without it
+try:
+    import h2  # noqa: F401
+    ELEVEN_LABS_HTTP2 = os.environ.get("ELEVEN_LABS_HTTP2", "true").lower() == "true"
+except ImportError:
+    ELEVEN_LABS_HTTP2 = False
+
+#One client per process so the TLS connection is kept alive between calls
+_client: httpx.AsyncClient | None = None
+
 class ElevenLabsAPIError(Exception):
-    def __init__(self, status_code: int, detail: dict):
+    def __init__(self, status_code: int, detail: dict, retry_after: float | None = None):
         self.status_code = status_code
         self.detail = detail
+        self.retry_after = retry_after
         super().__init__(f"ElevenLabs API error {status_code}: {detail}")
 
 
-async def get_audio_from_eleven_labs(jap_text, output_path, voice_id):
+def parse_retry_after(value: str | None) -> float | None:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
 
-    url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
 
-    payload = {
-        "text": jap_text,
-        "model_id": "eleven_multilingual_v2",
-        "voice_settings": {
-            "stability": 0.5,
-            "similarity_boost": 0.7
-        }
-    }
-    headers = {
-        "Content-Type": "application/json",
-        "User-Agent": "insomnia/12.3.0",
-        "xi-api-key": ELEVEN_LABS_API_KEY
-    }
+def is_retryable_eleven_labs_error(error: BaseException) -> bool:
+    """
+    Rate limits, server errors and network failures; a bad voice id or text is not retried.
+    """
+    if isinstance(error, ElevenLabsAPIError):
+        return error.status_code == 429 or error.status_code >= 500
+    return isinstance(error, httpx.TransportError)
 
-    response = requests.request("POST", url, json=payload, headers=headers)
 
-    if response.status_code != 200:
-        raise ElevenLabsAPIError(
-            status_code=response.status_code,
-            detail=response.json().get("detail")
+def eleven_labs_retry_after(error: BaseException) -> float | None:
+    return error.retry_after if isinstance(error, ElevenLabsAPIError) else None
+
+
+eleven_labs_provider = ResilientProvider(
+    "elevenlabs", is_retryable_eleven_labs_error, eleven_labs_retry_after, hedge=ELEVEN_LABS_HEDGE,
+)
+
+
+def audio_content_hash(jap_text, voice_id) -> str:
+    """
+    Key for content-addressed audio: identical text spoken by the same voice, model and
+    settings produces the same hash. Text is NFKC-normalized and stripped first.
+    """
+    key = json.dumps(
+        {
+            "text": unicodedata.normalize("NFKC", jap_text).strip(),
+            "voice_id": voice_id,
+            "model_id": ELEVEN_LABS_MODEL_ID,
+            "voice_settings": ELEVEN_LABS_VOICE_SETTINGS,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def get_eleven_labs_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            base_url=ELEVEN_LABS_BASE_URL,
+            http2=ELEVEN_LABS_HTTP2,
+            limits=httpx.Limits(
+                max_connections=ELEVEN_LABS_MAX_CONNECTIONS,
+                max_keepalive_connections=ELEVEN_LABS_MAX_KEEPALIVE,
+            ),
+            timeout=ELEVEN_LABS_TIMEOUT,
+            headers={
+                "Content-Type": "application/json",
+                "User-Agent": "insomnia/12.3.0",
+                "xi-api-key": ELEVEN_LABS_API_KEY or "",
+            },
         )
+    return _client
 
-    # Write audio bytes to file
-    with open(output_path, "wb") as f:
-        f.write(response.content)
-    return output_path
+
+async def close_eleven_labs_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def stream_audio_from_eleven_labs(jap_text, voice_id) -> AsyncIterator[bytes]:
+    """
+    Yield the MP3 bytes as they arrive from ElevenLabs, without buffering the whole file.
+    """
+    payload = {
+        "text": jap_text,
+        "model_id": ELEVEN_LABS_MODEL_ID,
+        "voice_settings": ELEVEN_LABS_VOICE_SETTINGS,
+    }
+
+    client = get_eleven_labs_client()
+    async with eleven_labs_limiter.acquire(characters=len(jap_text)):
+        ELEVEN_LABS_CHARACTERS.inc(len(jap_text), model=ELEVEN_LABS_MODEL_ID)
+        async with client.stream("POST", f"/v1/text-to-speech/{voice_id}", json=payload) as response:
+            if response.status_code != 200:
+                await response.aread()
+                try:
+                    detail = response.json().get("detail")
+                except ValueError:
+                    detail = response.text
+                raise ElevenLabsAPIError(
+                    status_code=response.status_code,
+                    detail=detail,
+                    retry_after=parse_retry_after(response.headers.get("retry-after")),
+                )
+
+            async for chunk in response.aiter_bytes():
+                yield chunk
+
+
+async def get_audio_from_eleven_labs(jap_text, voice_id) -> bytes:
+    """
+    Generate speech for the text and return the MP3 bytes, collected in memory.
+    Failed attempts are retried from the start by eleven_labs_provider.
+    """
+    async def attempt():
+        buffer = io.BytesIO()
+        with span("elevenlabs.tts", provider="elevenlabs"):
+            async for chunk in stream_audio_from_eleven_labs(jap_text, voice_id):
+                buffer.write(chunk)
+        return buffer.getvalue()
+
+    return await eleven_labs_provider.call(attempt)
 
 
 async def main(filename: str):
@@ -72,8 +185,13 @@ async def main(filename: str):
 
     # do something with payload
     print(payload["translation"], audio_path)
-    saved_file_location = await get_audio_from_eleven_labs(payload["translation"],audio_path,"EXAVITQu4vr4xnSDxMaL")
-    print("OUT: ",saved_file_location)
+    audio_data = await get_audio_from_eleven_labs(payload["translation"],"EXAVITQu4vr4xnSDxMaL")
+    await close_eleven_labs_client()
+
+    # Write audio bytes to file
+    with open(audio_path, "wb") as f:
+        f.write(audio_data)
+    print("OUT: ",audio_path)
 
 
 
@@ -0,0 +1,180 @@
+import asyncio
+import math
+import os
+import time
+import dotenv
+from contextlib import asynccontextmanager
+from telemetry.metrics import PROVIDER_QUEUE_DEPTH, PROVIDER_IN_FLIGHT, PROVIDER_QUEUE_WAIT, PROVIDER_SHED
+
+dotenv_file = ".env"
+if os.path.isfile(dotenv_file):
+    dotenv.load_dotenv(dotenv_file)
+
+#RATE LIMITS, per worker process (divide the provider's limits by the number of workers)
+#A rate of 0 turns that bucket off
+OPENAI_REQUESTS_PER_SECOND = float(os.environ.get("OPENAI_REQUESTS_PER_SECOND", "8"))
+OPENAI_TOKENS_PER_MINUTE = float(os.environ.get("OPENAI_TOKENS_PER_MINUTE", "200000"))
+OPENAI_MAX_IN_FLIGHT = int(os.environ.get("OPENAI_MAX_IN_FLIGHT", "20"))
+ELEVEN_LABS_CHARACTERS_PER_SECOND = float(os.environ.get("ELEVEN_LABS_CHARACTERS_PER_SECOND", "0"))
+#Clips generated at once, keep within the ElevenLabs plan's concurrency limit (TTS_CONCURRENCY is the old name)
+ELEVEN_LABS_MAX_IN_FLIGHT = int(os.environ.get("ELEVEN_LABS_MAX_IN_FLIGHT", os.environ.get("TTS_CONCURRENCY", "3")))
+#Longest a call waits for the buckets and a free slot before it is shed with a 429
+PROVIDER_MAX_QUEUE_WAIT = float(os.environ.get("PROVIDER_MAX_QUEUE_WAIT", "5"))
+
+
+class ProviderRateLimited(Exception):
+    """
+    Raised when a provider call would wait longer than allowed; retry_after is in seconds.
+    """
+
+    def __init__(self, provider: str, retry_after: float):
+        self.provider = provider
+        self.retry_after = retry_after
+        super().__init__(f"{provider} is rate limited, retry after {retry_after:.1f}s")
+
+
+class TokenBucket:
+    """
+    Refills at rate units per second up to capacity. Reservations may take the level below zero,
+    so callers queue in arrival order and each is told how long to wait for its share.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """
+        Seconds until amount could be taken, without taking it.
+        """
+        self._refill()
+        deficit = min(amount, self.capacity) - self.level
+        return max(0.0, deficit / self.rate)
+
+    def current_level(self) -> float:
+        self._refill()
+        return self.level
+
+    def take(self, amount: float):
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+    def refund(self, amount: float):
+        self._refill()
+        self.level = min(self.capacity, self.level + min(amount, self.capacity))
+
+
+class ProviderLimiter:
+    """
+    Token buckets plus a max-in-flight semaphore in front of one provider. Calls queue for up to
+    max_wait seconds; past that they raise ProviderRateLimited instead of piling up.
+    """
+
+    def __init__(self, provider: str, buckets: dict[str, TokenBucket], max_in_flight: int, max_wait: float = PROVIDER_MAX_QUEUE_WAIT):
+        self.provider = provider
+        self.buckets = buckets
+        self.max_in_flight = max_in_flight
+        self.max_wait = max_wait
+        self._semaphore = asyncio.Semaphore(max_in_flight) if max_in_flight > 0 else None
+        self.waiting = 0
+        self.in_flight = 0
+
+    def _update_gauges(self):
+        PROVIDER_QUEUE_DEPTH.set(self.waiting, provider=self.provider)
+        PROVIDER_IN_FLIGHT.set(self.in_flight, provider=self.provider)
+
+    def _shed(self, reason: str, retry_after: float):
+        PROVIDER_SHED.inc(provider=self.provider, reason=reason)
+        raise ProviderRateLimited(self.provider, retry_after)
+
+    @asynccontextmanager
+    async def acquire(self, **costs: float):
+        """
+        Wait for the named bucket costs (e.g. requests=1, tokens=900) and a free slot.
+        """
+        started = time.monotonic()
+        costs = {name: amount for name, amount in costs.items() if name in self.buckets}
+        wait = max((self.buckets[name].wait_time(amount) for name, amount in costs.items()), default=0.0)
+        if wait > self.max_wait:
+            self._shed("rate", wait)
+
+        for name, amount in costs.items():
+            self.buckets[name].take(amount)
+        self.waiting += 1
+        self._update_gauges()
+        try:
+            if wait > 0:
+                await asyncio.sleep(wait)
+            if self._semaphore is not None and not self._semaphore.locked():
+                await self._semaphore.acquire()
+            elif self._semaphore is not None:
+                remaining = self.max_wait - (time.monotonic() - started)
+                try:
+                    await asyncio.wait_for(self._semaphore.acquire(), timeout=max(0.0, remaining))
+                except asyncio.TimeoutError:
+                    self._shed("concurrency", self.max_wait)
+        except BaseException:
+            #Shed or cancelled while queued: the call never ran, give its share back
+            for name, amount in costs.items():
+                self.buckets[name].refund(amount)
+            self.waiting -= 1
+            self._update_gauges()
+            raise
+
+        self.waiting -= 1
+        self.in_flight += 1
+        self._update_gauges()
+        PROVIDER_QUEUE_WAIT.observe(time.monotonic() - started, provider=self.provider)
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            if self._semaphore is not None:
+                self._semaphore.release()
+            self._update_gauges()
+
+    def get_stats(self) -> dict:
+        return {
+            "waiting": self.waiting,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "max_wait": self.max_wait,
+            "buckets": {
+                name: {"rate_per_s": bucket.rate, "capacity": bucket.capacity, "level": round(bucket.current_level(), 1)}
+                for name, bucket in self.buckets.items()
+            },
+        }
+
+
+def retry_after_header(seconds: float) -> str:
+    return str(max(1, math.ceil(seconds)))
+
+
+def build_buckets(**rates: tuple[float, float]) -> dict[str, TokenBucket]:
+    """
+    name=(rate per second, burst capacity); a rate of 0 leaves the bucket out.
+    """
+    return {name: TokenBucket(rate, capacity) for name, (rate, capacity) in rates.items() if rate > 0}
+
+
+#One second of requests and one minute of tokens may be used in a burst
+openai_limiter = ProviderLimiter(
+    "openai",
+    build_buckets(
+        requests=(OPENAI_REQUESTS_PER_SECOND, OPENAI_REQUESTS_PER_SECOND),
+        tokens=(OPENAI_TOKENS_PER_MINUTE / 60, OPENAI_TOKENS_PER_MINUTE),
+    ),
+    OPENAI_MAX_IN_FLIGHT,
+)
+eleven_labs_limiter = ProviderLimiter(
+    "elevenlabs",
+    build_buckets(characters=(ELEVEN_LABS_CHARACTERS_PER_SECOND, ELEVEN_LABS_CHARACTERS_PER_SECOND)),
+    ELEVEN_LABS_MAX_IN_FLIGHT,
+)
@@ -0,0 +1,231 @@
+import asyncio
+import logging
+import os
+import random
+import time
+import dotenv
+from collections import deque
+from typing import Any, Awaitable, Callable
+from telemetry.metrics import PROVIDER_RETRIES, PROVIDER_HEDGES, PROVIDER_CIRCUIT_OPEN
+
+dotenv_file = ".env"
+if os.path.isfile(dotenv_file):
+    dotenv.load_dotenv(dotenv_file)
+
+#RETRY PARAMS
+#Attempts per call, including the first
+PROVIDER_RETRY_ATTEMPTS = int(os.environ.get("PROVIDER_RETRY_ATTEMPTS", "3"))
+PROVIDER_RETRY_BASE = float(os.environ.get("PROVIDER_RETRY_BASE", "0.5"))
+PROVIDER_RETRY_MAX = float(os.environ.get("PROVIDER_RETRY_MAX", "8"))
+#CIRCUIT BREAKER PARAMS
+#Consecutive provider failures that open the circuit, and how long it stays open
+PROVIDER_BREAKER_FAILURES = int(os.environ.get("PROVIDER_BREAKER_FAILURES", "5"))
+PROVIDER_BREAKER_RESET = float(os.environ.get("PROVIDER_BREAKER_RESET", "30"))
+#HEDGING PARAMS
+#A second request is sent when the first is slower than the recent p95 (never sooner than the floor)
+OPENAI_HEDGE = os.environ.get("OPENAI_HEDGE", "true").lower() == "true"
+#Off by default: a hedged clip is paid for twice
+ELEVEN_LABS_HEDGE = os.environ.get("ELEVEN_LABS_HEDGE", "false").lower() == "true"
+PROVIDER_HEDGE_MIN_DELAY = float(os.environ.get("PROVIDER_HEDGE_MIN_DELAY", "0.5"))
+#Latencies needed before the p95 is trusted
+PROVIDER_HEDGE_MIN_SAMPLES = int(os.environ.get("PROVIDER_HEDGE_MIN_SAMPLES", "20"))
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderUnavailable(Exception):
+    """
+    Raised without calling the provider while its circuit is open; retry_after is in seconds.
+    """
+
+    def __init__(self, provider: str, retry_after: float):
+        self.provider = provider
+        self.retry_after = retry_after
+        super().__init__(f"{provider} is unavailable, retry after {retry_after:.1f}s")
+
+
+class InvalidReplyError(Exception):
+    """
+    The provider answered, but not with something usable (e.g. malformed JSON). Worth retrying.
+    """
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures and fails fast for reset_timeout seconds.
+    Then one trial call is let through (half open): success closes it, failure opens it again.
+    """
+
+    def __init__(self, provider: str, failure_threshold: int = PROVIDER_BREAKER_FAILURES, reset_timeout: float = PROVIDER_BREAKER_RESET):
+        self.provider = provider
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def before_call(self):
+        state = self.state
+        if state == "open":
+            raise ProviderUnavailable(self.provider, self.reset_timeout - (time.monotonic() - self.opened_at))
+        if state == "half_open":
+            if self._trial_running:
+                raise ProviderUnavailable(self.provider, 1.0)
+            self._trial_running = True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        PROVIDER_CIRCUIT_OPEN.set(0, provider=self.provider)
+
+    def record_failure(self):
+        self.failures += 1
+        if self._trial_running or self.failures >= self.failure_threshold:
+            if self.opened_at is None or self._trial_running:
+                logger.warning("circuit opened", extra={"provider": self.provider, "failures": self.failures})
+            self.opened_at = time.monotonic()
+            PROVIDER_CIRCUIT_OPEN.set(1, provider=self.provider)
+        self._trial_running = False
+
+    def record_ignored(self):
+        """
+        The call ended without telling us anything about the provider's health (cancelled,
+        or a client error such as an unknown voice).
+        """
+        self._trial_running = False
+
+
+class LatencyWindow:
+    """
+    The most recent successful call durations, for the hedging threshold.
+    """
+
+    def __init__(self, size: int = 200):
+        self.samples: deque[float] = deque(maxlen=size)
+
+    def add(self, duration: float):
+        self.samples.append(duration)
+
+    def p95(self) -> float | None:
+        if len(self.samples) < PROVIDER_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+
+class ResilientProvider:
+    """
+    Wraps single provider calls with retries (full-jitter backoff, honouring Retry-After),
+    an optional hedged second request, and a circuit breaker.
+
+    is_retryable(error) decides which errors are the provider's fault and worth another attempt;
+    retry_after(error) may return the delay the provider asked for.
+    """
+
+    def __init__(
+        self,
+        provider: str,
+        is_retryable: Callable[[BaseException], bool],
+        retry_after: Callable[[BaseException], float | None] = lambda error: None,
+        hedge: bool = False,
+        attempts: int = PROVIDER_RETRY_ATTEMPTS,
+    ):
+        self.provider = provider
+        self.is_retryable = is_retryable
+        self.retry_after = retry_after
+        self.hedge = hedge
+        self.attempts = max(1, attempts)
+        self.breaker = CircuitBreaker(provider)
+        self.latency = LatencyWindow()
+
+    def backoff(self, attempt: int, error: BaseException) -> float:
+        delay = random.uniform(0, min(PROVIDER_RETRY_MAX, PROVIDER_RETRY_BASE * 2 ** (attempt - 1)))
+        requested = self.retry_after(error)
+        if requested is not None:
+            delay = max(delay, min(requested, PROVIDER_RETRY_MAX))
+        return delay
+
+    async def _attempt(self, fn: Callable[[], Awaitable[Any]]):
+        self.breaker.before_call()
+        started = time.perf_counter()
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            self.breaker.record_ignored()
+            raise
+        except Exception as e:
+            if self.is_retryable(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_ignored()
+            raise
+        self.breaker.record_success()
+        self.latency.add(time.perf_counter() - started)
+        return result
+
+    async def _hedged(self, fn: Callable[[], Awaitable[Any]]):
+        """
+        Run fn; if it has not finished by the p95 latency, start a second one and take whichever
+        succeeds first.
+        """
+        threshold = self.latency.p95() if self.hedge else None
+        if threshold is None:
+            return await self._attempt(fn)
+
+        first = asyncio.create_task(self._attempt(fn))
+        done, _ = await asyncio.wait({first}, timeout=max(threshold, PROVIDER_HEDGE_MIN_DELAY))
+        if done:
+            return first.result()
+
+        second = asyncio.create_task(self._attempt(fn))
+        pending = {first, second}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        PROVIDER_HEDGES.inc(provider=self.provider, winner="hedge" if task is second else "first")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def call(self, fn: Callable[[], Awaitable[Any]]):
+        """
+        Run fn, a single call to the provider, with retries and hedging.
+        """
+        for attempt in range(1, self.attempts + 1):
+            try:
+                return await self._hedged(fn)
+            except ProviderUnavailable:
+                raise
+            except Exception as e:
+                if attempt >= self.attempts or not self.is_retryable(e):
+                    raise
+                PROVIDER_RETRIES.inc(provider=self.provider, reason=type(e).__name__)
+                delay = self.backoff(attempt, e)
+                logger.info("retrying provider call", extra={
+                    "provider": self.provider, "attempt": attempt, "delay": round(delay, 2), "error": repr(e),
+                })
+                await asyncio.sleep(delay)
+
+    def get_stats(self) -> dict:
+        p95 = self.latency.p95()
+        return {
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "hedge": self.hedge,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+        }
@@ -2,9 +2,16 @@ import argparse
 import dotenv
 import os
 import asyncio
-from openai import OpenAI
+import httpx
+import openai
+from openai import AsyncOpenAI
 import json
+import logging
 from datetime import datetime
+from telemetry.metrics import OPENAI_TOKENS
+from telemetry.tracing import span
+from .rate_limit import openai_limiter
+from .resilience import OPENAI_HEDGE, InvalidReplyError, ResilientProvider
 
 
 dotenv_file = ".env"
@@ -12,15 +19,92 @@ if os.path.isfile(dotenv_file):
     dotenv.load_dotenv(dotenv_file)
 API_KEY = os.environ.get("OPENAI_API_KEY")
 
+#CLIENT SETTINGS
+OPENAI_MODEL = "gpt-4o-mini"  # You can use "gpt-4o" or "gpt-4-turbo" for larger outputs
+OPENAI_TEMPERATURE = 0.2
+#Bump when a prompt template changes, so replies cached for the old one are not reused
+TRANSLATION_PROMPT_VERSION = "translate-v1"
+BATCH_PROMPT_VERSION = "translate-batch-v1"
+OPENAI_TIMEOUT = float(os.environ.get("OPENAI_TIMEOUT", "30"))
+OPENAI_MAX_CONNECTIONS = int(os.environ.get("OPENAI_MAX_CONNECTIONS", "50"))
+OPENAI_MAX_KEEPALIVE = int(os.environ.get("OPENAI_MAX_KEEPALIVE", "20"))
 
-def ai_translate_eng_word_to_jap(word,context):
-    if not API_KEY:
-        raise RuntimeError("OPENAI_API_KEY is not set")
-    
-    client = OpenAI(api_key=API_KEY)
+logger = logging.getLogger(__name__)
 
-    # --- PROMPT FOR AI ---
-    prompt = f"""
+#One client per process, shared by every request so connections are pooled
+_client: AsyncOpenAI | None = None
+
+
+def get_openai_client() -> AsyncOpenAI:
+    """
+    Return the process-wide AsyncOpenAI client, creating it on first use.
+    The base url can be pointed at a local stub with OPENAI_BASE_URL.
+    """
+    global _client
+    if _client is None:
+        if not API_KEY:
+            raise RuntimeError("OPENAI_API_KEY is not set")
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+            ),
+            timeout=OPENAI_TIMEOUT,
+        )
+        #Retries are done by openai_provider, so the SDK's own are turned off
+        _client = AsyncOpenAI(api_key=API_KEY, timeout=OPENAI_TIMEOUT, http_client=http_client, max_retries=0)
+    return _client
+
+
+async def close_openai_client():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+def record_token_usage(response):
+    """
+    Add the reply's token usage to the counters; stubs and some proxies leave it out.
+    """
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    OPENAI_TOKENS.inc(usage.prompt_tokens or 0, model=OPENAI_MODEL, kind="prompt")
+    OPENAI_TOKENS.inc(usage.completion_tokens or 0, model=OPENAI_MODEL, kind="completion")
+
+
+def is_retryable_openai_error(error: BaseException) -> bool:
+    """
+    Rate limits, server errors, timeouts, dropped connections and unusable replies.
+    """
+    if isinstance(error, (InvalidReplyError, openai.APIConnectionError, openai.RateLimitError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def openai_retry_after(error: BaseException) -> float | None:
+    if isinstance(error, openai.APIStatusError):
+        try:
+            return float(error.response.headers.get("retry-after"))
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+openai_provider = ResilientProvider("openai", is_retryable_openai_error, openai_retry_after, hedge=OPENAI_HEDGE)
+
+
+def estimate_tokens(messages: list[dict], max_tokens: int) -> int:
+    """
+    What OpenAI counts against the tokens-per-minute limit: the prompt (about 4 characters
+    per token) plus the max_tokens requested.
+    """
+    return sum(len(message["content"]) for message in messages) // 4 + max_tokens
+
+
+def build_translation_prompt(word, context):
+    return f"""
         You are a professional English to Japanese translator for a language-learning app.
 
         Translate the English word "{word}" into Japanese.
@@ -49,31 +133,136 @@ def ai_translate_eng_word_to_jap(word,context):
         - Do NOT include any text outside JSON
     """
 
-    # --- API CALL ---
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",  # You can use "gpt-4o" or "gpt-4-turbo" for larger outputs
-        messages=[
-            {"role": "system", "content": "You are a language translator of English to Japanese."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.2,
-        max_tokens=500  # increase if you want more output (may need pagination)
-    )
+
+async def request_json_reply(
+    prompt: str,
+    max_tokens: int,
+    span_name: str,
+    timeout: float | None = None,
+    **create_args,
+) -> dict:
+    """
+    One chat completion through the rate limiter, parsed as a JSON object.
+    Raises InvalidReplyError when the reply is not one, so the caller's retry covers it.
+    """
+    client = get_openai_client()
+    messages = [
+        {"role": "system", "content": "You are a language translator of English to Japanese."},
+        {"role": "user", "content": prompt}
+    ]
+    async with openai_limiter.acquire(requests=1, tokens=estimate_tokens(messages, max_tokens)):
+        with span(span_name, provider="openai"):
+            response = await client.chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=messages,
+                temperature=OPENAI_TEMPERATURE,
+                max_tokens=max_tokens,
+                timeout=timeout if timeout is not None else OPENAI_TIMEOUT,
+                **create_args,
+            )
+    record_token_usage(response)
 
     # --- EXTRACT TEXT OUTPUT ---
-    reply_data = response.choices[0].message.content.strip()
-    print("RAW:", reply_data)
-    print("REPR:", repr(reply_data))
+    reply_data = (response.choices[0].message.content or "").strip()
+    logger.debug("openai reply", extra={"span": span_name, "reply": reply_data})
 
     try:
         reply_dict = json.loads(reply_data)
     except json.JSONDecodeError as e:
-        # Handle malformed JSON
-        print("JSON parse error:", e)
-        reply_dict = None
+        logger.warning("openai reply is not valid JSON", extra={"span": span_name, "error": str(e)})
+        raise InvalidReplyError(f"Reply is not valid JSON: {e}") from e
+    if not isinstance(reply_dict, dict):
+        raise InvalidReplyError("Reply is not a JSON object")
     return reply_dict
 
 
+async def ai_translate_eng_word_to_jap(word, context, timeout: float | None = None) -> dict:
+    """
+    Translate one word. Retries, hedging and the circuit breaker come from openai_provider;
+    a reply that is still unusable after the retries raises InvalidReplyError.
+    """
+    # --- PROMPT FOR AI ---
+    prompt = build_translation_prompt(word, context)
+
+    async def attempt():
+        reply_dict = await request_json_reply(prompt, 500, "openai.translate", timeout)
+        missing = [key for key in ("translation", "reading", "script") if not reply_dict.get(key)]
+        if missing:
+            raise InvalidReplyError(f"Reply is missing {', '.join(missing)}")
+        reply_dict.setdefault("word", word)
+        if not isinstance(reply_dict.get("usage"), list):
+            reply_dict["usage"] = []
+        return reply_dict
+
+    return await openai_provider.call(attempt)
+
+
+
+def build_batch_translation_prompt(items):
+    words_json = json.dumps(
+        [{"word": word, "context": context} for word, context in items],
+        ensure_ascii=False,
+    )
+    return f"""
+        You are a professional English to Japanese translator for a language-learning app.
+
+        Translate each English word in the list below into Japanese.
+        Use its context if given, otherwise translate the most common meaning.
+
+        Words: {words_json}
+
+        Return ONLY valid JSON in the exact format below, with one entry per word in the same order.
+
+        JSON format:
+        {{
+        "translations": [
+            {{
+            "word": "",
+            "translation": "",
+            "reading": "",
+            "script": "kanji|katakana|hiragana",
+            "usage": [
+                {{
+                "en": "",
+                "ja": ""
+                }}
+            ]
+            }}
+        ]
+        }}
+
+        Rules:
+        - Provide 1–3 usage examples per word
+        - Usage examples must be short and natural
+        - Do NOT include romaji
+        - Do NOT include any text outside JSON
+    """
+
+
+async def ai_translate_eng_words_to_jap(items, timeout: float | None = None):
+    """
+    Translate several (word, context) pairs in one request.
+    Returns the list of translation dicts in the same schema as ai_translate_eng_word_to_jap;
+    raises InvalidReplyError if the reply is still unusable after the retries.
+    """
+    prompt = build_batch_translation_prompt(items)
+
+    async def attempt():
+        reply_dict = await request_json_reply(
+            prompt,
+            400 * len(items),
+            "openai.translate_batch",
+            timeout,
+            response_format={"type": "json_object"},
+        )
+        translations = reply_dict.get("translations")
+        if not isinstance(translations, list):
+            raise InvalidReplyError("Reply has no translations list")
+        return translations
+
+    return await openai_provider.call(attempt)
+
+
 
 async def main():
     parser = argparse.ArgumentParser(description="Translate an English word to Japanese using OpenAI")
@@ -85,7 +274,8 @@ async def main():
     word = args.word
     context = args.context
 
-    ai_translation_response = ai_translate_eng_word_to_jap(word, context)
+    ai_translation_response = await ai_translate_eng_word_to_jap(word, context)
+    await close_openai_client()
 
     # Ensure output directory exists
     output_dir = "output"
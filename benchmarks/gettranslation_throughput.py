@@ -0,0 +1,70 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import httpx
+from .harness import start_app, stop_app, wait_for_app, timed, summarise
+
+
+#/gettranslation throughput at a fixed number of concurrent clients, with DB pool stats
+#sampled during the run. Reads ids 1..--max-id from an already populated database.
+#
+#   DB_POOL_SIZE=20 python -m benchmarks.gettranslation_throughput --clients 50 --duration 20
+
+
+async def client_loop(client, max_id, deadline, samples):
+    while time.perf_counter() < deadline:
+        translation_id = random.randint(1, max_id)
+        samples.append(await timed(client.get("/gettranslation", params={"translation_id": translation_id})))
+
+
+async def sample_pool(client, api_key, deadline, pool_samples):
+    while time.perf_counter() < deadline:
+        response = await client.get("/stats/dbpool", headers={"x-api-key": api_key})
+        pool_samples.append(response.json())
+        await asyncio.sleep(0.5)
+
+
+async def main(args):
+    api_key = os.environ.get("AUTH_KEY", "bench-key")
+    app_process = start_app(args.app_port, {"AUTH_KEY": api_key})
+
+    samples = []
+    pool_samples = []
+    try:
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{args.app_port}",
+            timeout=60,
+            limits=httpx.Limits(max_connections=args.clients + 1),
+        ) as client:
+            await wait_for_app(client)
+            start = time.perf_counter()
+            deadline = start + args.duration
+            await asyncio.gather(
+                sample_pool(client, api_key, deadline, pool_samples),
+                *[client_loop(client, args.max_id, deadline, samples) for _ in range(args.clients)],
+            )
+            elapsed = time.perf_counter() - start
+    finally:
+        stop_app(app_process)
+
+    print(json.dumps({
+        "clients": args.clients,
+        "rps": round(len(samples) / elapsed, 2),
+        "latency": summarise(samples),
+        "pool_peak_checked_out": max((p["checked_out"] for p in pool_samples), default=0),
+        "pool_peak_overflow": max((p["overflow"] for p in pool_samples), default=0),
+        "pool_last": pool_samples[-1] if pool_samples else None,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="/gettranslation throughput with DB pool stats")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds to run")
+    parser.add_argument("--max-id", type=int, default=1000, help="Highest translation id to read")
+    parser.add_argument("--app-port", type=int, default=8001)
+
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,160 @@
+import asyncio
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+from dataclasses import dataclass
+from pathlib import Path
+
+
+#Shared helpers for running the app under load and summarising latencies.
+
+
+def start_app(port: int, env: dict, workers: int = 1) -> subprocess.Popen:
+    """
+    Run main:app under uvicorn in a child process so the benchmark client gets its own event loop.
+    """
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--port", str(port),
+            "--workers", str(workers),
+            "--log-level", "warning",
+        ],
+        env=dict(os.environ, **env),
+    )
+
+
+def stop_app(process: subprocess.Popen):
+    process.terminate()
+    process.wait()
+
+
+@dataclass
+class ThrowawayPostgres:
+    data_dir: Path
+    port: int
+    pg_ctl: str
+
+    @property
+    def env(self) -> dict:
+        #DB_HOST goes straight into the URL, so it can carry the port
+        return {
+            "DB_HOST": f"127.0.0.1:{self.port}",
+            "DB_NAME": "bench",
+            "DB_USERNAME": "bench",
+            "DB_PASSWORD": "bench",
+        }
+
+
+def start_postgres(port: int) -> ThrowawayPostgres:
+    """
+    initdb a new cluster in a temp directory, start it on port and create the bench database.
+    Needs the PostgreSQL server binaries (initdb, pg_ctl) on PATH or in PG_BIN, plus citext and pg_trgm.
+    """
+    bin_dir = os.environ.get("PG_BIN", "")
+
+    def tool(name: str) -> str:
+        return os.path.join(bin_dir, name) if bin_dir else name
+
+    data_dir = Path(tempfile.mkdtemp(prefix="bench-pg-"))
+    #Trust auth: the cluster only listens on localhost and is deleted afterwards
+    subprocess.run(
+        [tool("initdb"), "-D", str(data_dir), "-U", "bench", "--auth=trust", "-E", "UTF8"],
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+    subprocess.run(
+        [
+            tool("pg_ctl"), "-D", str(data_dir), "-w",
+            "-l", str(data_dir / "server.log"),
+            #Durability is irrelevant for a throwaway database
+            "-o", f"-p {port} -k {data_dir} -c listen_addresses=127.0.0.1 -c fsync=off -c synchronous_commit=off",
+            "start",
+        ],
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+    subprocess.run(
+        [tool("createdb"), "-h", "127.0.0.1", "-p", str(port), "-U", "bench", "bench"],
+        check=True,
+    )
+    return ThrowawayPostgres(data_dir=data_dir, port=port, pg_ctl=tool("pg_ctl"))
+
+
+def stop_postgres(postgres: ThrowawayPostgres):
+    subprocess.run(
+        [postgres.pg_ctl, "-D", str(postgres.data_dir), "-m", "immediate", "stop"],
+        stdout=subprocess.DEVNULL,
+    )
+    shutil.rmtree(postgres.data_dir, ignore_errors=True)
+
+
+def prepare_schema(env: dict):
+    """
+    Create the tables, extensions and migrations in the database the env points at.
+    Runs in a child process because data.db reads the DB_* settings at import.
+    """
+    subprocess.run([sys.executable, "-m", "benchmarks.schema"], check=True, env=dict(os.environ, **env))
+
+
+async def scrape_metrics(client: httpx.AsyncClient, api_key: str) -> dict[str, float]:
+    """
+    Read the app's /metrics and sum every series per metric name (labels are dropped).
+    """
+    response = await client.get("/metrics", headers={"x-api-key": api_key})
+    response.raise_for_status()
+    totals = {}
+    for line in response.text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        match = re.match(r"([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{.*\})? (\S+)$", line)
+        if match:
+            totals[match.group(1)] = totals.get(match.group(1), 0.0) + float(match.group(2))
+    return totals
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], check=True, capture_output=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def wait_for_app(client: httpx.AsyncClient):
+    for _ in range(100):
+        try:
+            await client.get("/gettranslation", params={"translation_id": 1})
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("App did not start")
+
+
+async def timed(coro) -> float:
+    start = time.perf_counter()
+    await coro
+    return time.perf_counter() - start
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarise(samples: list[float]) -> dict:
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 2),
+        "p95_ms": round(percentile(samples, 95) * 1000, 2),
+        "p99_ms": round(percentile(samples, 99) * 1000, 2),
+    }
@@ -0,0 +1,316 @@
+import argparse
+import asyncio
+import json
+import random
+import string
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timezone
+import httpx
+from .stubs import create_openai_stub, create_eleven_labs_stub, create_s3_stub, serve
+from .harness import (
+    start_app,
+    stop_app,
+    wait_for_app,
+    start_postgres,
+    stop_postgres,
+    prepare_schema,
+    scrape_metrics,
+    git_commit,
+    summarise,
+)
+
+
+#Mixed-workload load test against local stubs for OpenAI, ElevenLabs and S3 and a throwaway
+#Postgres. Each phase runs for --duration seconds at --concurrency; every phase reports RPS,
+#latency percentiles, DB queries per request and provider calls per request. The JSON report
+#is meant to be kept and compared across commits.
+#
+#   python -m benchmarks.load --concurrency 20 --duration 30 --output reports/load.json
+#
+#Workloads:
+#   read         GET /gettranslation for seeded ids (cache hits after the first read)
+#   cold         POST /translatewordengtojap for a new word (OpenAI, ElevenLabs, S3)
+#   usage_audio  POST /getaudioforusagephrases for a translation whose usages have no audio yet (ElevenLabs, S3);
+#                each id is used once, more are created outside the timed request when the seeded pool runs out
+
+WORKLOADS = ("read", "cold", "usage_audio")
+BUCKET = "bench"
+VOICE_ID = "EXAVITQu4vr4xnSDxMaL"
+
+
+def random_word() -> str:
+    return "".join(random.choices(string.ascii_lowercase, k=12))
+
+
+def parse_mix(value: str) -> dict[str, float]:
+    """
+    "read=8,cold=1,usage_audio=1" -> weights per workload.
+    """
+    weights = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in WORKLOADS:
+            raise argparse.ArgumentTypeError(f"Unknown workload {name}, expected one of {WORKLOADS}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+@dataclass
+class Corpus:
+    #Seeded translations read over and over
+    read_ids: list[int]
+    #Translations whose usages have no audio yet, each handed to one usage_audio request
+    without_usage_audio: list[int]
+    #Translations made during a phase because without_usage_audio ran out; their OpenAI calls are in the phase's numbers
+    created_untimed: int = 0
+
+
+async def pick_read(client, api_key, corpus: Corpus) -> int:
+    return random.choice(corpus.read_ids)
+
+
+async def pick_none(client, api_key, corpus: Corpus) -> None:
+    return None
+
+
+async def pick_without_usage_audio(client, api_key, corpus: Corpus) -> int:
+    """
+    /getaudioforusagephrases reuses stored usage audio whatever the voice, so only a translation
+    it has never seen measures generation and upload.
+    """
+    if corpus.without_usage_audio:
+        return corpus.without_usage_audio.pop()
+    #Background mode only calls OpenAI; the queued word audio never runs (JOB_WORKERS=0)
+    corpus.created_untimed += 1
+    response = await client.post(
+        "/translatewordengtojap",
+        params={"background": "true"},
+        json={"word": random_word(), "context": "", "voice_id": VOICE_ID},
+        headers={"x-api-key": api_key},
+    )
+    response.raise_for_status()
+    return response.json()["translation"]["id"]
+
+
+async def request_read(client, api_key, translation_id):
+    return await client.get("/gettranslation", params={"translation_id": translation_id})
+
+
+async def request_cold(client, api_key, _):
+    return await client.post(
+        "/translatewordengtojap",
+        json={"word": random_word(), "context": "", "voice_id": VOICE_ID},
+        headers={"x-api-key": api_key},
+    )
+
+
+async def request_usage_audio(client, api_key, translation_id):
+    return await client.post(
+        "/getaudioforusagephrases",
+        json={"translation_id": translation_id, "voice_id": VOICE_ID},
+        headers={"x-api-key": api_key},
+    )
+
+
+#Workload -> (untimed pick of what to request, timed request)
+REQUESTS = {
+    "read": (pick_read, request_read),
+    "cold": (pick_none, request_cold),
+    "usage_audio": (pick_without_usage_audio, request_usage_audio),
+}
+
+
+def stub_calls(stubs: dict) -> dict[str, int]:
+    return {name: stub.state.calls for name, stub in stubs.items()}
+
+
+async def seed(client, api_key, count: int, concurrency: int) -> list[int]:
+    semaphore = asyncio.Semaphore(concurrency)
+    translation_ids = []
+
+    async def one():
+        async with semaphore:
+            response = await request_cold(client, api_key, None)
+            if response.status_code == 200:
+                translation_ids.append(response.json()["translation"]["id"])
+
+    await asyncio.gather(*[one() for _ in range(count)])
+    if not translation_ids:
+        raise RuntimeError("Seeding failed, no translations were created")
+    return translation_ids
+
+
+async def run_phase(client, api_key, stubs, corpus: Corpus, weights: dict[str, float], args) -> dict:
+    names = list(weights)
+    samples = {name: [] for name in names}
+    statuses = {name: Counter() for name in names}
+
+    metrics_before = await scrape_metrics(client, api_key)
+    calls_before = stub_calls(stubs)
+    created_before = corpus.created_untimed
+    start = time.perf_counter()
+    deadline = start + args.duration
+
+    async def client_loop():
+        while time.perf_counter() < deadline:
+            name = random.choices(names, weights=[weights[name] for name in names])[0]
+            pick, request = REQUESTS[name]
+            try:
+                target = await pick(client, api_key, corpus)
+            except httpx.HTTPError as e:
+                statuses[name][f"setup_{type(e).__name__}"] += 1
+                continue
+            started = time.perf_counter()
+            try:
+                response = await request(client, api_key, target)
+                status = response.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            samples[name].append(time.perf_counter() - started)
+            statuses[name][str(status)] += 1
+
+    await asyncio.gather(*[client_loop() for _ in range(args.concurrency)])
+    elapsed = time.perf_counter() - start
+    calls_after = stub_calls(stubs)
+    metrics_after = await scrape_metrics(client, api_key)
+
+    every_sample = [sample for name in names for sample in samples[name]]
+    requests = max(1, len(every_sample))
+    db_queries = metrics_after.get("db_queries_total", 0) - metrics_before.get("db_queries_total", 0)
+    return {
+        "requests": len(every_sample),
+        "rps": round(len(every_sample) / elapsed, 2),
+        "latency": summarise(every_sample),
+        "db_queries_per_request": round(db_queries / requests, 3),
+        "untimed_translations_created": corpus.created_untimed - created_before,
+        "external_calls_per_request": {
+            name: round((calls_after[name] - calls_before[name]) / requests, 3) for name in stubs
+        },
+        "workloads": {
+            name: dict(
+                summarise(samples[name]),
+                rps=round(len(samples[name]) / elapsed, 2),
+                status=dict(statuses[name]),
+            )
+            for name in names
+        },
+    }
+
+
+async def main(args):
+    postgres = None
+    db_env = {}
+    if not args.use_env_db:
+        postgres = start_postgres(args.pg_port)
+        db_env = postgres.env
+
+    app_process = None
+    try:
+        prepare_schema(db_env)
+
+        stubs = {
+            "openai": create_openai_stub(args.openai_latency, args.openai_error_rate, args.error_status),
+            "elevenlabs": create_eleven_labs_stub(args.tts_latency, args.tts_error_rate, args.error_status),
+            "s3": create_s3_stub(args.s3_latency, args.s3_error_rate, args.error_status),
+        }
+        ports = {"openai": args.stub_port, "elevenlabs": args.stub_port + 1, "s3": args.stub_port + 2}
+        for name, stub in stubs.items():
+            await serve(stub, ports[name])
+
+        api_key = "bench-key"
+        env = dict(
+            db_env,
+            AUTH_KEY=api_key,
+            OPENAI_API_KEY="stub",
+            OPENAI_BASE_URL=f"http://127.0.0.1:{ports['openai']}/v1",
+            ELEVEN_LABS_KEY="stub",
+            ELEVEN_LABS_BASE_URL=f"http://127.0.0.1:{ports['elevenlabs']}",
+            LINODE_CLUSTER_URL=f"http://127.0.0.1:{ports['s3']}",
+            LINODE_BUCKET=BUCKET,
+            LINODE_BUCKET_ACCESS_KEY="stub",
+            LINODE_BUCKET_SECRET_KEY="stub",
+            #Keep queued jobs out of the request numbers
+            JOB_WORKERS="0",
+            LOG_LEVEL="ERROR",
+        )
+        for setting in args.app_env:
+            key, _, value = setting.partition("=")
+            env[key] = value
+        #One worker, so /metrics (and the DB query count) covers every request
+        app_process = start_app(args.app_port, env, workers=1)
+
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{args.app_port}",
+            timeout=120,
+            limits=httpx.Limits(max_connections=args.concurrency * 2),
+        ) as client:
+            await wait_for_app(client)
+            corpus = Corpus(
+                read_ids=await seed(client, api_key, args.seed, args.concurrency),
+                without_usage_audio=[],
+            )
+            if args.usage_audio_pool and any(phase in ("usage_audio", "mixed") for phase in args.phases.split(",")):
+                corpus.without_usage_audio = await seed(client, api_key, args.usage_audio_pool, args.concurrency)
+
+            phases = {}
+            for phase in args.phases.split(","):
+                weights = args.mix if phase == "mixed" else {phase: 1.0}
+                phases[phase] = await run_phase(client, api_key, stubs, corpus, weights, args)
+    finally:
+        if app_process is not None:
+            stop_app(app_process)
+        if postgres is not None:
+            stop_postgres(postgres)
+
+    report = {
+        "commit": git_commit(),
+        "finished_at": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "seed": args.seed,
+            "usage_audio_pool": args.usage_audio_pool,
+            "mix": args.mix,
+            "openai": {"latency_s": args.openai_latency, "error_rate": args.openai_error_rate},
+            "elevenlabs": {"latency_s": args.tts_latency, "error_rate": args.tts_error_rate},
+            "s3": {"latency_s": args.s3_latency, "error_rate": args.s3_error_rate},
+            "error_status": args.error_status,
+            "app_env": args.app_env,
+        },
+        "phases": phases,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mixed-workload load test against provider stubs")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds per phase")
+    parser.add_argument("--phases", default="read,cold,usage_audio,mixed", help="Comma separated workloads, or mixed")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("read=8,cold=1,usage_audio=1"))
+    parser.add_argument("--seed", type=int, default=50, help="Translations created before measuring")
+    parser.add_argument(
+        "--usage-audio-pool", type=int, default=200,
+        help="Translations created up front for usage_audio; more are made untimed when they run out",
+    )
+    parser.add_argument("--openai-latency", type=float, default=1.0)
+    parser.add_argument("--openai-error-rate", type=float, default=0.0)
+    parser.add_argument("--tts-latency", type=float, default=0.5)
+    parser.add_argument("--tts-error-rate", type=float, default=0.0)
+    parser.add_argument("--s3-latency", type=float, default=0.05)
+    parser.add_argument("--s3-error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500, help="Status of injected provider errors, e.g. 429")
+    parser.add_argument("--app-env", action="append", default=[], help="Extra KEY=VALUE for the app, repeatable")
+    parser.add_argument("--use-env-db", action="store_true", help="Use the DB_* settings instead of a throwaway Postgres")
+    parser.add_argument("--pg-port", type=int, default=55432)
+    parser.add_argument("--stub-port", type=int, default=9100)
+    parser.add_argument("--app-port", type=int, default=8001)
+    parser.add_argument("--output", default=None, help="Also write the JSON report to this file")
+
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,89 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+from sqlalchemy import event
+from sqlalchemy.future import select
+from sqlalchemy.orm import selectinload
+from data.db import SessionLocal, engine
+from data.models import Translation, TranslationUsage, TranslationUsageAudio, TranslationAudio
+from data.db_actions import TranslationWithAudioResponse, fetch_translation_response
+from .harness import summarise
+
+
+#Queries per request and latency of the single-query read path against the
+#previous selectinload implementation, reading random ids 1..--max-id.
+#
+#   python -m benchmarks.read_path --requests 2000 --concurrency 20
+
+
+async def legacy_translation_response(session, translation_id):
+    #The read path before fetch_translation_response: four selects plus ORM hydration
+    stmt = (
+        select(Translation)
+        .where(Translation.id == translation_id)
+        .options(
+            selectinload(Translation.usages)
+            .selectinload(TranslationUsage.usage_audio)
+            .selectinload(TranslationUsageAudio.usage)
+        )
+    )
+    translation = (await session.execute(stmt)).scalar_one_or_none()
+    if not translation:
+        return None
+    audio_stmt = (
+        select(TranslationAudio)
+        .where(TranslationAudio.translation_id == translation.id)
+        .order_by(TranslationAudio.created_at.desc())
+        .limit(1)
+    )
+    audio = (await session.execute(audio_stmt)).scalar_one_or_none()
+    return TranslationWithAudioResponse(translation=translation, audio=audio)
+
+
+async def single_query_translation_response(session, translation_id):
+    return await fetch_translation_response(session, translation_id=translation_id)
+
+
+async def run(fetch, args, query_counter):
+    semaphore = asyncio.Semaphore(args.concurrency)
+    samples = []
+
+    async def one():
+        async with semaphore:
+            translation_id = random.randint(1, args.max_id)
+            start = time.perf_counter()
+            async with SessionLocal() as session:
+                await fetch(session, translation_id)
+            samples.append(time.perf_counter() - start)
+
+    query_counter["count"] = 0
+    await asyncio.gather(*[one() for _ in range(args.requests)])
+    return dict(summarise(samples), queries_per_request=round(query_counter["count"] / args.requests, 2))
+
+
+async def main(args):
+    query_counter = {"count": 0}
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def count_query(*_):
+        query_counter["count"] += 1
+
+    #Warm the pool and statement caches before measuring
+    await run(single_query_translation_response, argparse.Namespace(**dict(vars(args), requests=50)), query_counter)
+
+    legacy = await run(legacy_translation_response, args, query_counter)
+    single = await run(single_query_translation_response, args, query_counter)
+    await engine.dispose()
+
+    print(json.dumps({"selectinload": legacy, "single_query": single}, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Translation read path: selectinload vs single query")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--max-id", type=int, default=1000, help="Highest translation id to read")
+
+    asyncio.run(main(parser.parse_args()))
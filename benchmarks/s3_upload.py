@@ -0,0 +1,83 @@
+import argparse
+import asyncio
+import json
+import time
+import uuid
+import boto3
+from data.s3_storage import S3Storage
+from .stubs import start_s3_stub
+from .harness import percentile
+
+
+#Per-upload latency of the old client-per-upload path against the shared S3Storage backend.
+#Runs against a local moto server unless --endpoint is given.
+#
+#   python -m benchmarks.s3_upload --uploads 200 --concurrency 20
+
+
+async def upload_with_new_client(endpoint, bucket, data, key):
+    #The pre-S3Storage behaviour: build a client and block the event loop on put_object
+    client = boto3.client(
+        "s3",
+        aws_access_key_id="stub",
+        aws_secret_access_key="stub",
+        endpoint_url=endpoint,
+    )
+    client.put_object(Body=data, Bucket=bucket, Key=key, ContentType="audio/mpeg", ACL="public-read")
+
+
+async def run(upload, count, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    samples = []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            await upload(f"bench/{uuid.uuid4()}.mp3")
+            samples.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one() for _ in range(count)])
+    elapsed = time.perf_counter() - start
+    return {
+        "uploads": count,
+        "uploads_per_s": round(count / elapsed, 2),
+        "p50_ms": round(percentile(samples, 50) * 1000, 2),
+        "p99_ms": round(percentile(samples, 99) * 1000, 2),
+    }
+
+
+async def main(args):
+    endpoint = args.endpoint
+    server = None
+    if not endpoint:
+        server = start_s3_stub(args.stub_port, args.bucket)
+        endpoint = f"http://127.0.0.1:{args.stub_port}"
+
+    data = bytes(args.size)
+    storage = S3Storage(bucket=args.bucket, endpoint_url=endpoint, access_key="stub", secret_key="stub")
+    try:
+        before = await run(
+            lambda key: upload_with_new_client(endpoint, args.bucket, data, key),
+            args.uploads,
+            args.concurrency,
+        )
+        after = await run(lambda key: storage.upload(data, key), args.uploads, args.concurrency)
+    finally:
+        storage.close()
+        if server:
+            server.stop()
+
+    print(json.dumps({"payload_bytes": args.size, "client_per_upload": before, "shared_storage": after}, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="S3 upload latency before and after the shared storage backend")
+    parser.add_argument("--uploads", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--size", type=int, default=32_000, help="Payload size in bytes")
+    parser.add_argument("--bucket", default="bench")
+    parser.add_argument("--endpoint", default=None, help="Use an existing S3-compatible endpoint instead of moto")
+    parser.add_argument("--stub-port", type=int, default=9102)
+
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,21 @@
+import asyncio
+from sqlalchemy import text
+from data.db import engine
+from data import db_setup
+
+
+#Prepare an empty database for the benchmarks: the citext extension the models need,
+#then the tables, pg_trgm and the migrations from data.db_setup.
+#
+#   DB_HOST=127.0.0.1:5433 DB_NAME=bench ... python -m benchmarks.schema
+
+
+async def main():
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS citext"))
+    await db_setup.main()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,90 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import httpx
+from sqlalchemy import text
+from data.db import engine, DB_NAME
+from .harness import start_app, stop_app, wait_for_app, timed, summarise
+
+
+#Database transaction rate behind /gettranslation with several workers, comparing the
+#per-process second level (memory) with the shared Redis one. Needs a local redis-server.
+#
+#   python -m benchmarks.shared_cache_db_rate --workers 4 --clients 50 --duration 20
+
+
+async def db_transactions() -> int:
+    async with engine.connect() as conn:
+        result = await conn.execute(
+            text("SELECT xact_commit + xact_rollback FROM pg_stat_database WHERE datname = :name"),
+            {"name": DB_NAME},
+        )
+        return result.scalar_one()
+
+
+async def run_backend(backend, args, api_key):
+    app_process = start_app(args.app_port, {
+        "AUTH_KEY": api_key,
+        "SHARED_CACHE_BACKEND": backend,
+        "REDIS_URL": args.redis_url,
+        #Keep the first level small so the second level is what absorbs the reads
+        "TRANSLATION_CACHE_SIZE": str(args.local_cache_size),
+    }, workers=args.workers)
+
+    samples = []
+    try:
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{args.app_port}",
+            timeout=60,
+            limits=httpx.Limits(max_connections=args.clients),
+        ) as client:
+            await wait_for_app(client)
+            #pg_stat_database is updated asynchronously, give it a moment between snapshots
+            await asyncio.sleep(1)
+            before = await db_transactions()
+            start = time.perf_counter()
+            deadline = start + args.duration
+
+            async def client_loop():
+                while time.perf_counter() < deadline:
+                    translation_id = random.randint(1, args.max_id)
+                    samples.append(await timed(client.get("/gettranslation", params={"translation_id": translation_id})))
+
+            await asyncio.gather(*[client_loop() for _ in range(args.clients)])
+            elapsed = time.perf_counter() - start
+            await asyncio.sleep(1)
+            after = await db_transactions()
+    finally:
+        stop_app(app_process)
+
+    return {
+        "rps": round(len(samples) / elapsed, 2),
+        "db_transactions_per_s": round((after - before) / elapsed, 2),
+        "db_transactions_per_request": round((after - before) / max(1, len(samples)), 4),
+        "latency": summarise(samples),
+    }
+
+
+async def main(args):
+    api_key = os.environ.get("AUTH_KEY", "bench-key")
+    results = {}
+    for backend in ("memory", "redis"):
+        results[backend] = await run_backend(backend, args, api_key)
+    await engine.dispose()
+    print(json.dumps(dict(workers=args.workers, clients=args.clients, **results), indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="DB query rate with and without the shared Redis cache")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--max-id", type=int, default=5000, help="Highest translation id to read")
+    parser.add_argument("--local-cache-size", type=int, default=100)
+    parser.add_argument("--redis-url", default="redis://localhost:6379/0")
+    parser.add_argument("--app-port", type=int, default=8001)
+
+    asyncio.run(main(parser.parse_args()))
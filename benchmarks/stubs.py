@@ -0,0 +1,214 @@
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+import uuid
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+from uvicorn import Config, Server
+
+
+#Local stand-ins for the paid providers so benchmarks never spend tokens.
+#Each stub takes a fixed latency (seconds), an error rate (0.0 - 1.0) and the status the
+#injected errors use. Calls and injected errors are counted on stub.state.calls / .errors.
+
+
+def count_call(stub: FastAPI, error_rate: float) -> bool:
+    """
+    Count a call and decide whether it fails.
+    """
+    stub.state.calls += 1
+    failed = random.random() < error_rate
+    if failed:
+        stub.state.errors += 1
+    return failed
+
+
+def new_stub() -> FastAPI:
+    stub = FastAPI()
+    stub.state.calls = 0
+    stub.state.errors = 0
+    return stub
+
+
+def fake_translation(word: str) -> dict:
+    return {
+        "word": word,
+        "translation": f"訳{word}",
+        "reading": f"やく{word}",
+        "script": "kanji",
+        "usage": [{"en": f"This is a {word}.", "ja": f"これは訳{word}です。"}],
+    }
+
+
+def create_openai_stub(latency: float = 1.0, error_rate: float = 0.0, error_status: int = 500) -> FastAPI:
+    stub = new_stub()
+
+    @stub.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        await asyncio.sleep(latency)
+        if count_call(stub, error_rate):
+            return JSONResponse(status_code=error_status, content={"error": {"message": "stub failure"}})
+
+        prompt = body["messages"][-1]["content"]
+        batch = re.search(r"Words: (\[.*?\])\n", prompt)
+        if batch:
+            reply = {"translations": [fake_translation(item["word"]) for item in json.loads(batch.group(1))]}
+        else:
+            match = re.search(r'English word "([^"]+)"', prompt)
+            reply = fake_translation(match.group(1) if match else "word")
+        return {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": json.dumps(reply, ensure_ascii=False)},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {"prompt_tokens": 200, "completion_tokens": 80, "total_tokens": 280},
+        }
+
+    return stub
+
+
+def create_eleven_labs_stub(
+    latency: float = 1.0,
+    error_rate: float = 0.0,
+    error_status: int = 500,
+    audio_size: int = 32_000,
+) -> FastAPI:
+    stub = new_stub()
+    audio = b"\xff\xf3" + bytes(audio_size - 2)
+
+    @stub.post("/v1/text-to-speech/{voice_id}")
+    async def text_to_speech(voice_id: str, request: Request):
+        await request.json()
+        await asyncio.sleep(latency)
+        if count_call(stub, error_rate):
+            return JSONResponse(status_code=error_status, content={"detail": {"message": "stub failure"}})
+        return Response(content=audio, media_type="audio/mpeg")
+
+    return stub
+
+
+def s3_error(status_code: int, code: str, message: str) -> Response:
+    body = f'<?xml version="1.0" encoding="UTF-8"?><Error><Code>{code}</Code><Message>{message}</Message></Error>'
+    return Response(status_code=status_code, content=body, media_type="application/xml")
+
+
+def create_s3_stub(latency: float = 0.05, error_rate: float = 0.0, error_status: int = 500) -> FastAPI:
+    """
+    In-memory, path-style S3 with the calls S3Storage makes: put_object and the multipart upload
+    calls, plus get_object so uploads can be checked. Point LINODE_CLUSTER_URL at http://127.0.0.1:<port>.
+    """
+    stub = new_stub()
+    objects: dict[str, bytes] = {}
+    uploads: dict[str, dict[int, bytes]] = {}
+
+    async def inject() -> Response | None:
+        await asyncio.sleep(latency)
+        if count_call(stub, error_rate):
+            return s3_error(error_status, "InternalError", "stub failure")
+        return None
+
+    @stub.put("/{bucket}")
+    async def create_bucket(bucket: str):
+        return Response(status_code=200)
+
+    @stub.put("/{bucket}/{key:path}")
+    async def put_object(bucket: str, key: str, request: Request):
+        error = await inject()
+        if error:
+            return error
+        body = await request.body()
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        upload_id = request.query_params.get("uploadId")
+        if upload_id:
+            if upload_id not in uploads:
+                return s3_error(404, "NoSuchUpload", "unknown upload id")
+            uploads[upload_id][int(request.query_params["partNumber"])] = body
+        else:
+            objects[f"{bucket}/{key}"] = body
+        return Response(status_code=200, headers={"ETag": etag})
+
+    @stub.post("/{bucket}/{key:path}")
+    async def multipart(bucket: str, key: str, request: Request):
+        error = await inject()
+        if error:
+            return error
+        if "uploads" in request.query_params:
+            upload_id = uuid.uuid4().hex
+            uploads[upload_id] = {}
+            body = (
+                '<?xml version="1.0" encoding="UTF-8"?><InitiateMultipartUploadResult>'
+                f"<Bucket>{bucket}</Bucket><Key>{key}</Key><UploadId>{upload_id}</UploadId>"
+                "</InitiateMultipartUploadResult>"
+            )
+            return Response(content=body, media_type="application/xml")
+        parts = uploads.pop(request.query_params.get("uploadId"), None)
+        if parts is None:
+            return s3_error(404, "NoSuchUpload", "unknown upload id")
+        data = b"".join(parts[number] for number in sorted(parts))
+        objects[f"{bucket}/{key}"] = data
+        body = (
+            '<?xml version="1.0" encoding="UTF-8"?><CompleteMultipartUploadResult>'
+            f"<Bucket>{bucket}</Bucket><Key>{key}</Key><ETag>\"{hashlib.md5(data).hexdigest()}\"</ETag>"
+            "</CompleteMultipartUploadResult>"
+        )
+        return Response(content=body, media_type="application/xml")
+
+    @stub.delete("/{bucket}/{key:path}")
+    async def abort_or_delete(bucket: str, key: str, request: Request):
+        upload_id = request.query_params.get("uploadId")
+        if upload_id:
+            uploads.pop(upload_id, None)
+        else:
+            objects.pop(f"{bucket}/{key}", None)
+        return Response(status_code=204)
+
+    @stub.get("/{bucket}/{key:path}")
+    async def get_object(bucket: str, key: str):
+        data = objects.get(f"{bucket}/{key}")
+        if data is None:
+            return s3_error(404, "NoSuchKey", "The specified key does not exist.")
+        return Response(content=data, media_type="audio/mpeg")
+
+    return stub
+
+
+def start_s3_stub(port: int, bucket: str):
+    """
+    Start a moto S3 server in a background thread and create the bucket. Needs the moto[server] extra.
+    """
+    import boto3
+    from moto.server import ThreadedMotoServer
+
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=port)
+    server.start()
+    boto3.client(
+        "s3",
+        endpoint_url=f"http://127.0.0.1:{port}",
+        aws_access_key_id="stub",
+        aws_secret_access_key="stub",
+        region_name="us-east-1",
+    ).create_bucket(Bucket=bucket)
+    return server
+
+
+async def serve(app: FastAPI, port: int) -> Server:
+    """
+    Start a stub app on localhost in the current event loop and wait until it accepts connections.
+    """
+    server = Server(Config(app=app, host="127.0.0.1", port=port, log_level="warning", lifespan="off"))
+    asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    return server
+
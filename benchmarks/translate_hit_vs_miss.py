@@ -0,0 +1,102 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import string
+import httpx
+from .stubs import create_openai_stub, create_eleven_labs_stub, create_s3_stub, serve
+from .harness import start_app, stop_app, wait_for_app, timed, summarise
+
+
+#Measures whether /gettranslation reads (cache hits) stall while
+#/translatewordengtojap misses are waiting on the LLM. OpenAI, ElevenLabs and S3 are all stubbed,
+#so misses never reach the real providers. Needs the usual DB_* settings for a throwaway Postgres.
+#
+#   python -m benchmarks.translate_hit_vs_miss --llm-latency 2 --concurrency 50
+
+
+def random_word() -> str:
+    return "".join(random.choices(string.ascii_lowercase, k=12))
+
+
+async def run_hits(client, word, count):
+    return await asyncio.gather(*[
+        timed(client.get("/gettranslation", params={"word": word})) for _ in range(count)
+    ])
+
+
+async def run_misses(client, api_key, count):
+    return await asyncio.gather(*[
+        timed(client.post(
+            "/translatewordengtojap",
+            json={"word": random_word(), "context": ""},
+            headers={"x-api-key": api_key},
+        ))
+        for _ in range(count)
+    ])
+
+
+async def main(args):
+    ports = {"openai": args.stub_port, "elevenlabs": args.stub_port + 1, "s3": args.stub_port + 2}
+    await serve(create_openai_stub(latency=args.llm_latency), ports["openai"])
+    await serve(create_eleven_labs_stub(latency=args.tts_latency), ports["elevenlabs"])
+    await serve(create_s3_stub(), ports["s3"])
+
+    api_key = os.environ.get("AUTH_KEY", "bench-key")
+    app_process = start_app(args.app_port, {
+        "AUTH_KEY": api_key,
+        "OPENAI_API_KEY": "stub",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{ports['openai']}/v1",
+        "ELEVEN_LABS_KEY": "stub",
+        "ELEVEN_LABS_BASE_URL": f"http://127.0.0.1:{ports['elevenlabs']}",
+        "LINODE_CLUSTER_URL": f"http://127.0.0.1:{ports['s3']}",
+        "LINODE_BUCKET": "bench",
+        "LINODE_BUCKET_ACCESS_KEY": "stub",
+        "LINODE_BUCKET_SECRET_KEY": "stub",
+    })
+
+    try:
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{args.app_port}",
+            timeout=60,
+            limits=httpx.Limits(max_connections=args.concurrency * 2),
+        ) as client:
+            await wait_for_app(client)
+
+            #Seed a word so the reads are cache hits
+            seed_word = random_word()
+            await client.post(
+                "/translatewordengtojap",
+                json={"word": seed_word, "context": ""},
+                headers={"x-api-key": api_key},
+            )
+
+            baseline = await run_hits(client, seed_word, args.concurrency)
+
+            #Start the misses, give them time to reach the LLM, then read while they wait
+            misses_task = asyncio.create_task(run_misses(client, api_key, args.misses))
+            await asyncio.sleep(args.llm_latency / 4)
+            under_load = await run_hits(client, seed_word, args.concurrency)
+            misses = await misses_task
+    finally:
+        stop_app(app_process)
+
+    print(json.dumps({
+        "llm_latency_s": args.llm_latency,
+        "hits_idle": summarise(baseline),
+        "hits_during_misses": summarise(under_load),
+        "misses": summarise(misses),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cache-hit latency while LLM misses are in flight")
+    parser.add_argument("--llm-latency", type=float, default=2.0, help="Stub LLM latency in seconds")
+    parser.add_argument("--concurrency", type=int, default=50, help="Concurrent cache-hit reads")
+    parser.add_argument("--misses", type=int, default=10, help="Concurrent translation misses")
+    parser.add_argument("--tts-latency", type=float, default=0.5, help="Stub ElevenLabs latency in seconds")
+    parser.add_argument("--stub-port", type=int, default=9100, help="OpenAI stub; ElevenLabs and S3 use the next two ports")
+    parser.add_argument("--app-port", type=int, default=8001)
+
+    asyncio.run(main(parser.parse_args()))
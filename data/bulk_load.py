@@ -0,0 +1,330 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, fields
+from datetime import datetime
+from itertools import islice
+from typing import Iterator
+from .db import engine
+from .db_actions import naive_utc
+
+#Bulk ingestion of translations: a directory of output/ JSON files (one LLM reply per file) or an
+#NDJSON dump (GET /translations/export, or one reply per line). Records are read in batches,
+#COPY'd into temporary staging tables and merged with set-based statements, so memory depends on
+#--batch-size only, never on the size of the input.
+#
+#   python -m data.bulk_load output/
+#   python -m data.bulk_load dump.ndjson --batch-size 20000
+
+logger = logging.getLogger(__name__)
+
+STAGING_TRANSLATION_COLUMNS = [
+    "src", "word", "translation", "reading", "script", "context",
+    "audio_storage_url", "audio_voice_id", "audio_format", "audio_created_at",
+]
+STAGING_USAGE_COLUMNS = [
+    "src", "ord", "en", "ja",
+    "audio_storage_url", "audio_voice_id", "audio_format", "audio_created_at",
+]
+
+#Emptied at the end of every batch's transaction
+CREATE_STAGING = """
+CREATE TEMP TABLE IF NOT EXISTS staging_translations (
+    src BIGINT PRIMARY KEY,
+    word TEXT NOT NULL,
+    translation TEXT NOT NULL,
+    reading TEXT,
+    script TEXT NOT NULL,
+    context TEXT,
+    audio_storage_url TEXT,
+    audio_voice_id TEXT,
+    audio_format TEXT,
+    audio_created_at TIMESTAMP,
+    translation_id INTEGER,
+    is_new BOOLEAN NOT NULL DEFAULT false
+) ON COMMIT DELETE ROWS;
+CREATE TEMP TABLE IF NOT EXISTS staging_usages (
+    src BIGINT NOT NULL,
+    ord INTEGER NOT NULL,
+    en TEXT NOT NULL,
+    ja TEXT NOT NULL,
+    audio_storage_url TEXT,
+    audio_voice_id TEXT,
+    audio_format TEXT,
+    audio_created_at TIMESTAMP,
+    usage_id INTEGER
+) ON COMMIT DELETE ROWS;
+CREATE INDEX IF NOT EXISTS staging_usages_src ON staging_usages (src);
+"""
+
+#The unique constraint treats NULL readings as distinct, so matching uses IS NOT DISTINCT FROM
+MATCH_TRANSLATION = """
+    t.word = CAST(s.word AS citext)
+    AND t.translation = s.translation
+    AND t.reading IS NOT DISTINCT FROM s.reading
+"""
+
+#Run in order inside each batch's transaction. Ids for new rows come from the tables' own
+#sequences up front, so usages and audio can be linked without reading anything back.
+MERGE_STEPS = [
+    ("existing", """
+UPDATE staging_translations s SET translation_id = t.id
+FROM translations t
+WHERE """ + MATCH_TRANSLATION),
+    #One new row per (word, translation, reading), the first one in the input wins
+    ("allocated", """
+UPDATE staging_translations SET translation_id = nextval(pg_get_serial_sequence('translations', 'id')), is_new = true
+WHERE src IN (
+    SELECT DISTINCT ON (lower(word), translation, reading) src
+    FROM staging_translations
+    WHERE translation_id IS NULL
+    ORDER BY lower(word), translation, reading, src
+)"""),
+    #Rows a concurrent writer inserted first are not new after all, they are matched again below
+    ("translations", """
+WITH inserted AS (
+    INSERT INTO translations (id, word, translation, reading, script, context)
+    SELECT translation_id, word, translation, reading, script, NULLIF(context, '')
+    FROM staging_translations
+    WHERE is_new
+    ON CONFLICT ON CONSTRAINT uq_translation_word_translation_reading DO NOTHING
+    RETURNING id
+)
+UPDATE staging_translations s SET translation_id = NULL, is_new = false
+WHERE s.is_new AND NOT EXISTS (SELECT 1 FROM inserted WHERE inserted.id = s.translation_id)"""),
+    ("duplicates", """
+UPDATE staging_translations s SET translation_id = t.id
+FROM translations t
+WHERE s.translation_id IS NULL AND """ + MATCH_TRANSLATION),
+    #Usages only come with a new translation, as in insert_translation
+    ("allocated_usages", """
+UPDATE staging_usages u SET usage_id = nextval(pg_get_serial_sequence('translation_usages', 'id'))
+FROM staging_translations s
+WHERE s.src = u.src AND s.is_new"""),
+    ("usages", """
+INSERT INTO translation_usages (id, translation_id, en, ja)
+SELECT u.usage_id, s.translation_id, u.en, u.ja
+FROM staging_usages u
+JOIN staging_translations s ON s.src = u.src
+WHERE s.is_new
+ORDER BY u.usage_id"""),
+    #Audio for usages of translations that already existed attaches to the matching stored usage
+    ("existing_usages", """
+UPDATE staging_usages u SET usage_id = tu.id
+FROM staging_translations s, translation_usages tu
+WHERE u.usage_id IS NULL
+    AND u.audio_storage_url IS NOT NULL
+    AND s.src = u.src
+    AND tu.translation_id = s.translation_id
+    AND tu.en = u.en
+    AND tu.ja = u.ja"""),
+    ("word_audio", """
+INSERT INTO translation_audio (translation_id, storage_url, voice_id, audio_format, created_at)
+SELECT DISTINCT ON (s.translation_id, s.audio_storage_url)
+    s.translation_id, s.audio_storage_url, s.audio_voice_id, COALESCE(s.audio_format, 'mp3'),
+    COALESCE(s.audio_created_at, now())
+FROM staging_translations s
+WHERE s.audio_storage_url IS NOT NULL
+    AND NOT EXISTS (
+        SELECT 1 FROM translation_audio ta
+        WHERE ta.translation_id = s.translation_id AND ta.storage_url = s.audio_storage_url
+    )
+ORDER BY s.translation_id, s.audio_storage_url, s.src"""),
+    ("usage_audio", """
+INSERT INTO translation_usage_audio (usage_id, storage_url, voice_id, audio_format, created_at)
+SELECT DISTINCT ON (u.usage_id)
+    u.usage_id, u.audio_storage_url, u.audio_voice_id, COALESCE(u.audio_format, 'mp3'),
+    COALESCE(u.audio_created_at, now())
+FROM staging_usages u
+WHERE u.usage_id IS NOT NULL AND u.audio_storage_url IS NOT NULL
+ORDER BY u.usage_id, u.src, u.ord
+ON CONFLICT (usage_id) DO NOTHING"""),
+    #Existing translations that gained audio show up in the incremental export
+    ("touched", """
+UPDATE translations t SET updated_at = now()
+FROM staging_translations s
+WHERE t.id = s.translation_id
+    AND NOT s.is_new
+    AND (s.audio_storage_url IS NOT NULL OR EXISTS (
+        SELECT 1 FROM staging_usages u WHERE u.src = s.src AND u.audio_storage_url IS NOT NULL
+    ))"""),
+]
+
+#Steps whose row counts are reported; new translations are counted from the staging table
+REPORTED_STEPS = ("usages", "word_audio", "usage_audio")
+COUNT_NEW_TRANSLATIONS = "SELECT count(*) FROM staging_translations WHERE is_new"
+
+
+@dataclass
+class LoadStats:
+    records: int = 0
+    skipped: int = 0
+    translations: int = 0
+    usages: int = 0
+    word_audio: int = 0
+    usage_audio: int = 0
+
+    def as_dict(self) -> dict:
+        return {f.name: getattr(self, f.name) for f in fields(self)}
+
+
+def iter_documents(path: str) -> Iterator[dict]:
+    """
+    Yield the JSON documents of a directory of .json files or an NDJSON file, one at a time.
+    """
+    if os.path.isdir(path):
+        #scandir streams the directory instead of listing it up front
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if not entry.is_file() or not entry.name.endswith(".json"):
+                    continue
+                with open(entry.path, "r", encoding="utf-8") as f:
+                    try:
+                        yield json.load(f)
+                    except json.JSONDecodeError as e:
+                        logger.warning("skipping invalid JSON file", extra={"file": entry.path, "error": str(e)})
+                        yield {}
+        return
+
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.warning("skipping invalid NDJSON line", extra={"line": number, "error": str(e)})
+                yield {}
+
+
+def parse_timestamp(value) -> datetime | None:
+    if not value:
+        return None
+    try:
+        return naive_utc(datetime.fromisoformat(str(value).replace("Z", "+00:00")))
+    except ValueError:
+        return None
+
+
+def audio_columns(audio: dict | None) -> tuple:
+    if not isinstance(audio, dict) or not audio.get("storage_url"):
+        return None, None, None, None
+    return audio["storage_url"], audio.get("voice_id"), audio.get("audio_format"), parse_timestamp(audio.get("created_at"))
+
+
+def normalize_document(document: dict) -> tuple[tuple, list[tuple]] | None:
+    """
+    (translation columns, usage columns) without src, for either input shape: an LLM reply
+    ({word, translation, reading, script, usage: [{en, ja}]}) or an export line
+    ({translation: {..., usages: [{en, ja, usage_audio}]}, audio}). None when it is not usable.
+    """
+    if not isinstance(document, dict):
+        return None
+    if isinstance(document.get("translation"), dict):
+        translation, audio = document["translation"], document.get("audio")
+        usages = translation.get("usages") or []
+    else:
+        translation, audio = document, None
+        usages = document.get("usage") or document.get("usages") or []
+
+    word = str(translation.get("word") or "").strip()
+    if not word or not translation.get("translation") or not translation.get("script"):
+        return None
+    row = (
+        word,
+        str(translation["translation"]),
+        translation.get("reading"),
+        str(translation["script"]),
+        str(translation.get("context") or document.get("context") or "") or None,
+        *audio_columns(audio),
+    )
+    usage_rows = [
+        (str(usage["en"]), str(usage["ja"]), *audio_columns(usage.get("usage_audio")))
+        for usage in usages
+        if isinstance(usage, dict) and usage.get("en") and usage.get("ja")
+    ]
+    return row, usage_rows
+
+
+def affected_rows(status: str) -> int:
+    """
+    Row count from a command tag such as "INSERT 0 42" or "UPDATE 7".
+    """
+    try:
+        return int(status.rsplit(" ", 1)[-1])
+    except ValueError:
+        return 0
+
+
+async def load_batch(connection, documents: list[dict], first_src: int, stats: LoadStats):
+    translation_rows = []
+    usage_rows = []
+    for offset, document in enumerate(documents):
+        normalized = normalize_document(document)
+        if normalized is None:
+            stats.skipped += 1
+            continue
+        row, usages = normalized
+        src = first_src + offset
+        translation_rows.append((src, *row))
+        usage_rows.extend((src, position, *usage) for position, usage in enumerate(usages))
+    stats.records += len(documents)
+    if not translation_rows:
+        return
+
+    async with connection.transaction():
+        await connection.copy_records_to_table(
+            "staging_translations", records=translation_rows, columns=STAGING_TRANSLATION_COLUMNS,
+        )
+        if usage_rows:
+            await connection.copy_records_to_table(
+                "staging_usages", records=usage_rows, columns=STAGING_USAGE_COLUMNS,
+            )
+        for name, statement in MERGE_STEPS:
+            status = await connection.execute(statement)
+            if name in REPORTED_STEPS:
+                setattr(stats, name, getattr(stats, name) + affected_rows(status))
+        stats.translations += await connection.fetchval(COUNT_NEW_TRANSLATIONS)
+
+
+async def bulk_load(path: str, batch_size: int = 10000) -> LoadStats:
+    """
+    Load every translation in path, batch_size records per COPY and merge transaction.
+    Records already stored are matched, not duplicated, so a load can be repeated or resumed.
+    """
+    stats = LoadStats()
+    started = time.monotonic()
+    documents = iter_documents(path)
+    async with engine.connect() as conn:
+        raw = await conn.get_raw_connection()
+        connection = raw.driver_connection
+        await connection.execute(CREATE_STAGING)
+        while True:
+            batch = list(islice(documents, batch_size))
+            if not batch:
+                break
+            await load_batch(connection, batch, stats.records, stats)
+            elapsed = time.monotonic() - started
+            print(
+                f"{stats.records} records ({stats.records / elapsed:.0f}/s): {stats.translations} translations, "
+                f"{stats.usages} usages, {stats.word_audio + stats.usage_audio} audio links, {stats.skipped} skipped",
+                flush=True,
+            )
+    return stats
+
+
+async def main(args):
+    stats = await bulk_load(args.path, args.batch_size)
+    await engine.dispose()
+    print(json.dumps(stats.as_dict(), indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk load translations with COPY and set-based merges")
+    parser.add_argument("path", help="Directory of .json files (e.g. output/) or an NDJSON file")
+    parser.add_argument("--batch-size", type=int, default=10000, help="Records per COPY and merge transaction")
+
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,394 @@
+import argparse
+import asyncio
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+import dotenv
+from pathlib import Path
+from sqlalchemy import text
+from .db import SessionLocal, engine
+from .cache import normalize_word
+from .db_actions import stream_translation_payloads_with_etags
+
+# #LOAD ENVIRONMENT
+dotenv_file = ".env"
+if os.path.isfile(dotenv_file):
+    dotenv.load_dotenv(dotenv_file)
+
+#BUNDLE PARAMS
+VOCAB_BUNDLE_PATH = os.environ.get("VOCAB_BUNDLE_PATH")
+#How often (seconds) a worker checks whether the bundle file was replaced
+VOCAB_BUNDLE_CHECK_INTERVAL = float(os.environ.get("VOCAB_BUNDLE_CHECK_INTERVAL", "5"))
+#Each check also asks the database for translations changed since the last one, going back this many seconds
+#further so a transaction that committed late (updated_at is its start time) is not missed
+VOCAB_BUNDLE_SYNC_OVERLAP = float(os.environ.get("VOCAB_BUNDLE_SYNC_OVERLAP", "60"))
+
+#File layout, all integers little endian:
+#   header  MAGIC, entry count, keys region offset, payload region offset, build start (database clock, unix time)
+#   index   one fixed-size record per key, sorted by key bytes:
+#           key offset, key length, payload offset, payload length, etag offset, etag length
+#   keys    the key bytes back to back
+#   payload the ETag and serialized TranslationWithAudioResponse JSON, once per translation
+#Keys are "w:<normalized word>", "i:<translation id>" and "u:<usage id>", all pointing at the same payload.
+MAGIC = b"JTVOCAB3"
+HEADER = struct.Struct("<8sIQQd")
+RECORD = struct.Struct("<QIQIQI")
+
+#Timestamps are UTC without time zone, so they are compared as UTC epochs
+DATABASE_NOW = text("SELECT extract(epoch FROM now())::float8")
+CHANGED_SINCE = text("""
+SELECT id, extract(epoch FROM updated_at AT TIME ZONE 'UTC')::float8 AS changed_at
+FROM translations
+WHERE updated_at > to_timestamp(:since) AT TIME ZONE 'UTC'
+""")
+
+logger = logging.getLogger(__name__)
+
+
+def word_key(word: str) -> bytes:
+    return b"w:" + normalize_word(word).encode()
+
+
+def id_key(translation_id: int) -> bytes:
+    return b"i:" + str(translation_id).encode()
+
+
+def usage_key(usage_id: int) -> bytes:
+    return b"u:" + str(usage_id).encode()
+
+
+def payload_keys(payload: bytes) -> list[bytes]:
+    translation = json.loads(payload)["translation"]
+    return [
+        id_key(translation["id"]),
+        word_key(translation["word"]),
+        *[usage_key(usage["id"]) for usage in translation["usages"]],
+    ]
+
+
+def write_bundle(path: Path, payloads: list[tuple[bytes, bytes]], built_at: float | None = None):
+    """
+    Write the (payload, etag) pairs to a new bundle file and atomically move it over path.
+    built_at is when the payloads were read (default now); writes after it override the bundle.
+    """
+    keyed = {}
+    blob = bytearray()
+    for payload, etag in payloads:
+        response = json.loads(payload)
+        location = (len(blob), len(payload), len(blob) + len(payload), len(etag))
+        blob.extend(payload)
+        blob.extend(etag)
+        keyed[id_key(response["translation"]["id"])] = location
+        #With several senses for one word, the first (lowest id) wins, as in the DB lookup
+        keyed.setdefault(word_key(response["translation"]["word"]), location)
+        #Writes to a usage are invalidated by usage id only, these keys find the translation to override
+        for usage in response["translation"]["usages"]:
+            keyed[usage_key(usage["id"])] = location
+
+    keys = sorted(keyed)
+    keys_offset = HEADER.size + RECORD.size * len(keys)
+    key_bytes = bytearray()
+    records = bytearray()
+    for key in keys:
+        payload_offset, payload_length, etag_offset, etag_length = keyed[key]
+        records.extend(RECORD.pack(
+            keys_offset + len(key_bytes), len(key),
+            payload_offset, payload_length,
+            etag_offset, etag_length,
+        ))
+        key_bytes.extend(key)
+    payload_region = keys_offset + len(key_bytes)
+
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(keys), keys_offset, payload_region, built_at or time.time()))
+        f.write(records)
+        f.write(key_bytes)
+        #Payload offsets are relative to the payload region
+        f.write(blob)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class VocabBundle:
+    """
+    Read-only view of a bundle file through mmap. Every worker maps the same file,
+    so the pages are shared through the OS page cache.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self.identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self._keys_offset, self._payload_offset, self.built_at = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError(f"Not a vocabulary bundle: {path}")
+
+    def _record(self, index: int) -> tuple[int, int, int, int, int, int]:
+        return RECORD.unpack_from(self._map, HEADER.size + RECORD.size * index)
+
+    def _lookup(self, key: bytes) -> tuple[bytes, str | None] | None:
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            key_offset, key_length, payload_offset, payload_length, etag_offset, etag_length = self._record(middle)
+            candidate = self._map[key_offset:key_offset + key_length]
+            if candidate == key:
+                start = self._payload_offset + payload_offset
+                etag_start = self._payload_offset + etag_offset
+                etag = self._map[etag_start:etag_start + etag_length].decode() or None
+                return self._map[start:start + payload_length], etag
+            if candidate < key:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def get_by_word(self, word: str) -> tuple[bytes, str | None] | None:
+        return self._lookup(word_key(word))
+
+    def get_by_id(self, translation_id: int) -> tuple[bytes, str | None] | None:
+        return self._lookup(id_key(translation_id))
+
+    def get_by_usage(self, usage_id: int) -> tuple[bytes, str | None] | None:
+        return self._lookup(usage_key(usage_id))
+
+    def close(self):
+        self._map.close()
+
+
+class BundleHolder:
+    """
+    Holds the current bundle and swaps in a new one when the file at path is replaced,
+    checking at most every check_interval seconds. A missing or invalid file disables it.
+
+    Translations written after the bundle was built are overridden: invalidate() records their
+    keys and get() leaves them to the caches and the database until a newer bundle is loaded.
+    Invalidations only reach this process, so sync() also reads the translations changed in the
+    database since the bundle was built; a newly loaded bundle is not served until it has run once.
+    """
+
+    def __init__(
+        self,
+        path: str | None = VOCAB_BUNDLE_PATH,
+        check_interval: float = VOCAB_BUNDLE_CHECK_INTERVAL,
+        sync_overlap: float = VOCAB_BUNDLE_SYNC_OVERLAP,
+    ):
+        self.path = Path(path) if path else None
+        self.check_interval = check_interval
+        self.sync_overlap = sync_overlap
+        self.bundle: VocabBundle | None = None
+        self._checked_at = 0.0
+        #Bundle key -> when it was overridden; only keys present in the bundle are kept, so this stays bounded
+        self._overridden: dict[bytes, float] = {}
+        #Database time up to which changes were applied to the current bundle, None until the first sync
+        self._synced_to: float | None = None
+        self._syncer: asyncio.Task | None = None
+        self.hits = 0
+        self.misses = 0
+        self.overridden_hits = 0
+        self.unsynced_misses = 0
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self.path is None or now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._swap(None)
+            return
+        if self.bundle and self.bundle.identity == (stat.st_ino, stat.st_mtime_ns, stat.st_size):
+            return
+        try:
+            self._swap(VocabBundle(self.path))
+        except (OSError, ValueError, struct.error) as e:
+            logger.error("vocabulary bundle not loaded", extra={"path": str(self.path), "error": str(e)})
+            self._swap(None)
+
+    def _swap(self, bundle: VocabBundle | None):
+        old, self.bundle = self.bundle, bundle
+        if old is not None:
+            old.close()
+        self._synced_to = None
+        #A bundle built after a write already has its result
+        if bundle is not None:
+            self._overridden = {key: at for key, at in self._overridden.items() if at >= bundle.built_at}
+
+    def load(self):
+        self._checked_at = 0.0
+        self._refresh()
+
+    def get(self, translation_id: int | None = None, word: str | None = None) -> tuple[bytes, str | None] | None:
+        """
+        Return (payload, etag) for the translation, or None when it is not bundled.
+        """
+        self._refresh()
+        if self.bundle is None:
+            return None
+        if self._synced_to is None:
+            #Not checked against the database yet, it may hold entries changed since the build
+            self.unsynced_misses += 1
+            return None
+        payload = None
+        if translation_id and id_key(translation_id) not in self._overridden:
+            payload = self.bundle.get_by_id(translation_id)
+        if payload is None and word and word_key(word) not in self._overridden:
+            payload = self.bundle.get_by_word(word)
+        if payload is None:
+            self.misses += 1
+        elif self._overridden and any(key in self._overridden for key in payload_keys(payload[0])):
+            #Found through a key that was not overridden itself, e.g. the word of a changed translation id
+            self.overridden_hits += 1
+            return None
+        else:
+            self.hits += 1
+        return payload
+
+    def invalidate(self, translation_id: int | None = None, word: str | None = None, usage_id: int | None = None):
+        """
+        A write changed the translation: stop serving every key of its bundled entry.
+        """
+        bundle = self.bundle
+        if bundle is None:
+            return
+        found = [
+            bundle.get_by_id(translation_id) if translation_id is not None else None,
+            bundle.get_by_word(word) if word is not None else None,
+            bundle.get_by_usage(usage_id) if usage_id is not None else None,
+        ]
+        now = time.time()
+        for item in found:
+            if item is not None:
+                for key in payload_keys(item[0]):
+                    self._overridden[key] = now
+
+    def apply_changes(self, bundle: VocabBundle, changes: list[tuple[int, float]], synced_to: float):
+        """
+        Override the bundled entries of the translations (id, changed at) changed in the database.
+        Ignored when the bundle was replaced while the changes were read.
+        """
+        if bundle is not self.bundle:
+            return
+        for translation_id, changed_at in changes:
+            item = bundle.get_by_id(translation_id)
+            if item is not None:
+                for key in payload_keys(item[0]):
+                    self._overridden[key] = max(changed_at, self._overridden.get(key, changed_at))
+        self._synced_to = synced_to
+
+    async def sync(self):
+        """
+        Read the translations changed since the last sync (or the build) and override them.
+        """
+        self._refresh()
+        bundle = self.bundle
+        if bundle is None:
+            return
+        since = (self._synced_to if self._synced_to is not None else bundle.built_at) - self.sync_overlap
+        async with SessionLocal() as session:
+            synced_to = (await session.execute(DATABASE_NOW)).scalar_one()
+            changes = (await session.execute(CHANGED_SINCE, {"since": since})).all()
+        self.apply_changes(bundle, [(row.id, row.changed_at) for row in changes], synced_to)
+
+    async def _sync_forever(self):
+        while True:
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.warning("vocabulary bundle sync failed", extra={"error": repr(e)})
+            await asyncio.sleep(self.check_interval)
+
+    def start(self):
+        if self.path is not None and self._syncer is None:
+            self._syncer = asyncio.create_task(self._sync_forever())
+
+    async def stop(self):
+        if self._syncer is not None:
+            self._syncer.cancel()
+            await asyncio.gather(self._syncer, return_exceptions=True)
+            self._syncer = None
+
+    def close(self):
+        self._swap(None)
+
+    def get_stats(self) -> dict:
+        return {
+            "path": str(self.path) if self.path else None,
+            "loaded": self.bundle is not None,
+            "entries": self.bundle.count if self.bundle else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "overridden": len(self._overridden),
+            "overridden_hits": self.overridden_hits,
+            "synced": self._synced_to is not None,
+            "unsynced_misses": self.unsynced_misses,
+        }
+
+
+def is_complete(payload: bytes) -> bool:
+    """
+    Only translations with word audio and audio on every usage are bundled; those rarely change again.
+    """
+    response = json.loads(payload)
+    usages = response["translation"]["usages"]
+    return response["audio"] is not None and all(usage["usage_audio"] for usage in usages)
+
+
+async def build(output: Path, top: int, words_file: Path | None, include_incomplete: bool):
+    wanted = None
+    if words_file:
+        wanted = []
+        with open(words_file, "r", encoding="utf-8") as f:
+            for line in f:
+                #Frequency lists are often "word<TAB>count", keep the first column
+                word = line.strip().split("\t")[0].split(",")[0]
+                if word:
+                    wanted.append(normalize_word(word))
+                if len(wanted) >= top:
+                    break
+        wanted = set(wanted)
+
+    payloads = []
+    async with SessionLocal() as session:
+        #The database's clock, the one sync() compares updated_at with
+        built_at = (await session.execute(DATABASE_NOW)).scalar_one()
+        async for payload, etag in stream_translation_payloads_with_etags(session):
+            data = payload.encode()
+            if wanted is not None and normalize_word(json.loads(data)["translation"]["word"]) not in wanted:
+                continue
+            if not include_incomplete and not is_complete(data):
+                continue
+            payloads.append((data, etag.encode()))
+            if wanted is None and len(payloads) >= top:
+                break
+    await engine.dispose()
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    write_bundle(output, payloads, built_at)
+    print(f"✅ Bundled {len(payloads)} translations into {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a memory-mapped vocabulary bundle for /gettranslation")
+    parser.add_argument("--output", required=True, help="Bundle file to write, e.g. bundles/vocab.bundle")
+    parser.add_argument("--top", type=int, default=5000, help="Number of words to include")
+    parser.add_argument("--words-file", default=None, help="Frequency list, most common first; defaults to the lowest ids")
+    parser.add_argument("--include-incomplete", action="store_true", help="Also bundle translations still missing audio")
+
+    args = parser.parse_args()
+
+    asyncio.run(build(
+        Path(args.output),
+        args.top,
+        Path(args.words_file) if args.words_file else None,
+        args.include_incomplete,
+    ))
@@ -0,0 +1,581 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import struct
+import time
+import uuid
+import dotenv
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+# #LOAD ENVIRONMENT
+dotenv_file = ".env"
+if os.path.isfile(dotenv_file):
+    dotenv.load_dotenv(dotenv_file)
+
+#CACHE PARAMS
+TRANSLATION_CACHE_SIZE = int(os.environ.get("TRANSLATION_CACHE_SIZE", "5000"))
+TRANSLATION_CACHE_TTL = float(os.environ.get("TRANSLATION_CACHE_TTL", "300"))
+REDIS_URL = os.environ.get("REDIS_URL")
+#Second level shared by all workers: "redis", "memory" (this process only, for development) or "none".
+#Without REDIS_URL there is nothing to share, so the default is no second level at all.
+SHARED_CACHE_BACKEND = os.environ.get("SHARED_CACHE_BACKEND", "redis" if REDIS_URL else "none").lower()
+SHARED_CACHE_TTL = float(os.environ.get("SHARED_CACHE_TTL", "3600"))
+#Higher values refresh earlier before expiry, 1.0 is the usual XFetch setting
+SHARED_CACHE_BETA = float(os.environ.get("SHARED_CACHE_BETA", "1.0"))
+#Keys the memory backend keeps (each translation takes one per id, word and usage)
+SHARED_CACHE_MEMORY_SIZE = int(os.environ.get("SHARED_CACHE_MEMORY_SIZE", "20000"))
+INVALIDATION_CHANNEL = "translation-cache-invalidate"
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_word(word: str) -> str:
+    return word.strip().lower()
+
+
+@dataclass
+class CacheEntry:
+    translation_id: int
+    word: str
+    payload: bytes
+    expires_at: float
+    usage_ids: tuple[int, ...] = ()
+    etag: str | None = None
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    invalidations: int = 0
+    stale_fills: int = 0
+
+
+@dataclass
+class TranslationCache:
+    """
+    In-process LRU cache of serialized /gettranslation responses with a TTL.
+    Entries are stored once per translation id; the word index and the usage index
+    point back at the same entry so either key finds it and either write path can drop it.
+    A word can have several senses, so only the one a lookup by word returns (the oldest) is indexed
+    by word: set() with index_word=False, e.g. after a lookup by id, leaves the word index alone.
+
+    Every invalidation stamps its keys with a new generation. A reader takes fill_token() before
+    going to the database and checks changed_since() before caching what it read, so an
+    invalidation that lands in between is not undone by the stale result.
+    """
+    max_size: int = TRANSLATION_CACHE_SIZE
+    ttl: float = TRANSLATION_CACHE_TTL
+    #Past this many stamped keys the stamps are dropped and fills already in flight are refused
+    max_stamps: int = 10000
+    stats: CacheStats = field(default_factory=CacheStats)
+    _entries: "OrderedDict[int, CacheEntry]" = field(default_factory=OrderedDict)
+    _by_word: dict[str, int] = field(default_factory=dict)
+    _by_usage: dict[int, int] = field(default_factory=dict)
+    _generation: int = 0
+    _stamps: dict[str, int] = field(default_factory=dict)
+    _oldest_valid_token: int = 0
+    #Called with the same keys on every invalidation, e.g. to override the vocabulary bundle
+    _listeners: list[Callable[..., None]] = field(default_factory=list)
+
+    def _get(self, translation_id: int | None) -> CacheEntry | None:
+        entry = self._entries.get(translation_id) if translation_id is not None else None
+        if entry is None:
+            self.stats.misses += 1
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._remove(translation_id)
+            self.stats.expirations += 1
+            self.stats.misses += 1
+            return None
+        self._entries.move_to_end(translation_id)
+        self.stats.hits += 1
+        return entry
+
+    def get_entry_by_id(self, translation_id: int) -> CacheEntry | None:
+        return self._get(translation_id)
+
+    def get_entry_by_word(self, word: str) -> CacheEntry | None:
+        return self._get(self._by_word.get(normalize_word(word)))
+
+    def get_by_id(self, translation_id: int) -> bytes | None:
+        entry = self.get_entry_by_id(translation_id)
+        return entry.payload if entry else None
+
+    def get_by_word(self, word: str) -> bytes | None:
+        entry = self.get_entry_by_word(word)
+        return entry.payload if entry else None
+
+    def set(
+        self,
+        translation_id: int,
+        word: str,
+        payload: bytes,
+        usage_ids: tuple[int, ...] = (),
+        etag: str | None = None,
+        index_word: bool = True,
+    ):
+        if self.max_size <= 0:
+            return
+        #Refilling the word's own sense by id keeps it reachable by word
+        index_word = index_word or self._by_word.get(normalize_word(word)) == translation_id
+        if translation_id in self._entries:
+            self._remove(translation_id)
+        entry = CacheEntry(
+            translation_id=translation_id,
+            word=normalize_word(word),
+            payload=payload,
+            expires_at=time.monotonic() + self.ttl,
+            usage_ids=tuple(usage_ids),
+            etag=etag,
+        )
+        self._entries[translation_id] = entry
+        if index_word:
+            self._by_word[entry.word] = translation_id
+        for usage_id in entry.usage_ids:
+            self._by_usage[usage_id] = translation_id
+
+        while len(self._entries) > self.max_size:
+            oldest_id = next(iter(self._entries))
+            self._remove(oldest_id)
+            self.stats.evictions += 1
+
+    def _remove(self, translation_id: int):
+        entry = self._entries.pop(translation_id, None)
+        if entry is None:
+            return
+        if self._by_word.get(entry.word) == translation_id:
+            del self._by_word[entry.word]
+        for usage_id in entry.usage_ids:
+            if self._by_usage.get(usage_id) == translation_id:
+                del self._by_usage[usage_id]
+
+    @staticmethod
+    def _keys(translation_id: int | None, word: str | None, usage_ids: tuple[int, ...] = ()) -> list[str]:
+        keys = [f"usage:{usage_id}" for usage_id in usage_ids]
+        if translation_id is not None:
+            keys.append(f"id:{translation_id}")
+        if word is not None:
+            keys.append(f"word:{normalize_word(word)}")
+        return keys
+
+    def fill_token(self) -> int:
+        """
+        Take before reading a translation from the database; see changed_since.
+        """
+        return self._generation
+
+    def changed_since(self, token: int, translation_id: int, word: str, usage_ids: tuple[int, ...] = ()) -> bool:
+        """
+        True when the translation was invalidated after fill_token() returned token, i.e. what was read
+        may already be stale and must not be cached.
+        """
+        if token < self._oldest_valid_token:
+            return True
+        return any(self._stamps.get(key, -1) >= token for key in self._keys(translation_id, word, usage_ids))
+
+    def _stamp(self, keys: list[str]):
+        if len(self._stamps) + len(keys) > self.max_stamps:
+            self._stamps.clear()
+            self._oldest_valid_token = self._generation + 1
+        for key in keys:
+            self._stamps[key] = self._generation
+        self._generation += 1
+
+    def invalidate(
+        self,
+        translation_id: int | None = None,
+        word: str | None = None,
+        usage_id: int | None = None,
+    ):
+        """
+        Drop the entry reachable through any of the given keys.
+        """
+        targets = set()
+        if translation_id is not None:
+            targets.add(translation_id)
+        if word is not None and normalize_word(word) in self._by_word:
+            targets.add(self._by_word[normalize_word(word)])
+        if usage_id is not None and usage_id in self._by_usage:
+            targets.add(self._by_usage[usage_id])
+
+        keys = self._keys(translation_id, word, (usage_id,) if usage_id is not None else ())
+        for target in targets:
+            entry = self._entries.get(target)
+            if entry is not None:
+                keys.extend(self._keys(entry.translation_id, entry.word))
+                self._remove(target)
+                self.stats.invalidations += 1
+        self._stamp(keys)
+        for listener in self._listeners:
+            listener(translation_id=translation_id, word=word, usage_id=usage_id)
+
+    def add_listener(self, listener: Callable[..., None]):
+        self._listeners.append(listener)
+
+    def clear(self):
+        self._entries.clear()
+        self._by_word.clear()
+        self._by_usage.clear()
+        self._stamps.clear()
+        self._generation += 1
+        self._oldest_valid_token = self._generation
+
+    def get_stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.stats.hits,
+            "misses": self.stats.misses,
+            "evictions": self.stats.evictions,
+            "expirations": self.stats.expirations,
+            "invalidations": self.stats.invalidations,
+            "stale_fills": self.stats.stale_fills,
+        }
+
+
+class CacheBackend:
+    """
+    Interface for the shared second-level cache: byte values with a TTL, plus a pub/sub channel
+    used to tell every worker to drop its first-level entries.
+    """
+    #Longest TTL worth using; a backend whose invalidations cannot reach other workers caps it
+    max_ttl: float | None = None
+
+    async def get(self, key: str) -> bytes | None:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        raise NotImplementedError
+
+    async def delete(self, *keys: str):
+        raise NotImplementedError
+
+    async def publish(self, channel: str, message: bytes):
+        raise NotImplementedError
+
+    async def subscribe(self, channel: str, callback: Callable[[bytes], Awaitable[None]]):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class NullCacheBackend(CacheBackend):
+    """
+    No second level: every read misses and writes are dropped.
+    """
+
+    async def get(self, key: str) -> bytes | None:
+        return None
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        pass
+
+    async def delete(self, *keys: str):
+        pass
+
+    async def publish(self, channel: str, message: bytes):
+        pass
+
+    async def subscribe(self, channel: str, callback: Callable[[bytes], Awaitable[None]]):
+        pass
+
+
+class InMemoryCacheBackend(CacheBackend):
+    """
+    Single-process LRU backend, for development and tests. Pub/sub only reaches this process, so
+    another worker's write is not seen here: entries live no longer than the first level's TTL.
+    """
+
+    def __init__(self, max_size: int = SHARED_CACHE_MEMORY_SIZE, max_ttl: float = TRANSLATION_CACHE_TTL):
+        self.max_size = max_size
+        self.max_ttl = max_ttl
+        self._values: "OrderedDict[str, tuple[bytes, float]]" = OrderedDict()
+        self._subscribers: dict[str, list[Callable[[bytes], Awaitable[None]]]] = {}
+
+    async def get(self, key: str) -> bytes | None:
+        item = self._values.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at <= time.monotonic():
+            del self._values[key]
+            return None
+        self._values.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        self._values.pop(key, None)
+        self._values[key] = (value, time.monotonic() + min(ttl, self.max_ttl))
+        while len(self._values) > self.max_size:
+            self._values.popitem(last=False)
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self._values.pop(key, None)
+
+    async def publish(self, channel: str, message: bytes):
+        for callback in self._subscribers.get(channel, []):
+            await callback(message)
+
+    async def subscribe(self, channel: str, callback: Callable[[bytes], Awaitable[None]]):
+        self._subscribers.setdefault(channel, []).append(callback)
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Backend for anything speaking the Redis protocol (redis-server, KeyDB, Valkey, fakeredis).
+    Needs the optional redis package.
+    """
+
+    def __init__(self, url: str | None = REDIS_URL, client=None):
+        if client is None:
+            try:
+                import redis.asyncio as redis_asyncio
+            except ImportError as e:
+                raise RuntimeError("SHARED_CACHE_BACKEND=redis needs the redis package installed") from e
+            client = redis_asyncio.Redis.from_url(url or "redis://localhost:6379/0")
+        self.client = client
+        self._listeners: list[asyncio.Task] = []
+
+    async def get(self, key: str) -> bytes | None:
+        return await self.client.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        await self.client.set(key, value, px=max(1, int(ttl * 1000)))
+
+    async def delete(self, *keys: str):
+        if keys:
+            await self.client.delete(*keys)
+
+    async def publish(self, channel: str, message: bytes):
+        await self.client.publish(channel, message)
+
+    async def subscribe(self, channel: str, callback: Callable[[bytes], Awaitable[None]]):
+        pubsub = self.client.pubsub()
+        await pubsub.subscribe(channel)
+
+        async def listen():
+            async for message in pubsub.listen():
+                if message.get("type") == "message":
+                    try:
+                        await callback(message["data"])
+                    except Exception as e:
+                        logger.error("cache invalidation message failed", extra={"error": str(e)})
+
+        self._listeners.append(asyncio.create_task(listen()))
+
+    async def close(self):
+        for task in self._listeners:
+            task.cancel()
+        await asyncio.gather(*self._listeners, return_exceptions=True)
+        await self.client.aclose()
+
+
+#Envelope stored in the shared cache: expiry (unix time), recompute time, metadata length,
+#then the metadata JSON (word, usage ids, etag, whether it is the word's sense) and the response payload
+ENVELOPE = struct.Struct("<ddI")
+
+
+@dataclass
+class SharedCacheStats:
+    hits: int = 0
+    misses: int = 0
+    early_refreshes: int = 0
+    invalidations_sent: int = 0
+    invalidations_received: int = 0
+
+
+class SharedTranslationCache:
+    """
+    Second-level cache of serialized /gettranslation responses shared by every worker.
+    Entries are refreshed early with probability rising towards expiry (XFetch), so one
+    request recomputes a hot entry before it expires instead of all of them at once.
+    """
+
+    def __init__(self, backend: CacheBackend, local: "TranslationCache", ttl: float = SHARED_CACHE_TTL, beta: float = SHARED_CACHE_BETA):
+        self.backend = backend
+        self.local = local
+        self.ttl = min(ttl, backend.max_ttl) if backend.max_ttl is not None else ttl
+        self.beta = beta
+        self.stats = SharedCacheStats()
+        #Lets a worker recognise its own invalidation messages
+        self.origin = uuid.uuid4().hex
+
+    @staticmethod
+    def id_key(translation_id: int) -> str:
+        return f"tr:id:{translation_id}"
+
+    @staticmethod
+    def word_key(word: str) -> str:
+        return f"tr:word:{normalize_word(word)}"
+
+    @staticmethod
+    def usage_key(usage_id: int) -> str:
+        return f"tr:usage:{usage_id}"
+
+    async def start(self):
+        await self.backend.subscribe(INVALIDATION_CHANNEL, self._on_invalidation)
+
+    async def close(self):
+        await self.backend.close()
+
+    async def get(self, translation_id: int | None = None, word: str | None = None) -> tuple[bytes | None, str | None, bool]:
+        """
+        Return (payload, etag, refresh). When refresh is True the caller should recompute and set the
+        entry; the payload may still be served to it if recomputing fails.
+        """
+        raw = None
+        by_word = False
+        try:
+            if translation_id:
+                raw = await self.backend.get(self.id_key(translation_id))
+            if raw is None and word:
+                pointer = await self.backend.get(self.word_key(word))
+                if pointer is not None:
+                    raw = await self.backend.get(self.id_key(int(pointer)))
+                    by_word = True
+        except Exception as e:
+            #The shared level is an optimisation, an outage falls through to the database
+            logger.warning("shared cache read failed", extra={"error": str(e)})
+            raw = None
+        if raw is None:
+            self.stats.misses += 1
+            return None, None, True
+
+        expires_at, delta, meta_length = ENVELOPE.unpack_from(raw, 0)
+        meta = json.loads(raw[ENVELOPE.size:ENVELOPE.size + meta_length])
+        payload = bytes(raw[ENVELOPE.size + meta_length:])
+
+        #XFetch: recompute early with probability that grows as expiry approaches
+        if time.time() - delta * self.beta * math.log(random.random() or 1e-12) >= expires_at:
+            self.stats.early_refreshes += 1
+            return payload, meta.get("etag"), True
+
+        self.stats.hits += 1
+        self.local.set(
+            meta["id"],
+            meta["word"],
+            payload,
+            usage_ids=tuple(meta["usage_ids"]),
+            etag=meta.get("etag"),
+            index_word=by_word or meta.get("word_sense", False),
+        )
+        return payload, meta.get("etag"), False
+
+    async def set(
+        self,
+        translation_id: int,
+        word: str,
+        payload: bytes,
+        usage_ids: tuple[int, ...],
+        delta: float,
+        etag: str | None = None,
+        index_word: bool = True,
+    ):
+        """
+        Store the payload; delta is how long (seconds) it took to compute, used for early refresh.
+        The word pointer is only written with index_word, i.e. for the sense a lookup by word returns.
+        """
+        meta = json.dumps({
+            "id": translation_id,
+            "word": normalize_word(word),
+            "usage_ids": list(usage_ids),
+            "etag": etag,
+            "word_sense": index_word,
+        }).encode()
+        raw = ENVELOPE.pack(time.time() + self.ttl, delta, len(meta)) + meta + payload
+        try:
+            await self.backend.set(self.id_key(translation_id), raw, self.ttl)
+            if index_word:
+                await self.backend.set(self.word_key(word), str(translation_id).encode(), self.ttl)
+            for usage_id in usage_ids:
+                await self.backend.set(self.usage_key(usage_id), str(translation_id).encode(), self.ttl)
+        except Exception as e:
+            logger.warning("shared cache write failed", extra={"error": str(e)})
+
+    async def invalidate(self, translation_id: int | None = None, word: str | None = None, usage_id: int | None = None):
+        """
+        Drop the entry from the shared level and tell every worker to drop it from its own cache.
+        """
+        if translation_id is None and usage_id is not None:
+            pointer = await self.backend.get(self.usage_key(usage_id))
+            if pointer is not None:
+                translation_id = int(pointer)
+        if translation_id is None and word is not None:
+            pointer = await self.backend.get(self.word_key(word))
+            if pointer is not None:
+                translation_id = int(pointer)
+
+        keys = []
+        if translation_id is not None:
+            keys.append(self.id_key(translation_id))
+        if word is not None:
+            keys.append(self.word_key(word))
+        await self.backend.delete(*keys)
+
+        self.local.invalidate(translation_id=translation_id, word=word, usage_id=usage_id)
+        message = json.dumps({
+            "origin": self.origin,
+            "translation_id": translation_id,
+            "word": word,
+            "usage_id": usage_id,
+        }).encode()
+        await self.backend.publish(INVALIDATION_CHANNEL, message)
+        self.stats.invalidations_sent += 1
+
+    async def _on_invalidation(self, message: bytes):
+        data = json.loads(message)
+        if data.get("origin") == self.origin:
+            return
+        self.stats.invalidations_received += 1
+        self.local.invalidate(
+            translation_id=data.get("translation_id"),
+            word=data.get("word"),
+            usage_id=data.get("usage_id"),
+        )
+
+    def get_stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "ttl": self.ttl,
+            "hits": self.stats.hits,
+            "misses": self.stats.misses,
+            "early_refreshes": self.stats.early_refreshes,
+            "invalidations_sent": self.stats.invalidations_sent,
+            "invalidations_received": self.stats.invalidations_received,
+        }
+
+
+def create_cache_backend(name: str = SHARED_CACHE_BACKEND) -> CacheBackend:
+    if name == "redis":
+        return RedisCacheBackend()
+    if name == "memory":
+        return InMemoryCacheBackend()
+    return NullCacheBackend()
+
+
+#One first-level cache per worker process, in front of the shared second level
+translation_cache = TranslationCache()
+shared_translation_cache = SharedTranslationCache(create_cache_backend(), translation_cache)
+
+
+async def invalidate_translation(translation_id: int | None = None, word: str | None = None, usage_id: int | None = None):
+    """
+    Called by the write paths: drops the entry from both levels in every worker.
+    A cache outage must not fail the write, so errors only drop the local entry.
+    """
+    try:
+        await shared_translation_cache.invalidate(translation_id=translation_id, word=word, usage_id=usage_id)
+    except Exception as e:
+        logger.error("shared cache invalidation failed", extra={"error": str(e)})
+        translation_cache.invalidate(translation_id=translation_id, word=word, usage_id=usage_id)
@@ -1,15 +1,23 @@
-from typing import List
+from typing import List, AsyncIterator
 from pydantic import BaseModel
 from sqlalchemy.future import select
 from sqlalchemy.exc import IntegrityError
-from .models import Translation, TranslationUsage, TranslationAudio, TranslationUsageAudio
-from .db import engine
+from sqlalchemy import literal_column, text, update, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from .models import Translation, TranslationUsage, TranslationAudio, TranslationUsageAudio, AudioObject
+from .db import SessionLocal
+from .cache import invalidate_translation
+from .senses import choose_sense
 import asyncio
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import sessionmaker, selectinload, joinedload
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timezone
 import json
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 class UsageAudio(BaseModel):
@@ -214,120 +222,103 @@ class LinkResponse(BaseModel):
 
 #     return TranslationResponse.model_validate(translation_with_usages)
 
-async def insert_translation(session: AsyncSession, payload: dict) -> TranslationResponse:
-    # Check if translation exists
-    stmt = select(Translation).options(selectinload(Translation.usages)).where(
-        Translation.word == payload["word"],
-        Translation.translation == payload["translation"],
-        Translation.reading == payload.get("reading")
-    )
-
-    # stmt = (
-    #     select(Translation)
-    #     .where(Translation.id == translation.id)
-    #     .options(
-    #         selectinload(Translation.usages)
-    #         .selectinload(TranslationUsage.usage_audio)
-    #     )
-    # )
-
-    print("PAYLOAD", payload)
-
-    # stmt = (
-    #     select(Translation)
-    #     .options(
-    #         selectinload(Translation.usages)
-    #         .selectinload(TranslationUsage.usage_audio)
-    #     )
-    #     .where(Translation.id == translation.id)
-    # )
-    result = await session.execute(stmt)
-    existing = result.scalars().first()
-    if existing:
-        return TranslationResponseWithoutUsageAudio.model_validate(existing)
-    
-    # translation = result.scalars().first()
-    # if translation:
-    #     return TranslationResponse.model_validate(translation)
-
-    # Create new translation + usages
-    #TODO
-    #THIS INSERTS, but it is unable to return the response properly
-    #On second attempt it works because it is returning a different path
-    translation = Translation(
-        word=payload["word"],
-        translation=payload["translation"],
-        reading=payload.get("reading"),
-        script=payload["script"],
-        usages=[TranslationUsage(en=u["en"], ja=u["ja"]) for u in payload.get("usage", [])]
-    )
-
-    session.add(translation)
-
-    try:
-        await session.commit()
-    except IntegrityError:
-        await session.rollback()
-        raise
-
-    # Reload translation with usages eagerly loaded (for Pydantic)
-    stmt = select(Translation).options(selectinload(Translation.usages)).where(
-        Translation.id == translation.id
-    )
+#On conflict: add a request's context to the sense's stored contexts unless it is already there
+MERGE_CONTEXT_SQL = """CASE
+        WHEN excluded.context IS NULL OR strpos(COALESCE(translations.context, ''), excluded.context) > 0
+        THEN translations.context
+        ELSE left(concat_ws(' | ', translations.context, excluded.context), 1000)
+    END"""
+
+#Upsert the translation and, only when it is new, its usages in one statement. The usages in
+#the result are the new ones, or the stored ones (with their audio) when the row already existed.
+#The update makes RETURNING include an existing row (xmax = 0 marks a new one) and adds the
+#request's context to the sense, so the next request with a similar context matches it.
+UPSERT_TRANSLATION_SQL = text("""
+WITH upserted AS (
+    INSERT INTO translations (word, translation, reading, script, context)
+    VALUES (:word, :translation, :reading, :script, NULLIF(:context, ''))
+    ON CONFLICT ON CONSTRAINT uq_translation_word_translation_reading
+    DO UPDATE SET script = translations.script, context = """ + MERGE_CONTEXT_SQL + """
+    RETURNING id, word, translation, reading, script, (xmax = 0) AS inserted
+),
+new_usages AS (
+    INSERT INTO translation_usages (translation_id, en, ja)
+    SELECT upserted.id, x.en, x.ja
+    FROM upserted,
+        ROWS FROM (jsonb_to_recordset(CAST(CAST(:usages AS text) AS jsonb)) AS (en text, ja text)) WITH ORDINALITY AS x(en, ja, ord)
+    WHERE upserted.inserted
+    ORDER BY x.ord
+    RETURNING id, en, ja
+)
+SELECT upserted.id, upserted.word, upserted.translation, upserted.reading, upserted.script, upserted.inserted,
+    CASE WHEN upserted.inserted THEN (
+        SELECT json_agg(json_build_object('id', nu.id, 'en', nu.en, 'ja', nu.ja, 'usage_audio', NULL) ORDER BY nu.id)
+        FROM new_usages nu
+    ) ELSE (
+        SELECT json_agg(json_build_object(
+            'id', tu.id,
+            'en', tu.en,
+            'ja', tu.ja,
+            'usage_audio', CASE WHEN tua.id IS NULL THEN NULL ELSE json_build_object(
+                'id', tua.id,
+                'usage_id', tua.usage_id,
+                'storage_url', tua.storage_url,
+                'voice_id', tua.voice_id,
+                'audio_format', tua.audio_format,
+                'created_at', tua.created_at
+            ) END
+        ) ORDER BY tu.id)
+        FROM translation_usages tu
+        LEFT JOIN translation_usage_audio tua ON tua.usage_id = tu.id
+        WHERE tu.translation_id = upserted.id
+    ) END::text AS usages
+FROM upserted
+""")
+
+
+async def insert_translation(session: AsyncSession, payload: dict) -> tuple[TranslationResponse, bool]:
+    """
+    Insert a translation with its usages, or return the stored one when the
+    (word, translation, reading) already exists. One round trip and one transaction, so
+    concurrent inserts of the same word cannot race into an IntegrityError.
+    Returns (translation, inserted); a stored row may already have audio.
+    """
+    logger.debug("inserting translation", extra={"word": payload.get("word"), "usages": len(payload.get("usage", []))})
+
+    result = await session.execute(UPSERT_TRANSLATION_SQL, {
+        "word": payload["word"],
+        "translation": payload["translation"],
+        "reading": payload.get("reading"),
+        "script": payload["script"],
+        "context": (payload.get("context") or "").strip(),
+        "usages": json.dumps([{"en": u["en"], "ja": u["ja"]} for u in payload.get("usage", [])], ensure_ascii=False),
+    })
+    row = result.one()
+    usages = [Usage.model_validate(usage) for usage in json.loads(row.usages or "[]")]
 
-    # stmt = select(Translation).options(selectinload(Translation.usages)).where(
-    #     Translation.word == payload["word"],
-    #     Translation.translation == payload["translation"],
-    #     Translation.reading == payload.get("reading")
-    # )
-    result = await session.execute(stmt)
-    translation_with_usages = result.scalars().first()
-    #ATTEMPT BELOW DOES NOT WORK
-    # new_usages = []
-    # for u in translation_with_usages.usages:
-    #     print("USAGE", u.__dict__)
-    #     new_usages.append(Usage(
-    #         id=u.id,
-    #         en=u.en,
-    #         ja=u.ja,
-    #         usage_audio=None
-    #     ))
-    # translation_with_usages.usages = new_usages
-    # print("DO I GET HERE")
-    # translation_response = TranslationResponse(
-    #     id=translation_with_usages.id,
-    #     word=translation_with_usages.word,
-    #     translation=translation_with_usages.translation,
-    #     reading= translation_with_usages.reading,
-    #     script=translation_with_usages.script,
-    #     usages=new_usages
-    # )    
-    # return translation_response
-    #return TranslationResponse.model_validate(translation)
-    # ────────────────────────────────────────────────
-    # 3. MANUAL construction — avoids any schema confusion
-    usages_list = []
-    for usage in translation.usages:
-        print("THIS IS USAGE", usage.__dict__)
-        usages_list.append(
-            Usage(
-                id=usage.id,
-                en=usage.en,
-                ja=usage.ja,
-                usage_audio=None
-            )
+    if not row.inserted and not usages:
+        #A concurrent insert committed after this statement's snapshot was taken, so its usages
+        #were not visible to it; read them again now that they are
+        stmt = (
+            select(TranslationUsage)
+            .where(TranslationUsage.translation_id == row.id)
+            .options(selectinload(TranslationUsage.usage_audio))
+            .order_by(TranslationUsage.id)
         )
+        usages = [Usage.model_validate(usage) for usage in (await session.execute(stmt)).scalars().all()]
 
-    response = TranslationResponse(
-        id=translation.id,
-        word=translation.word,
-        translation=translation.translation,
-        reading=translation.reading,
-        script=translation.script,
-        usages=usages_list,
-    )
-    return response
-    #return TranslationResponseWithoutUsageAudio.model_validate(translation_with_usages)
+    await session.commit()
+    if row.inserted:
+        await invalidate_translation(translation_id=row.id, word=row.word)
+
+    return TranslationResponse(
+        id=row.id,
+        word=row.word,
+        translation=row.translation,
+        reading=row.reading,
+        script=row.script,
+        usages=usages,
+    ), row.inserted
 
 
 
@@ -337,21 +328,48 @@ async def insert_translation_audio(
     storage_url: str,
     voice_id: str | None = None,
     audio_format: str = "mp3",
+    audio_object_id: int | None = None,
 ) -> TranslationAudioResponse:
     audio = TranslationAudio(
         translation_id=translation_id,
         storage_url=storage_url,
         voice_id=voice_id,
         audio_format=audio_format,
+        audio_object_id=audio_object_id,
     )
 
     db.add(audio)
+    #Bump the translation so incremental exports (updated_since) pick up the new audio
+    await db.execute(
+        update(Translation)
+        .where(Translation.id == translation_id)
+        .values(updated_at=func.current_timestamp())
+    )
     await db.commit()
     await db.refresh(audio)
+    await invalidate_translation(translation_id=translation_id)
 
     return TranslationAudioResponse.model_validate(audio)
 
 
+async def get_translation_audio_for_voice(
+    session: AsyncSession,
+    translation_id: int,
+    voice_id: str,
+) -> TranslationAudioResponse | None:
+    """
+    The newest word audio of the translation spoken by the voice, if there is one.
+    """
+    stmt = (
+        select(TranslationAudio)
+        .where(TranslationAudio.translation_id == translation_id, TranslationAudio.voice_id == voice_id)
+        .order_by(TranslationAudio.created_at.desc())
+        .limit(1)
+    )
+    audio = (await session.execute(stmt)).scalars().first()
+    return TranslationAudioResponse.model_validate(audio) if audio else None
+
+
 # async def add_usage_audio(
 #     session: AsyncSession,
 #     translation_id: int,
@@ -471,11 +489,17 @@ async def add_usage_audio(
             audio_format=audio_format,
         )
         session.add(usage_audio)
+        await session.execute(
+            update(Translation)
+            .where(Translation.id == select(TranslationUsage.translation_id).where(TranslationUsage.id == usage_id).scalar_subquery())
+            .values(updated_at=func.current_timestamp())
+        )
         await session.commit()
+        await invalidate_translation(usage_id=usage_id)
         return usage_audio
 
     except IntegrityError:
-        print("CAUGHT INTEGRITY ERROR")
+        logger.info("usage audio already linked", extra={"usage_id": usage_id})
         await session.rollback()
 
         stmt = (
@@ -502,7 +526,7 @@ async def get_existing_audio_for_usage(
     if not link:
         return None
 
-    print("LINK", link.__dict__)
+    logger.debug("existing usage audio", extra={"usage_id": usage_id, "usage_audio_id": link.id})
 
     return LinkResponse.model_validate({
         "id": link.id,
@@ -595,42 +619,271 @@ async def get_existing_audio_for_usage(
 
 #     return translation, audio
 
-async def get_translation_with_audio_by_word(
+#Version string behind the ETag: the row's updated_at plus the newest word audio and usage
+#audio ids. Shared by the full read and the cheap ETag-only query so both agree.
+TRANSLATION_VERSION_LATERAL = """
+LEFT JOIN LATERAL (
+    SELECT concat_ws(':', t.id, t.updated_at,
+        (SELECT max(ta.id) FROM translation_audio ta WHERE ta.translation_id = t.id),
+        (SELECT max(tua.id) FROM translation_usages tu
+            JOIN translation_usage_audio tua ON tua.usage_id = tu.id
+            WHERE tu.translation_id = t.id)
+    ) AS version
+) v ON true"""
+
+#Translation, usages with their audio and the latest word audio in one round trip,
+#built as JSON by Postgres in the shape of TranslationWithAudioResponse
+TRANSLATION_RESPONSE_SQL = """
+SELECT json_build_object(
+    'translation', json_build_object(
+        'id', t.id,
+        'word', t.word,
+        'translation', t.translation,
+        'reading', t.reading,
+        'script', t.script,
+        'usages', COALESCE(u.usages, '[]'::json)
+    ),
+    'audio', a.audio
+)::text AS payload, t.id, t.context, v.version
+FROM translations t
+LEFT JOIN LATERAL (
+    SELECT json_agg(json_build_object(
+        'id', tu.id,
+        'en', tu.en,
+        'ja', tu.ja,
+        'usage_audio', CASE WHEN tua.id IS NULL THEN NULL ELSE json_build_object(
+            'id', tua.id,
+            'usage_id', tua.usage_id,
+            'storage_url', tua.storage_url,
+            'voice_id', tua.voice_id,
+            'audio_format', tua.audio_format,
+            'created_at', tua.created_at
+        ) END
+    ) ORDER BY tu.id) AS usages
+    FROM translation_usages tu
+    LEFT JOIN translation_usage_audio tua ON tua.usage_id = tu.id
+    WHERE tu.translation_id = t.id
+) u ON true
+LEFT JOIN LATERAL (
+    SELECT json_build_object(
+        'id', ta.id,
+        'translation_id', ta.translation_id,
+        'storage_url', ta.storage_url,
+        'voice_id', ta.voice_id,
+        'audio_format', ta.audio_format,
+        'created_at', ta.created_at
+    ) AS audio
+    FROM translation_audio ta
+    WHERE ta.translation_id = t.id
+    ORDER BY ta.created_at DESC
+    LIMIT 1
+) a ON true
+{version}
+WHERE {where}
+ORDER BY t.id
+{limit}
+"""
+
+#Only the version, no JSON building, for conditional requests
+TRANSLATION_VERSION_SQL = """
+SELECT v.version
+FROM translations t
+{version}
+WHERE {where}
+ORDER BY t.id
+LIMIT 1
+"""
+
+TRANSLATION_RESPONSE_BY_ID = text(TRANSLATION_RESPONSE_SQL.format(version=TRANSLATION_VERSION_LATERAL, where="t.id = :id", limit="LIMIT 1"))
+#word is CITEXT, so equality is case-insensitive and can use the index
+TRANSLATION_RESPONSE_BY_WORD = text(TRANSLATION_RESPONSE_SQL.format(version=TRANSLATION_VERSION_LATERAL, where="t.word = CAST(:word AS citext)", limit="LIMIT 1"))
+#Every sense of a word, oldest first
+TRANSLATION_SENSES_BY_WORD = text(TRANSLATION_RESPONSE_SQL.format(version=TRANSLATION_VERSION_LATERAL, where="t.word = CAST(:word AS citext)", limit=""))
+#Keyset pages and the full export, optionally only rows changed since a timestamp
+TRANSLATION_RESPONSE_PAGE = text(TRANSLATION_RESPONSE_SQL.format(version=TRANSLATION_VERSION_LATERAL, where="t.id > :after_id", limit="LIMIT :limit"))
+TRANSLATION_RESPONSE_PAGE_SINCE = text(TRANSLATION_RESPONSE_SQL.format(
+    version=TRANSLATION_VERSION_LATERAL,
+    where="t.id > :after_id AND t.updated_at >= :updated_since", limit="LIMIT :limit"
+))
+TRANSLATION_RESPONSE_EXPORT = text(TRANSLATION_RESPONSE_SQL.format(version=TRANSLATION_VERSION_LATERAL, where="true", limit=""))
+TRANSLATION_RESPONSE_EXPORT_SINCE = text(TRANSLATION_RESPONSE_SQL.format(
+    version=TRANSLATION_VERSION_LATERAL,
+    where="t.updated_at >= :updated_since", limit=""
+))
+TRANSLATION_VERSION_BY_ID = text(TRANSLATION_VERSION_SQL.format(version=TRANSLATION_VERSION_LATERAL, where="t.id = :id"))
+TRANSLATION_VERSION_BY_WORD = text(TRANSLATION_VERSION_SQL.format(
+    version=TRANSLATION_VERSION_LATERAL,
+    where="t.word = CAST(:word AS citext)",
+))
+
+
+def translation_etag(version: str) -> str:
+    """
+    Strong ETag for a translation version string.
+    """
+    return '"' + hashlib.sha1(version.encode()).hexdigest() + '"'
+
+
+async def fetch_translation_response_with_etag(
     session: AsyncSession,
-    word: str,
-) -> tuple[Translation | None, TranslationAudio | None]:
-    # Load translation + usages + usage audio + actual audio
-    stmt = (
-        select(Translation)
-        .where(Translation.word.ilike(word))
-        .options(
-            selectinload(Translation.usages)
-            .selectinload(TranslationUsage.usage_audio)
-            .selectinload(TranslationUsageAudio.usage)
-        )
+    translation_id: int | None = None,
+    word: str | None = None,
+) -> tuple[TranslationWithAudioResponse | None, str | None]:
+    """
+    Load a translation straight into the response model with a single query, by id or by word,
+    together with its ETag.
+    """
+    if translation_id is not None:
+        result = await session.execute(TRANSLATION_RESPONSE_BY_ID, {"id": translation_id})
+    else:
+        result = await session.execute(TRANSLATION_RESPONSE_BY_WORD, {"word": word})
+    row = result.first()
+    if row is None:
+        return None, None
+    return TranslationWithAudioResponse.model_validate_json(row.payload), translation_etag(row.version)
+
+
+async def fetch_translation_response(
+    session: AsyncSession,
+    translation_id: int | None = None,
+    word: str | None = None,
+) -> TranslationWithAudioResponse | None:
+    response, _ = await fetch_translation_response_with_etag(session, translation_id, word)
+    return response
+
+
+async def get_translation_etag(
+    session: AsyncSession,
+    translation_id: int | None = None,
+    word: str | None = None,
+) -> str | None:
+    """
+    The current ETag of a translation without building its body, for revalidation.
+    """
+    if translation_id is not None:
+        result = await session.execute(TRANSLATION_VERSION_BY_ID, {"id": translation_id})
+    else:
+        result = await session.execute(TRANSLATION_VERSION_BY_WORD, {"word": word})
+    version = result.scalar_one_or_none()
+    return translation_etag(version) if version is not None else None
+
+
+def naive_utc(value: datetime) -> datetime:
+    """
+    The timestamp columns are without time zone (UTC), so compare against naive UTC values.
+    """
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+class TranslationPage(BaseModel):
+    items: List[TranslationWithAudioResponse]
+    next_cursor: int | None
+
+
+async def list_translations(
+    session: AsyncSession,
+    after_id: int = 0,
+    limit: int = 100,
+    updated_since: datetime | None = None,
+) -> TranslationPage:
+    """
+    One page of translations ordered by id. Pass the returned next_cursor as after_id for the next page.
+    """
+    params = {"after_id": after_id, "limit": limit}
+    if updated_since is not None:
+        params["updated_since"] = naive_utc(updated_since)
+        result = await session.execute(TRANSLATION_RESPONSE_PAGE_SINCE, params)
+    else:
+        result = await session.execute(TRANSLATION_RESPONSE_PAGE, params)
+
+    rows = result.all()
+    return TranslationPage(
+        items=[TranslationWithAudioResponse.model_validate_json(row.payload) for row in rows],
+        next_cursor=rows[-1].id if len(rows) == limit else None,
     )
 
-    result = await session.execute(stmt)
-    translation = result.scalar_one_or_none()
 
-    if not translation:
-        return None, None
+async def stream_translation_payloads(
+    session: AsyncSession,
+    updated_since: datetime | None = None,
+    batch_size: int = 500,
+) -> AsyncIterator[str]:
+    """
+    Yield every translation as a JSON string, read through a server-side cursor
+    batch_size rows at a time so the table is never held in memory.
+    """
+    if updated_since is not None:
+        stmt, params = TRANSLATION_RESPONSE_EXPORT_SINCE, {"updated_since": naive_utc(updated_since)}
+    else:
+        stmt, params = TRANSLATION_RESPONSE_EXPORT, {}
+    #payload is the first column, so the scalars are the JSON strings
+    payloads = await session.stream_scalars(
+        stmt,
+        params,
+        execution_options={"yield_per": batch_size},
+    )
+    async for payload in payloads:
+        yield payload
 
-    # Get the most recent translation audio for the word itself
-    audio_stmt = (
-        select(TranslationAudio)
-        .where(TranslationAudio.translation_id == translation.id)
-        .order_by(TranslationAudio.created_at.desc())
-        .limit(1)
+
+async def stream_translation_payloads_with_etags(
+    session: AsyncSession,
+    batch_size: int = 500,
+) -> AsyncIterator[tuple[str, str]]:
+    """
+    Like stream_translation_payloads, yielding (payload, etag) pairs.
+    """
+    rows = await session.stream(
+        TRANSLATION_RESPONSE_EXPORT,
+        execution_options={"yield_per": batch_size},
     )
-    audio_result = await session.execute(audio_stmt)
-    audio = audio_result.scalar_one_or_none()
+    async for row in rows:
+        yield row.payload, translation_etag(row.version)
+
 
-    print("THIS IS THE TRANSLATION OBJECT", translation.__dict__)
-    for trans_usage in translation.usages:
-        print(trans_usage.__dict__)
+async def fetch_translation_senses(
+    session: AsyncSession,
+    word: str,
+) -> list[tuple[TranslationWithAudioResponse, str | None]]:
+    """
+    Every stored sense of the word with the contexts it was asked for, oldest first.
+    """
+    result = await session.execute(TRANSLATION_SENSES_BY_WORD, {"word": word})
+    return [
+        (TranslationWithAudioResponse.model_validate_json(row.payload), row.context)
+        for row in result.all()
+    ]
+
+
+async def get_translation_with_audio_by_word(
+    session: AsyncSession,
+    word: str,
+    context: str | None = None,
+) -> tuple[TranslationResponse | None, TranslationAudioResponse | None]:
+    """
+    The sense of the word that fits the context best, see choose_sense. (None, None) when the word
+    is unknown or no sense is close enough to the context.
+    """
+    senses = await fetch_translation_senses(session, word)
+    response = choose_sense(word, context, [
+        (response, stored_context, [usage.en for usage in response.translation.usages])
+        for response, stored_context in senses
+    ])
+    if not response:
+        return None, None
+    return response.translation, response.audio
 
-    return translation, audio
+
+async def get_translation_with_audio_by_id(
+    session: AsyncSession,
+    id: int,
+) -> tuple[TranslationResponse | None, TranslationAudioResponse | None]:
+    response = await fetch_translation_response(session, translation_id=id)
+    if not response:
+        return None, None
+    return response.translation, response.audio
 
 async def get_usages_by_translation_id(
     session: AsyncSession,
@@ -643,54 +896,310 @@ async def get_usages_by_translation_id(
     result = await session.execute(stmt)
     return result.scalars().all()
 
-async def get_translation_with_audio_by_id(
+
+class SearchResult(BaseModel):
+    id: int
+    word: str
+    translation: str
+    reading: str | None
+    script: str
+    score: float
+
+
+#Each search shape is written to hit one of the indexes from migrations/002_trigram_search.sql
+SEARCH_SQL = {
+    ("prefix", "word"): """
+        SELECT id, word, translation, reading, script, 1.0 AS score
+        FROM translations
+        WHERE lower(word::text) LIKE :pattern ESCAPE '\\'
+        ORDER BY lower(word::text), id
+        LIMIT :limit
+    """,
+    ("fuzzy", "word"): """
+        SELECT id, word, translation, reading, script, similarity(lower(word::text), :q) AS score
+        FROM translations
+        WHERE lower(word::text) % :q
+        ORDER BY score DESC, id
+        LIMIT :limit
+    """,
+    ("prefix", "japanese"): """
+        SELECT id, word, translation, reading, script, 1.0 AS score
+        FROM translations
+        WHERE translation LIKE :pattern ESCAPE '\\' OR reading LIKE :pattern ESCAPE '\\'
+        ORDER BY translation, id
+        LIMIT :limit
+    """,
+    ("fuzzy", "japanese"): """
+        SELECT id, word, translation, reading, script,
+            GREATEST(similarity(translation, :q), similarity(coalesce(reading, ''), :q)) AS score
+        FROM translations
+        WHERE translation % :q OR reading % :q
+        ORDER BY score DESC, id
+        LIMIT :limit
+    """,
+}
+
+
+def escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+async def search_translations(
     session: AsyncSession,
-    id: int,
-) -> tuple[Translation | None, TranslationAudio | None]:
-    # Load translation + usages + usage audio + actual audio
+    q: str,
+    mode: str = "prefix",
+    field: str = "word",
+    limit: int = 10,
+) -> list[SearchResult]:
+    """
+    Prefix autocomplete or trigram similarity search over the English word or the Japanese side.
+    """
+    q = q.strip()
+    if field == "word":
+        q = q.lower()
+    stmt = text(SEARCH_SQL[(mode, field)])
+    result = await session.execute(stmt, {"q": q, "pattern": escape_like(q) + "%", "limit": limit})
+    return [SearchResult.model_validate(row._asdict()) for row in result.all()]
+
+
+async def get_audio_object_by_hash(
+    session: AsyncSession,
+    content_hash: str,
+) -> AudioObject | None:
+    result = await session.execute(
+        select(AudioObject).where(AudioObject.content_hash == content_hash)
+    )
+    return result.scalar_one_or_none()
+
+
+async def insert_audio_object(
+    session: AsyncSession,
+    content_hash: str,
+    storage_url: str,
+    voice_id: str | None,
+    model_id: str,
+    audio_format: str = "mp3",
+    size_bytes: int | None = None,
+) -> AudioObject:
+    """
+    Record an uploaded content-addressed object. If another writer recorded the same hash first, that row is returned.
+    """
+    stmt = pg_insert(AudioObject).values(
+        content_hash=content_hash,
+        storage_url=storage_url,
+        voice_id=voice_id,
+        model_id=model_id,
+        audio_format=audio_format,
+        size_bytes=size_bytes,
+    ).on_conflict_do_nothing(index_elements=["content_hash"])
+    await session.execute(stmt)
+    await session.commit()
+    return await get_audio_object_by_hash(session, content_hash)
+
+async def get_usages_with_audio_by_translation_id(
+    session: AsyncSession,
+    translation_id: int,
+) -> list[TranslationUsage]:
+    """
+    Load the usages of a translation together with any existing usage audio in one joined query.
+    """
+    stmt = (
+        select(TranslationUsage)
+        .where(TranslationUsage.translation_id == translation_id)
+        .options(joinedload(TranslationUsage.usage_audio))
+        .order_by(TranslationUsage.id)
+    )
+    result = await session.execute(stmt)
+    return result.unique().scalars().all()
+
+
+async def add_usage_audio_bulk(
+    session: AsyncSession,
+    links: list[tuple[int, str, int | None]],
+    voice_id: str | None = None,
+    audio_format: str = "mp3",
+) -> list[LinkResponse]:
+    """
+    Link audio to several usages in one transaction. links is a list of
+    (usage_id, storage_url, audio_object_id). Usages that already have audio keep
+    their existing link, which is returned instead.
+    """
+    if not links:
+        return []
+
+    stmt = pg_insert(TranslationUsageAudio).values([
+        {
+            "usage_id": usage_id,
+            "storage_url": storage_url,
+            "voice_id": voice_id,
+            "audio_format": audio_format,
+            "audio_object_id": audio_object_id,
+        }
+        for usage_id, storage_url, audio_object_id in links
+    ]).on_conflict_do_nothing(index_elements=["usage_id"])
+    await session.execute(stmt)
+
+    usage_ids = [usage_id for usage_id, _, _ in links]
+    await session.execute(
+        update(Translation)
+        .where(Translation.id.in_(
+            select(TranslationUsage.translation_id).where(TranslationUsage.id.in_(usage_ids))
+        ))
+        .values(updated_at=func.current_timestamp())
+    )
+    await session.commit()
+
+    result = await session.execute(
+        select(TranslationUsageAudio).where(TranslationUsageAudio.usage_id.in_(usage_ids))
+    )
+    by_usage = {link.usage_id: link for link in result.scalars().all()}
+
+    for usage_id in usage_ids:
+        await invalidate_translation(usage_id=usage_id)
+
+    return [
+        LinkResponse.model_validate({
+            "id": by_usage[usage_id].id,
+            "usage_id": usage_id,
+            "storage_url": by_usage[usage_id].storage_url,
+            "created_at": by_usage[usage_id].created_at,
+        })
+        for usage_id in usage_ids
+        if usage_id in by_usage
+    ]
+
+
+async def get_translations_by_words(
+    session: AsyncSession,
+    words: list[str],
+    contexts: dict[str, str] | None = None,
+) -> dict[str, Translation]:
+    """
+    Resolve many words in one joined query. Keys are the lower-cased words. With contexts
+    (keyed the same way) each word gets its closest sense, and words no sense fits are left out.
+    """
+    if not words:
+        return {}
     stmt = (
         select(Translation)
-        .where(Translation.id == id)
+        .where(Translation.word.in_(words))
         .options(
-            selectinload(Translation.usages)
-            .selectinload(TranslationUsage.usage_audio)
-            .selectinload(TranslationUsageAudio.usage)
+            joinedload(Translation.usages)
+            .joinedload(TranslationUsage.usage_audio)
         )
+        .order_by(Translation.id)
     )
-
     result = await session.execute(stmt)
-    translation = result.scalar_one_or_none()
 
-    if not translation:
-        return None, None
-
-    # Get the most recent translation audio for the word itself
-    audio_stmt = (
-        select(TranslationAudio)
-        .where(TranslationAudio.translation_id == translation.id)
-        .order_by(TranslationAudio.created_at.desc())
-        .limit(1)
-    )
-    audio_result = await session.execute(audio_stmt)
-    audio = audio_result.scalar_one_or_none()
+    senses: dict[str, list[Translation]] = {}
+    for translation in result.unique().scalars().all():
+        senses.setdefault(translation.word.lower(), []).append(translation)
 
-    print("THIS IS THE TRANSLATION OBJECT", translation.__dict__)
-    for trans_usage in translation.usages:
-        print(trans_usage.__dict__)
+    found = {}
+    for word, word_senses in senses.items():
+        context = (contexts or {}).get(word)
+        sense = choose_sense(word, context, [
+            (translation, translation.context, [usage.en for usage in translation.usages])
+            for translation in word_senses
+        ])
+        if sense is not None:
+            found[word] = sense
+    return found
 
-    return translation, audio
 
-async def get_usages_by_translation_id(
+async def insert_translations_bulk(
     session: AsyncSession,
-    translation_id: int,
-) -> list[TranslationUsage]:
-    stmt = select(TranslationUsage).where(
-        TranslationUsage.translation_id == translation_id
+    payloads: list[dict],
+) -> list[TranslationResponse]:
+    """
+    Insert many translations with one multi-row INSERT ... ON CONFLICT for the translations
+    and one for the usages of the rows that were actually new, in a single transaction.
+    """
+    #ON CONFLICT cannot touch the same row twice in one statement, so drop repeats first
+    unique_payloads = {}
+    for payload in payloads:
+        key = (payload["word"].lower(), payload["translation"], payload.get("reading"))
+        unique_payloads.setdefault(key, payload)
+    if not unique_payloads:
+        return []
+
+    stmt = pg_insert(Translation).values([
+        {
+            "word": payload["word"],
+            "translation": payload["translation"],
+            "reading": payload.get("reading"),
+            "script": payload["script"],
+            "context": (payload.get("context") or "").strip() or None,
+        }
+        for payload in unique_payloads.values()
+    ])
+    #The update makes RETURNING include rows that already existed (xmax = 0 marks new ones)
+    #and records the new contexts on them
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_translation_word_translation_reading",
+        set_={"script": Translation.script, "context": literal_column(MERGE_CONTEXT_SQL)},
+    ).returning(
+        Translation.id,
+        Translation.word,
+        Translation.translation,
+        Translation.reading,
+        Translation.script,
+        literal_column("(xmax = 0)").label("inserted"),
     )
+    translation_rows = (await session.execute(stmt)).all()
+
+    usages_by_translation: dict[int, list[Usage]] = {row.id: [] for row in translation_rows}
+    new_usage_values = []
+    existing_ids = []
+    for row in translation_rows:
+        if not row.inserted:
+            existing_ids.append(row.id)
+            continue
+        payload = unique_payloads[(row.word.lower(), row.translation, row.reading)]
+        new_usage_values.extend(
+            {"translation_id": row.id, "en": u["en"], "ja": u["ja"]}
+            for u in payload.get("usage", [])
+        )
 
-    result = await session.execute(stmt)
-    return result.scalars().all()
+    if new_usage_values:
+        usage_stmt = pg_insert(TranslationUsage).values(new_usage_values).returning(
+            TranslationUsage.id,
+            TranslationUsage.translation_id,
+            TranslationUsage.en,
+            TranslationUsage.ja,
+        )
+        for usage in (await session.execute(usage_stmt)).all():
+            usages_by_translation[usage.translation_id].append(
+                Usage(id=usage.id, en=usage.en, ja=usage.ja, usage_audio=None)
+            )
 
+    if existing_ids:
+        existing_stmt = (
+            select(TranslationUsage)
+            .where(TranslationUsage.translation_id.in_(existing_ids))
+            .options(selectinload(TranslationUsage.usage_audio))
+            .order_by(TranslationUsage.id)
+        )
+        for usage in (await session.execute(existing_stmt)).scalars().all():
+            usages_by_translation[usage.translation_id].append(Usage.model_validate(usage))
+
+    await session.commit()
+
+    for row in translation_rows:
+        if row.inserted:
+            await invalidate_translation(translation_id=row.id, word=row.word)
+
+    return [
+        TranslationResponse(
+            id=row.id,
+            word=row.word,
+            translation=row.translation,
+            reading=row.reading,
+            script=row.script,
+            usages=usages_by_translation[row.id],
+        )
+        for row in translation_rows
+    ]
 
 
 
@@ -704,12 +1213,7 @@ async def main():
     with open(filename, "r", encoding="utf-8") as f:
         payload = json.load(f)
 
-    # # 2️⃣ Create async session
-    async_session = sessionmaker(
-        engine, class_=AsyncSession, expire_on_commit=False
-    )
-
-    async with async_session() as session:
+    async with SessionLocal() as session:
         # 3️⃣ Insert translation
         #response = await insert_translation(session, payload)
 
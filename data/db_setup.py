@@ -1,8 +1,41 @@
 import asyncio
+import re
+from pathlib import Path
 from .db import engine, Base
 from .models import TranslationUsage, Translation
 from sqlalchemy import text
 
+MIGRATIONS_DIR = Path(__file__).resolve().parent / "migrations"
+
+#An interrupted CREATE INDEX CONCURRENTLY leaves an invalid index behind, which IF NOT EXISTS would then skip
+CONCURRENT_INDEX_NAME = re.compile(r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)", re.I)
+INVALID_INDEX = text("""
+SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+WHERE c.relname = :name AND NOT i.indisvalid
+""")
+
+
+def migration_statements(migration: Path) -> list[str]:
+    sql = "\n".join(
+        line for line in migration.read_text().splitlines()
+        if not line.strip().startswith("--")
+    )
+    return [statement for statement in sql.split(";") if statement.strip()]
+
+
+async def apply_migrations(conn):
+    """
+    Run the idempotent SQL files in data/migrations in name order, for databases created before them.
+    conn must be in autocommit: CREATE INDEX CONCURRENTLY cannot run inside a transaction, and builds
+    indexes on large tables without blocking writes.
+    """
+    for migration in sorted(MIGRATIONS_DIR.glob("*.sql")):
+        for statement in migration_statements(migration):
+            match = CONCURRENT_INDEX_NAME.search(statement)
+            if match and (await conn.execute(INVALID_INDEX, {"name": match.group(1)})).first():
+                await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {match.group(1)}"))
+            await conn.execute(text(statement))
+
 
 async def main():
     async with engine.begin() as conn:
@@ -10,5 +43,8 @@ async def main():
         await conn.execute(
             text("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
         )
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await apply_migrations(conn)
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,264 @@
+import asyncio
+import logging
+import os
+import random
+import dotenv
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable
+from pydantic import BaseModel
+from sqlalchemy import update, or_, and_, func, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .db import SessionLocal
+from .models import Job
+from telemetry.tracing import start_trace
+
+# #LOAD ENVIRONMENT
+dotenv_file = ".env"
+if os.path.isfile(dotenv_file):
+    dotenv.load_dotenv(dotenv_file)
+
+#QUEUE PARAMS
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "1"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "5"))
+JOB_RETRY_BASE = float(os.environ.get("JOB_RETRY_BASE", "2"))
+JOB_RETRY_MAX = float(os.environ.get("JOB_RETRY_MAX", "300"))
+#A running job whose worker has not finished it within this many seconds is handed out again
+JOB_LOCK_TIMEOUT = float(os.environ.get("JOB_LOCK_TIMEOUT", "600"))
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_DEAD = "dead"
+
+#Predicate of the uq_jobs_dedupe_key_pending index, written the same way so ON CONFLICT can infer it
+PENDING_DEDUPE = text("status IN ('queued', 'running')")
+
+logger = logging.getLogger(__name__)
+
+
+class PermanentJobError(Exception):
+    """
+    Raised by a handler when retrying cannot help; the job goes straight to the dead state.
+    """
+
+
+class JobResponse(BaseModel):
+    id: int
+    kind: str
+    status: str
+    attempts: int
+    max_attempts: int
+    last_error: str | None
+    result: dict | None
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class ClaimedJob(BaseModel):
+    id: int
+    kind: str
+    payload: dict
+    attempts: int
+    max_attempts: int
+
+
+async def enqueue_job(
+    session: AsyncSession,
+    kind: str,
+    payload: dict,
+    dedupe_key: str | None = None,
+    max_attempts: int = JOB_MAX_ATTEMPTS,
+) -> Job:
+    """
+    Queue a job. If dedupe_key matches a job that is still queued or running, that job is returned.
+    The unique index on pending keys decides between concurrent enqueues, so only one row is inserted.
+    """
+    insert_job = (
+        pg_insert(Job)
+        .values(kind=kind, payload=payload, dedupe_key=dedupe_key, max_attempts=max_attempts)
+        .on_conflict_do_nothing(index_elements=[Job.dedupe_key], index_where=PENDING_DEDUPE)
+        .returning(Job)
+    )
+    while True:
+        job = (await session.execute(select(Job).from_statement(insert_job))).scalar_one_or_none()
+        if job is None:
+            stmt = select(Job).where(
+                Job.dedupe_key == dedupe_key,
+                Job.status.in_([JOB_QUEUED, JOB_RUNNING]),
+            )
+            job = (await session.execute(stmt)).scalar_one_or_none()
+        await session.commit()
+        #None: the pending job finished between the two statements, so the key is free again
+        if job is not None:
+            return job
+
+
+async def get_job(session: AsyncSession, job_id: int) -> Job | None:
+    result = await session.execute(select(Job).where(Job.id == job_id))
+    return result.scalar_one_or_none()
+
+
+async def claim_job(session: AsyncSession) -> ClaimedJob | None:
+    """
+    Atomically take the next due job with SELECT ... FOR UPDATE SKIP LOCKED so
+    concurrent workers, in this process or others, never claim the same row.
+    Every claim counts an attempt, including reclaiming a job whose worker died; such a job
+    is marked dead instead once it has used all its attempts.
+    """
+    now = func.current_timestamp()
+    lock_expired = now - timedelta(seconds=JOB_LOCK_TIMEOUT)
+    abandoned = (
+        select(Job.id)
+        .where(Job.status == JOB_RUNNING, Job.locked_at < lock_expired, Job.attempts >= Job.max_attempts)
+        .with_for_update(skip_locked=True)
+    )
+    await session.execute(
+        update(Job)
+        .where(Job.id.in_(abandoned))
+        .values(status=JOB_DEAD, locked_at=None, last_error="Lock timed out on the last attempt, the worker was lost")
+    )
+
+    next_job = (
+        select(Job.id)
+        .where(or_(
+            and_(Job.status == JOB_QUEUED, Job.run_after <= now),
+            and_(Job.status == JOB_RUNNING, Job.locked_at < lock_expired, Job.attempts < Job.max_attempts),
+        ))
+        .order_by(Job.run_after, Job.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    stmt = (
+        update(Job)
+        .where(Job.id == next_job)
+        .values(status=JOB_RUNNING, attempts=Job.attempts + 1, locked_at=now)
+        .returning(Job.id, Job.kind, Job.payload, Job.attempts, Job.max_attempts)
+    )
+    row = (await session.execute(stmt)).first()
+    await session.commit()
+    if row is None:
+        return None
+    return ClaimedJob.model_validate(row._asdict())
+
+
+def owned_by(job: ClaimedJob):
+    """
+    The job is still the claim's: not reclaimed after a lock timeout, which counts another attempt.
+    """
+    return and_(Job.id == job.id, Job.status == JOB_RUNNING, Job.attempts == job.attempts)
+
+
+async def complete_job(session: AsyncSession, job: ClaimedJob, result: dict | None = None) -> bool:
+    """
+    Store the result. Returns False, changing nothing, when the job was handed to another worker.
+    """
+    updated = await session.execute(
+        update(Job)
+        .where(owned_by(job))
+        .values(status=JOB_DONE, result=result, locked_at=None, last_error=None)
+    )
+    await session.commit()
+    return updated.rowcount == 1
+
+
+def retry_delay(attempts: int) -> float:
+    """
+    Exponential backoff with full jitter.
+    """
+    return random.uniform(0, min(JOB_RETRY_MAX, JOB_RETRY_BASE * 2 ** (attempts - 1)))
+
+
+async def fail_job(session: AsyncSession, job: ClaimedJob, error: str, permanent: bool = False) -> bool:
+    """
+    Requeue the job after a backoff, or move it to the dead state once it is out of attempts.
+    Returns False, changing nothing, when the job was handed to another worker.
+    """
+    if permanent or job.attempts >= job.max_attempts:
+        values = {"status": JOB_DEAD}
+    else:
+        values = {
+            "status": JOB_QUEUED,
+            "run_after": func.current_timestamp() + timedelta(seconds=retry_delay(job.attempts)),
+        }
+    updated = await session.execute(
+        update(Job)
+        .where(owned_by(job))
+        .values(locked_at=None, last_error=error[:2000], **values)
+    )
+    await session.commit()
+    return updated.rowcount == 1
+
+
+JobHandler = Callable[[dict], Awaitable[Any]]
+
+
+class JobWorkerPool:
+    """
+    A fixed number of asyncio workers polling the jobs table. Handlers are looked up by job kind
+    and return a JSON-serialisable result, which is stored on the job.
+    """
+
+    def __init__(self, handlers: dict[str, JobHandler], workers: int = JOB_WORKERS):
+        self.handlers = handlers
+        self.workers = workers
+        self._stopping = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self):
+        self._stopping.clear()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        self._stopping.set()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _idle(self):
+        try:
+            await asyncio.wait_for(self._stopping.wait(), timeout=JOB_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _work(self):
+        while not self._stopping.is_set():
+            try:
+                async with SessionLocal() as session:
+                    job = await claim_job(session)
+            except Exception as e:
+                logger.error("job claim failed", extra={"error": str(e)})
+                await self._idle()
+                continue
+
+            if job is None:
+                await self._idle()
+                continue
+
+            await self._run(job)
+
+    async def _run(self, job: ClaimedJob):
+        handler = self.handlers.get(job.kind)
+        try:
+            if handler is None:
+                raise PermanentJobError(f"No handler for job kind {job.kind}")
+            with start_trace(f"job {job.kind}"):
+                result = await handler(job.payload)
+        except asyncio.CancelledError:
+            #Shutting down, the lock timeout hands the job to another worker later
+            raise
+        except Exception as e:
+            async with SessionLocal() as session:
+                owned = await fail_job(session, job, repr(e), permanent=isinstance(e, PermanentJobError))
+        else:
+            async with SessionLocal() as session:
+                owned = await complete_job(session, job, result)
+        if not owned:
+            logger.warning("job was reclaimed before it finished", extra={"job_id": job.id, "attempt": job.attempts})
@@ -0,0 +1,250 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import unicodedata
+import dotenv
+from dataclasses import dataclass
+from sqlalchemy import text
+from .db import SessionLocal
+from telemetry.metrics import LLM_CACHE_LOOKUPS
+from telemetry.tracing import span
+
+# #LOAD ENVIRONMENT
+dotenv_file = ".env"
+if os.path.isfile(dotenv_file):
+    dotenv.load_dotenv(dotenv_file)
+
+#LLM REPLY CACHE PARAMS
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "true").lower() == "true"
+#Replies older than this are not used and are deleted on the next eviction
+LLM_CACHE_MAX_AGE_DAYS = float(os.environ.get("LLM_CACHE_MAX_AGE_DAYS", "90"))
+#Past this total size the least recently used replies are deleted
+LLM_CACHE_MAX_BYTES = int(os.environ.get("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+LLM_CACHE_EVICT_INTERVAL = float(os.environ.get("LLM_CACHE_EVICT_INTERVAL", "3600"))
+
+logger = logging.getLogger(__name__)
+
+#Returns the reply and marks it used, in one round trip
+GET_REPLY = text("""
+UPDATE llm_replies
+SET last_used_at = now(), hits = hits + 1
+WHERE key = :key AND created_at > now() - make_interval(secs => :max_age)
+RETURNING reply::text AS reply
+""")
+
+#The same for a list of keys, so a batch is one statement however many words it has
+GET_REPLIES = text("""
+UPDATE llm_replies
+SET last_used_at = now(), hits = hits + 1
+WHERE key = ANY(CAST(:keys AS text[])) AND created_at > now() - make_interval(secs => :max_age)
+RETURNING key, reply::text AS reply
+""")
+
+PUT_REPLY = text("""
+INSERT INTO llm_replies (key, model, prompt_version, reply, size_bytes, hits, created_at, last_used_at)
+VALUES (:key, :model, :prompt_version, CAST(CAST(:reply AS text) AS jsonb), :size_bytes, 0, now(), now())
+ON CONFLICT (key) DO UPDATE SET
+    reply = excluded.reply,
+    size_bytes = excluded.size_bytes,
+    created_at = excluded.created_at,
+    last_used_at = excluded.last_used_at
+""")
+
+#Expired replies and replies for prompt versions no longer in use
+EVICT_STALE = text("""
+DELETE FROM llm_replies
+WHERE created_at <= now() - make_interval(secs => :max_age)
+   OR NOT (prompt_version = ANY(CAST(:prompt_versions AS text[])))
+""")
+
+#Least recently used replies beyond the size budget
+EVICT_OVER_SIZE = text("""
+DELETE FROM llm_replies
+WHERE key IN (
+    SELECT key FROM (
+        SELECT key, sum(size_bytes) OVER (ORDER BY last_used_at DESC, key) AS running_bytes
+        FROM llm_replies
+    ) ranked
+    WHERE running_bytes > :max_bytes
+)
+""")
+
+STATS = text("SELECT count(*) AS entries, COALESCE(sum(size_bytes), 0) AS size_bytes FROM llm_replies")
+
+
+def normalize_text(value: str | None) -> str:
+    """
+    NFKC, lower case, runs of whitespace collapsed, so trivially different inputs share an entry.
+    """
+    value = unicodedata.normalize("NFKC", value or "")
+    return re.sub(r"\s+", " ", value).strip().lower()
+
+
+def llm_cache_key(word: str, context: str | None, model: str, temperature: float, prompt_version: str) -> str:
+    key = json.dumps(
+        {
+            "word": normalize_text(word),
+            "context": normalize_text(context),
+            "model": model,
+            "temperature": temperature,
+            "prompt_version": prompt_version,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+@dataclass
+class LLMCacheStats:
+    hits: int = 0
+    misses: int = 0
+    errors: int = 0
+    stored: int = 0
+    evicted: int = 0
+
+
+class LLMReplyCache:
+    """
+    Durable cache of parsed LLM replies in Postgres, so the same question is only paid for once
+    whatever happens to the translation rows built from it. Failures are logged and treated as a
+    miss; the cache never stops a translation.
+    """
+
+    def __init__(
+        self,
+        prompt_versions: tuple[str, ...],
+        enabled: bool = LLM_CACHE_ENABLED,
+        max_age_days: float = LLM_CACHE_MAX_AGE_DAYS,
+        max_bytes: int = LLM_CACHE_MAX_BYTES,
+        evict_interval: float = LLM_CACHE_EVICT_INTERVAL,
+    ):
+        self.prompt_versions = prompt_versions
+        self.enabled = enabled
+        self.max_age = max_age_days * 86400
+        self.max_bytes = max_bytes
+        self.evict_interval = evict_interval
+        self.stats = LLMCacheStats()
+        self._evictor: asyncio.Task | None = None
+
+    async def get(self, key: str) -> dict | None:
+        if not self.enabled:
+            return None
+        try:
+            with span("db.llm_cache_get"):
+                async with SessionLocal() as session:
+                    reply = (await session.execute(GET_REPLY, {"key": key, "max_age": self.max_age})).scalar_one_or_none()
+                    await session.commit()
+        except Exception as e:
+            self.stats.errors += 1
+            logger.warning("llm cache read failed", extra={"error": repr(e)})
+            return None
+
+        if reply is None:
+            self.stats.misses += 1
+            LLM_CACHE_LOOKUPS.inc(result="miss")
+            return None
+        self.stats.hits += 1
+        LLM_CACHE_LOOKUPS.inc(result="hit")
+        return json.loads(reply)
+
+    async def get_many(self, keys: list[str]) -> dict[str, dict]:
+        """
+        The stored replies among keys, by key, looked up and marked used in one statement.
+        """
+        keys = list(dict.fromkeys(keys))
+        if not self.enabled or not keys:
+            return {}
+        try:
+            with span("db.llm_cache_get_many"):
+                async with SessionLocal() as session:
+                    rows = (await session.execute(GET_REPLIES, {"keys": keys, "max_age": self.max_age})).all()
+                    await session.commit()
+        except Exception as e:
+            self.stats.errors += 1
+            logger.warning("llm cache read failed", extra={"error": repr(e), "keys": len(keys)})
+            return {}
+
+        replies = {row.key: json.loads(row.reply) for row in rows}
+        self.stats.hits += len(replies)
+        self.stats.misses += len(keys) - len(replies)
+        LLM_CACHE_LOOKUPS.inc(len(replies), result="hit")
+        LLM_CACHE_LOOKUPS.inc(len(keys) - len(replies), result="miss")
+        return replies
+
+    async def set(self, key: str, reply: dict, model: str, prompt_version: str):
+        if not self.enabled:
+            return
+        data = json.dumps(reply, ensure_ascii=False)
+        try:
+            with span("db.llm_cache_set"):
+                async with SessionLocal() as session:
+                    await session.execute(PUT_REPLY, {
+                        "key": key,
+                        "model": model,
+                        "prompt_version": prompt_version,
+                        "reply": data,
+                        "size_bytes": len(data.encode()),
+                    })
+                    await session.commit()
+            self.stats.stored += 1
+        except Exception as e:
+            self.stats.errors += 1
+            logger.warning("llm cache write failed", extra={"error": repr(e)})
+
+    async def evict(self) -> int:
+        """
+        Delete expired replies, replies for retired prompt versions, then the least recently used
+        ones until the total is within max_bytes. Returns the number of rows deleted.
+        """
+        async with SessionLocal() as session:
+            stale = await session.execute(EVICT_STALE, {
+                "max_age": self.max_age,
+                "prompt_versions": list(self.prompt_versions),
+            })
+            over_size = await session.execute(EVICT_OVER_SIZE, {"max_bytes": self.max_bytes})
+            await session.commit()
+        deleted = stale.rowcount + over_size.rowcount
+        self.stats.evicted += deleted
+        if deleted:
+            logger.info("llm cache evicted", extra={"deleted": deleted})
+        return deleted
+
+    async def _evict_forever(self):
+        while True:
+            try:
+                await self.evict()
+            except Exception as e:
+                logger.warning("llm cache eviction failed", extra={"error": repr(e)})
+            await asyncio.sleep(self.evict_interval)
+
+    def start(self):
+        if self.enabled and self.evict_interval > 0 and self._evictor is None:
+            self._evictor = asyncio.create_task(self._evict_forever())
+
+    async def stop(self):
+        if self._evictor is not None:
+            self._evictor.cancel()
+            await asyncio.gather(self._evictor, return_exceptions=True)
+            self._evictor = None
+
+    async def get_stats(self) -> dict:
+        stats = {
+            "enabled": self.enabled,
+            "prompt_versions": list(self.prompt_versions),
+            "max_age_days": self.max_age / 86400,
+            "max_bytes": self.max_bytes,
+            "hits": self.stats.hits,
+            "misses": self.stats.misses,
+            "errors": self.stats.errors,
+            "stored": self.stats.stored,
+            "evicted": self.stats.evicted,
+        }
+        if self.enabled:
+            async with SessionLocal() as session:
+                row = (await session.execute(STATS)).one()
+            stats.update(entries=row.entries, size_bytes=row.size_bytes)
+        return stats
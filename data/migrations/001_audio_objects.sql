@@ -0,0 +1,19 @@
+-- Content-addressed audio shared by translation and usage audio rows
+CREATE TABLE IF NOT EXISTS audio_objects (
+    id SERIAL PRIMARY KEY,
+    content_hash VARCHAR(64) NOT NULL UNIQUE,
+    storage_url VARCHAR(1024) NOT NULL,
+    voice_id VARCHAR(100),
+    model_id VARCHAR(100) NOT NULL,
+    audio_format VARCHAR(20) NOT NULL,
+    size_bytes INTEGER,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+ALTER TABLE translation_audio
+    ADD COLUMN IF NOT EXISTS audio_object_id INTEGER REFERENCES audio_objects (id) ON DELETE SET NULL;
+CREATE INDEX IF NOT EXISTS ix_translation_audio_audio_object_id ON translation_audio (audio_object_id);
+
+ALTER TABLE translation_usage_audio
+    ADD COLUMN IF NOT EXISTS audio_object_id INTEGER REFERENCES audio_objects (id) ON DELETE SET NULL;
+CREATE INDEX IF NOT EXISTS ix_translation_usage_audio_audio_object_id ON translation_usage_audio (audio_object_id);
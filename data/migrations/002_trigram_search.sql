@@ -0,0 +1,15 @@
+-- Indexes behind GET /search
+-- CONCURRENTLY keeps writes to translations going while the indexes build; apply_migrations runs it in autocommit
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Prefix autocomplete on the English word: lower(word) LIKE 'pre%'
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_translations_word_lower_prefix
+    ON translations (lower(word::text) text_pattern_ops);
+
+-- Fuzzy matching and similarity ranking
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_translations_word_trgm
+    ON translations USING gin (lower(word::text) gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_translations_translation_trgm
+    ON translations USING gin (translation gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_translations_reading_trgm
+    ON translations USING gin (reading gin_trgm_ops);
@@ -0,0 +1,3 @@
+-- Incremental export: GET /translations?updated_since=...
+-- CONCURRENTLY keeps writes to translations going while the index builds; apply_migrations runs it in autocommit
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_translations_updated_at_id ON translations (updated_at, id);
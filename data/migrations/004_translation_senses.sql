@@ -0,0 +1,2 @@
+-- Several senses per word: the contexts each sense was asked for, matched against new requests
+ALTER TABLE translations ADD COLUMN IF NOT EXISTS context TEXT;
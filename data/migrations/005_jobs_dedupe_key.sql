@@ -0,0 +1,13 @@
+-- At most one queued or running job per dedupe_key, so concurrent enqueues of the same work insert one row
+-- Duplicates queued before the index existed still run, they only stop sharing the key
+UPDATE jobs SET dedupe_key = NULL
+WHERE dedupe_key IS NOT NULL
+    AND status IN ('queued', 'running')
+    AND id NOT IN (
+        SELECT min(id) FROM jobs
+        WHERE dedupe_key IS NOT NULL AND status IN ('queued', 'running')
+        GROUP BY dedupe_key
+    );
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_jobs_dedupe_key_pending
+    ON jobs (dedupe_key) WHERE status IN ('queued', 'running');
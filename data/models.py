@@ -11,9 +11,11 @@ from sqlalchemy import (
     TIMESTAMP,
     func,
     UniqueConstraint,
+    Index,
+    text,
 )
 from sqlalchemy.orm import declarative_base, relationship
-from sqlalchemy.dialects.postgresql import CITEXT
+from sqlalchemy.dialects.postgresql import CITEXT, JSONB
 
 
 class Translation(Base):
@@ -33,6 +35,9 @@ class Translation(Base):
     # kanji / kana / mixed / romaji (future-proofed)
     script = Column(String(50), nullable=False)
 
+    # Contexts this sense was asked for, used to pick between several senses of a word
+    context = Column(Text, nullable=True)
+
     created_at = Column(
         TIMESTAMP,
         server_default=func.current_timestamp(),
@@ -107,6 +112,29 @@ class TranslationUsage(Base):
     )
 
  
+class AudioObject(Base):
+    __tablename__ = "audio_objects"
+
+    id = Column(Integer, primary_key=True)
+
+    # sha256 of the normalized text, voice, model and voice settings
+    content_hash = Column(String(64), nullable=False, unique=True)
+
+    # Public S3 / Linode object URL
+    storage_url = Column(String(1024), nullable=False)
+
+    voice_id = Column(String(100), nullable=True)
+    model_id = Column(String(100), nullable=False)
+    audio_format = Column(String(20), nullable=False, default="mp3")
+    size_bytes = Column(Integer, nullable=True)
+
+    created_at = Column(
+        TIMESTAMP,
+        server_default=func.current_timestamp(),
+        nullable=False,
+    )
+
+
 class TranslationAudio(Base):
     __tablename__ = "translation_audio"
 
@@ -126,6 +154,14 @@ class TranslationAudio(Base):
     voice_id = Column(String(100), nullable=True)
     audio_format = Column(String(20), nullable=False, default="mp3")
 
+    # Shared content-addressed object, null for audio stored before dedup
+    audio_object_id = Column(
+        Integer,
+        ForeignKey("audio_objects.id", ondelete="SET NULL"),
+        nullable=True,
+        index=True,
+    )
+
     created_at = Column(
         TIMESTAMP,
         server_default=func.current_timestamp(),
@@ -191,6 +227,14 @@ class TranslationUsageAudio(Base):
     voice_id = Column(String(100), nullable=True)
     audio_format = Column(String(20), nullable=False, default="mp3")
 
+    # Shared content-addressed object, null for audio stored before dedup
+    audio_object_id = Column(
+        Integer,
+        ForeignKey("audio_objects.id", ondelete="SET NULL"),
+        nullable=True,
+        index=True,
+    )
+
     created_at = Column(
         TIMESTAMP,
         server_default=func.current_timestamp(),
@@ -203,4 +247,157 @@ class TranslationUsageAudio(Base):
     usage = relationship(
         "TranslationUsage",
         back_populates="usage_audio",
-    )
\ No newline at end of file
+    )
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True)
+
+    # e.g. "translation_audio"
+    kind = Column(String(50), nullable=False)
+
+    payload = Column(JSONB, nullable=False)
+
+    # queued / running / done / dead
+    status = Column(String(20), nullable=False, default="queued", server_default="queued")
+
+    # Jobs with the same key are not queued twice while one is pending
+    dedupe_key = Column(String(255), nullable=True, index=True)
+
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    max_attempts = Column(Integer, nullable=False, default=5, server_default="5")
+
+    # Earliest time the job may be claimed, pushed back on each retry
+    run_after = Column(
+        TIMESTAMP,
+        server_default=func.current_timestamp(),
+        nullable=False,
+    )
+
+    locked_at = Column(TIMESTAMP, nullable=True)
+    last_error = Column(Text, nullable=True)
+    result = Column(JSONB, nullable=True)
+
+    created_at = Column(
+        TIMESTAMP,
+        server_default=func.current_timestamp(),
+        nullable=False,
+    )
+
+    updated_at = Column(
+        TIMESTAMP,
+        server_default=func.current_timestamp(),
+        onupdate=func.current_timestamp(),
+        nullable=False,
+    )
+
+    __table_args__ = (
+        Index("ix_jobs_status_run_after", "status", "run_after"),
+        # At most one pending job per key; enqueue_job relies on it (see migration 005)
+        Index(
+            "uq_jobs_dedupe_key_pending",
+            "dedupe_key",
+            unique=True,
+            postgresql_where=text("status IN ('queued', 'running')"),
+        ),
+    )
+
+
+class LLMReply(Base):
+    __tablename__ = "llm_replies"
+
+    # sha256 of the normalized word and context, model, temperature and prompt version
+    key = Column(String(64), primary_key=True)
+
+    model = Column(String(100), nullable=False)
+    prompt_version = Column(String(50), nullable=False)
+
+    # The parsed reply, as returned by the LLM
+    reply = Column(JSONB, nullable=False)
+    size_bytes = Column(Integer, nullable=False)
+    hits = Column(Integer, nullable=False, default=0, server_default="0")
+
+    created_at = Column(
+        TIMESTAMP,
+        server_default=func.current_timestamp(),
+        nullable=False,
+    )
+
+    last_used_at = Column(
+        TIMESTAMP,
+        server_default=func.current_timestamp(),
+        nullable=False,
+    )
+
+    __table_args__ = (
+        Index("ix_llm_replies_last_used_at", "last_used_at"),
+    )
+
+
+class PrewarmRun(Base):
+    __tablename__ = "prewarm_runs"
+
+    id = Column(Integer, primary_key=True)
+
+    # Runs are resumed by name
+    name = Column(String(100), nullable=False, unique=True)
+    source = Column(String(1024), nullable=True)
+    voice_id = Column(String(100), nullable=False)
+
+    # Provider usage so far, across every session of the run
+    openai_input_tokens = Column(Integer, nullable=False, default=0, server_default="0")
+    openai_output_tokens = Column(Integer, nullable=False, default=0, server_default="0")
+    eleven_labs_characters = Column(Integer, nullable=False, default=0, server_default="0")
+
+    created_at = Column(
+        TIMESTAMP,
+        server_default=func.current_timestamp(),
+        nullable=False,
+    )
+
+    updated_at = Column(
+        TIMESTAMP,
+        server_default=func.current_timestamp(),
+        onupdate=func.current_timestamp(),
+        nullable=False,
+    )
+
+
+class PrewarmItem(Base):
+    __tablename__ = "prewarm_items"
+
+    id = Column(Integer, primary_key=True)
+
+    run_id = Column(
+        Integer,
+        ForeignKey("prewarm_runs.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+
+    word = Column(CITEXT, nullable=False)
+
+    # Position in the frequency list, most frequent first
+    rank = Column(Integer, nullable=False)
+
+    # pending / running / done / failed
+    status = Column(String(20), nullable=False, default="pending", server_default="pending")
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    last_error = Column(Text, nullable=True)
+
+    # What this run had to create for the word (False when it was already there)
+    created_translation = Column(Boolean, nullable=True)
+    created_word_audio = Column(Boolean, nullable=True)
+    created_usage_audio = Column(Integer, nullable=True)
+
+    updated_at = Column(
+        TIMESTAMP,
+        server_default=func.current_timestamp(),
+        onupdate=func.current_timestamp(),
+        nullable=False,
+    )
+
+    __table_args__ = (
+        UniqueConstraint("run_id", "word", name="uq_prewarm_items_run_word"),
+        Index("ix_prewarm_items_run_status_rank", "run_id", "status", "rank"),
+    )
@@ -0,0 +1,206 @@
+import re
+from typing import Iterable, Iterator
+from pydantic import BaseModel
+from sqlalchemy import update, func
+from sqlalchemy.future import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from .models import PrewarmRun, PrewarmItem
+
+#Checkpoints for the pre-warm CLI (services/prewarm.py): one row per word of a run, claimed with
+#SKIP LOCKED like the job queue, so a run can be stopped and resumed at any point.
+
+ITEM_PENDING = "pending"
+ITEM_RUNNING = "running"
+ITEM_DONE = "done"
+ITEM_FAILED = "failed"
+
+REGISTER_CHUNK = 5000
+
+
+class ClaimedItem(BaseModel):
+    id: int
+    word: str
+    attempts: int
+
+
+def read_frequency_list(path: str, limit: int | None = None) -> Iterator[tuple[int, str]]:
+    """
+    Yield (rank, word) from a frequency list, one word per line, most frequent first. Anything after
+    the first whitespace or comma (e.g. a count) is ignored, as are blank lines, '#' comments,
+    repeats and entries that are not a single English word.
+    """
+    seen = set()
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            fields = re.split(r"[\s,]+", line.strip(), maxsplit=1)
+            word = fields[0].lower()
+            if not word or word.startswith("#") or word in seen or not re.fullmatch(r"[a-z]+", word):
+                continue
+            seen.add(word)
+            yield len(seen), word
+            if limit is not None and len(seen) >= limit:
+                return
+
+
+async def get_or_create_run(session: AsyncSession, name: str, source: str | None, voice_id: str) -> PrewarmRun:
+    stmt = pg_insert(PrewarmRun).values(name=name, source=source, voice_id=voice_id)
+    stmt = stmt.on_conflict_do_nothing(index_elements=["name"])
+    await session.execute(stmt)
+    await session.commit()
+    return (await session.execute(select(PrewarmRun).where(PrewarmRun.name == name))).scalar_one()
+
+
+async def register_words(session: AsyncSession, run_id: int, words: Iterable[tuple[int, str]]) -> int:
+    """
+    Add the words to the run in chunks, keeping the checkpoint of words it already has.
+    Returns the number of new rows.
+    """
+    added = 0
+    chunk = []
+
+    async def flush():
+        nonlocal added
+        stmt = pg_insert(PrewarmItem).values([
+            {"run_id": run_id, "rank": rank, "word": word} for rank, word in chunk
+        ]).on_conflict_do_nothing(constraint="uq_prewarm_items_run_word")
+        added += (await session.execute(stmt)).rowcount
+        await session.commit()
+        chunk.clear()
+
+    for item in words:
+        chunk.append(item)
+        if len(chunk) >= REGISTER_CHUNK:
+            await flush()
+    if chunk:
+        await flush()
+    return added
+
+
+async def reset_interrupted(session: AsyncSession, run_id: int, retry_failed: bool = False) -> int:
+    """
+    Put back words left running by a crash or Ctrl-C, and failed ones if asked.
+    """
+    statuses = [ITEM_RUNNING, ITEM_FAILED] if retry_failed else [ITEM_RUNNING]
+    stmt = (
+        update(PrewarmItem)
+        .where(PrewarmItem.run_id == run_id, PrewarmItem.status.in_(statuses))
+        .values(status=ITEM_PENDING, attempts=0 if retry_failed else PrewarmItem.attempts)
+    )
+    reset = (await session.execute(stmt)).rowcount
+    await session.commit()
+    return reset
+
+
+async def claim_items(session: AsyncSession, run_id: int, limit: int) -> list[ClaimedItem]:
+    """
+    Take the most frequent pending words with SELECT ... FOR UPDATE SKIP LOCKED.
+    """
+    next_items = (
+        select(PrewarmItem.id)
+        .where(PrewarmItem.run_id == run_id, PrewarmItem.status == ITEM_PENDING)
+        .order_by(PrewarmItem.rank)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    stmt = (
+        update(PrewarmItem)
+        .where(PrewarmItem.id.in_(next_items))
+        .values(status=ITEM_RUNNING, attempts=PrewarmItem.attempts + 1)
+        .returning(PrewarmItem.id, PrewarmItem.word, PrewarmItem.attempts)
+    )
+    rows = (await session.execute(stmt)).all()
+    await session.commit()
+    return [ClaimedItem.model_validate(row._asdict()) for row in rows]
+
+
+async def complete_item(
+    session: AsyncSession,
+    item_id: int,
+    created_translation: bool,
+    created_word_audio: bool,
+    created_usage_audio: int,
+):
+    await session.execute(
+        update(PrewarmItem)
+        .where(PrewarmItem.id == item_id)
+        .values(
+            status=ITEM_DONE,
+            last_error=None,
+            created_translation=created_translation,
+            created_word_audio=created_word_audio,
+            created_usage_audio=created_usage_audio,
+        )
+    )
+    await session.commit()
+
+
+async def fail_item(session: AsyncSession, item_id: int, error: str, retry: bool, count_attempt: bool = True):
+    """
+    Record a failure; the word is tried again later in the run unless retry is False.
+    count_attempt=False gives the attempt back (the word was only postponed, e.g. by a rate limit).
+    """
+    values = {"status": ITEM_PENDING if retry else ITEM_FAILED, "last_error": error[:2000]}
+    if not count_attempt:
+        values["attempts"] = PrewarmItem.attempts - 1
+    await session.execute(update(PrewarmItem).where(PrewarmItem.id == item_id).values(**values))
+    await session.commit()
+
+
+async def release_items(session: AsyncSession, item_ids: list[int]):
+    """
+    Hand back words claimed by a session that is stopping, without counting the attempt.
+    """
+    if not item_ids:
+        return
+    await session.execute(
+        update(PrewarmItem)
+        .where(PrewarmItem.id.in_(item_ids), PrewarmItem.status == ITEM_RUNNING)
+        .values(status=ITEM_PENDING, attempts=PrewarmItem.attempts - 1)
+    )
+    await session.commit()
+
+
+async def add_run_usage(session: AsyncSession, run_id: int, input_tokens: int, output_tokens: int, characters: int):
+    await session.execute(
+        update(PrewarmRun)
+        .where(PrewarmRun.id == run_id)
+        .values(
+            openai_input_tokens=PrewarmRun.openai_input_tokens + input_tokens,
+            openai_output_tokens=PrewarmRun.openai_output_tokens + output_tokens,
+            eleven_labs_characters=PrewarmRun.eleven_labs_characters + characters,
+        )
+    )
+    await session.commit()
+
+
+async def get_run_progress(session: AsyncSession, run_id: int) -> dict:
+    stmt = (
+        select(
+            PrewarmItem.status,
+            func.count(),
+            func.count().filter(PrewarmItem.created_translation.is_(True)),
+            func.count().filter(PrewarmItem.created_word_audio.is_(True)),
+            func.coalesce(func.sum(PrewarmItem.created_usage_audio), 0),
+        )
+        .where(PrewarmItem.run_id == run_id)
+        .group_by(PrewarmItem.status)
+    )
+    progress = {
+        "total": 0,
+        ITEM_PENDING: 0, ITEM_RUNNING: 0, ITEM_DONE: 0, ITEM_FAILED: 0,
+        "created_translations": 0, "created_word_audio": 0, "created_usage_audio": 0,
+    }
+    for status, count, translations, word_audio, usage_audio in (await session.execute(stmt)).all():
+        progress[status] = count
+        progress["total"] += count
+        progress["created_translations"] += translations
+        progress["created_word_audio"] += word_audio
+        progress["created_usage_audio"] += usage_audio
+    run = (await session.execute(select(PrewarmRun).where(PrewarmRun.id == run_id))).scalar_one()
+    progress["usage"] = {
+        "openai_input_tokens": run.openai_input_tokens,
+        "openai_output_tokens": run.openai_output_tokens,
+        "eleven_labs_characters": run.eleven_labs_characters,
+    }
+    return progress
@@ -1,10 +1,16 @@
 import boto3, os, uuid, dotenv
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config as BotoConfig
 from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse
-from typing import Optional
+from typing import Optional, AsyncIterator
 import asyncio
 import argparse
+import io
+import logging
 from pathlib import Path
+from telemetry.tracing import span
 #from ai.ai import get_image_description_name_category
 
 dotenv_file = ".env"
@@ -14,38 +20,189 @@ if os.path.isfile(dotenv_file):
 LINODE_BUCKET = os.environ.get('LINODE_BUCKET')
 LINODE_BUCKET_ACCESS_KEY = os.environ.get('LINODE_BUCKET_ACCESS_KEY') 
 LINODE_BUCKET_SECRET_KEY = os.environ.get('LINODE_BUCKET_SECRET_KEY') 
-LINODE_CLUSTER_URL = 'https://japanese-translations.nl-ams-1.linodeobjects.com' # Your specific Linode cluster URL
+LINODE_CLUSTER_URL = os.environ.get('LINODE_CLUSTER_URL', 'https://japanese-translations.nl-ams-1.linodeobjects.com') # Your specific Linode cluster URL
+
+#UPLOAD SETTINGS
+S3_UPLOAD_WORKERS = int(os.environ.get('S3_UPLOAD_WORKERS', '8'))
+#Payloads above this size go through a multipart upload (S3 minimum part size is 5MB)
+S3_MULTIPART_THRESHOLD = int(os.environ.get('S3_MULTIPART_THRESHOLD', str(8 * 1024 * 1024)))
+S3_MULTIPART_CHUNKSIZE = max(5 * 1024 * 1024, int(os.environ.get('S3_MULTIPART_CHUNKSIZE', str(8 * 1024 * 1024))))
+
+logger = logging.getLogger(__name__)
+
+
+class S3Storage:
+    """
+    A storage backend holding one boto3 client (and its connection pool) for the life of the process.
+    The blocking boto3 calls run on a bounded thread pool so the event loop stays free.
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        endpoint_url: str,
+        access_key: str | None,
+        secret_key: str | None,
+        max_workers: int = S3_UPLOAD_WORKERS,
+    ):
+        self.bucket = bucket
+        self.endpoint_url = endpoint_url
+        self.client = boto3.client(
+            "s3",
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+            endpoint_url=endpoint_url,
+            config=BotoConfig(max_pool_connections=max_workers),
+        )
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="s3-upload")
+        self.transfer_config = TransferConfig(
+            multipart_threshold=S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=S3_MULTIPART_CHUNKSIZE,
+            use_threads=False,
+        )
 
+    def storage_url(self, key: str) -> str:
+        return f"{self.endpoint_url}/{self.bucket}/{key}"
+
+    async def _run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, lambda: fn(*args, **kwargs))
+
+    async def upload(self, data: bytes, key: str, content_type: str = "audio/mpeg") -> str:
+        """
+        Upload bytes and return the public storage url. Large payloads are sent as multipart.
+        """
+        extra_args = {"ContentType": content_type, "ACL": "public-read"}
+        with span("s3.upload", provider="s3"):
+            if len(data) < S3_MULTIPART_THRESHOLD:
+                await self._run(
+                    self.client.put_object,
+                    Body=data,
+                    Bucket=self.bucket,
+                    Key=key,
+                    **extra_args,
+                )
+            else:
+                await self._run(
+                    self.client.upload_fileobj,
+                    io.BytesIO(data),
+                    self.bucket,
+                    key,
+                    ExtraArgs=extra_args,
+                    Config=self.transfer_config,
+                )
+        logger.debug("uploaded object", extra={"key": key, "size_bytes": len(data)})
+        return self.storage_url(key)
+
+    async def upload_stream(
+        self,
+        chunks: AsyncIterator[bytes],
+        key: str,
+        content_type: str = "audio/mpeg",
+    ) -> str:
+        """
+        Upload an async stream of chunks. Parts are sent as soon as a full part is buffered,
+        so at most one part is held in memory. Short streams fall back to a single put_object.
+        """
+        buffer = bytearray()
+        upload_id = None
+        parts = []
+
+        try:
+            async for chunk in chunks:
+                buffer.extend(chunk)
+                if len(buffer) < S3_MULTIPART_CHUNKSIZE:
+                    continue
+                if upload_id is None:
+                    response = await self._run(
+                        self.client.create_multipart_upload,
+                        Bucket=self.bucket,
+                        Key=key,
+                        ContentType=content_type,
+                        ACL="public-read",
+                    )
+                    upload_id = response["UploadId"]
+                part_number = len(parts) + 1
+                response = await self._run(
+                    self.client.upload_part,
+                    Bucket=self.bucket,
+                    Key=key,
+                    UploadId=upload_id,
+                    PartNumber=part_number,
+                    Body=bytes(buffer),
+                )
+                parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+                buffer.clear()
+
+            if upload_id is None:
+                return await self.upload(bytes(buffer), key, content_type)
+
+            if buffer:
+                part_number = len(parts) + 1
+                response = await self._run(
+                    self.client.upload_part,
+                    Bucket=self.bucket,
+                    Key=key,
+                    UploadId=upload_id,
+                    PartNumber=part_number,
+                    Body=bytes(buffer),
+                )
+                parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+
+            await self._run(
+                self.client.complete_multipart_upload,
+                Bucket=self.bucket,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+        except BaseException:
+            if upload_id is not None:
+                await self._run(
+                    self.client.abort_multipart_upload,
+                    Bucket=self.bucket,
+                    Key=key,
+                    UploadId=upload_id,
+                )
+            raise
+        return self.storage_url(key)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+_storage: S3Storage | None = None
+
+
+def get_storage() -> S3Storage:
+    """
+    Return the process-wide storage backend, creating it on first use.
+    """
+    global _storage
+    if _storage is None:
+        _storage = S3Storage(
+            bucket=LINODE_BUCKET,
+            endpoint_url=LINODE_CLUSTER_URL,
+            access_key=LINODE_BUCKET_ACCESS_KEY,
+            secret_key=LINODE_BUCKET_SECRET_KEY,
+        )
+    return _storage
 
-async def upload_to_s3(upload_file_data, upload_file_name):
-    AWS_ACCESS_KEY_ID=LINODE_BUCKET_ACCESS_KEY
-    AWS_SECRET_ACCESS_KEY=LINODE_BUCKET_SECRET_KEY
-    AWS_STORAGE_BUCKET_NAME=LINODE_BUCKET
 
-    print(AWS_STORAGE_BUCKET_NAME)
-    print(AWS_SECRET_ACCESS_KEY)
-    print(AWS_ACCESS_KEY_ID)
+def close_storage():
+    global _storage
+    if _storage is not None:
+        _storage.close()
+        _storage = None
 
-    storage_url = "This will be a storage url"
-    #TRANSFER TO STORAGE
-    linode_obj_config = {
-        "aws_access_key_id":AWS_ACCESS_KEY_ID,
-        "aws_secret_access_key": AWS_SECRET_ACCESS_KEY,
-        "endpoint_url": LINODE_CLUSTER_URL,
-    }
 
-    client = boto3.client("s3", **linode_obj_config)
+async def upload_to_s3(upload_file_data, upload_file_name):
+    storage = get_storage()
     try:
-      response = client.put_object(Body=upload_file_data,  
-                                Bucket=AWS_STORAGE_BUCKET_NAME,
-                                Key=upload_file_name,
-                                ContentType="audio/mpeg",  # Set Content-Type for PNG images
-                                ACL="public-read"  # Set ACL to public-read
-                            )
-      print("S3 Upload Response", response)
+        storage_url = await storage.upload(upload_file_data, upload_file_name)
     except Exception as e:
-      print('File upload failed', e)
-    storage_url = f"{LINODE_CLUSTER_URL}/{AWS_STORAGE_BUCKET_NAME}/{upload_file_name}"
+        logger.error("upload failed", extra={"key": upload_file_name, "error": str(e)})
+        storage_url = storage.storage_url(upload_file_name)
     return storage_url
 
 # # Changed to a synchronous function as requested.
@@ -173,6 +330,7 @@ async def main(filename: str):
 
     # Move to storage
     storage_url = await upload_to_s3(audio_data,filename)
+    close_storage()
     print("UPLOADED: ", storage_url)
 
 
@@ -0,0 +1,87 @@
+import math
+import os
+import re
+import zlib
+import dotenv
+from collections import Counter
+from typing import Iterable, TypeVar
+
+# #LOAD ENVIRONMENT
+dotenv_file = ".env"
+if os.path.isfile(dotenv_file):
+    dotenv.load_dotenv(dotenv_file)
+
+#SENSE MATCHING PARAMS
+#Lowest cosine similarity between a request's context and a stored sense for the sense to be reused
+SENSE_MATCH_THRESHOLD = float(os.environ.get("SENSE_MATCH_THRESHOLD", "0.15"))
+SENSE_VECTOR_DIMS = 1 << 18
+
+#Words that say nothing about which sense is meant
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have he her his i in is it its me my of on or our she so that the their
+them they this to was we were with you your
+""".split())
+
+T = TypeVar("T")
+
+
+def sense_tokens(text: str, word: str = "") -> list[str]:
+    word = word.lower()
+    return [
+        token for token in re.findall(r"[a-z0-9]+", (text or "").lower())
+        if token not in STOPWORDS and token != word
+    ]
+
+
+def sense_vector(text: str, word: str = "") -> dict[int, float]:
+    """
+    Hashed bag of words plus character trigrams of each word (so "rivers" still matches
+    "river"), L2 normalized. crc32 keeps the hashes stable across processes.
+    """
+    features = Counter()
+    for token in sense_tokens(text, word):
+        features[zlib.crc32(b"w:" + token.encode()) % SENSE_VECTOR_DIMS] += 1.0
+        padded = f"#{token}#"
+        for i in range(len(padded) - 2):
+            features[zlib.crc32(b"c:" + padded[i:i + 3].encode()) % SENSE_VECTOR_DIMS] += 0.5
+    norm = math.sqrt(sum(value * value for value in features.values()))
+    if not norm:
+        return {}
+    return {index: value / norm for index, value in features.items()}
+
+
+def cosine(a: dict[int, float], b: dict[int, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(value * b.get(index, 0.0) for index, value in a.items())
+
+
+def sense_signature(stored_context: str | None, usage_examples: Iterable[str]) -> str:
+    """
+    What a stored sense is about: the context it was created for and its English usage examples.
+    """
+    return " ".join([stored_context or "", *usage_examples])
+
+
+def choose_sense(word: str, context: str | None, senses: list[tuple[T, str | None, list[str]]]) -> T | None:
+    """
+    Pick the stored sense for a request. senses are (sense, stored context, English usage examples)
+    in creation order. Without a context the sense created without one (the most common meaning)
+    is used, or failing that the first. With one, the closest sense is used if it scores at least
+    SENSE_MATCH_THRESHOLD; None means no sense fits and the LLM should be asked.
+    """
+    if not senses:
+        return None
+    query = sense_vector(context or "", word)
+    if not query:
+        for sense, stored_context, _ in senses:
+            if not sense_tokens(stored_context or "", word):
+                return sense
+        return senses[0][0]
+
+    best, best_score = None, 0.0
+    for sense, stored_context, usage_examples in senses:
+        score = cosine(query, sense_vector(sense_signature(stored_context, usage_examples), word))
+        if score > best_score:
+            best, best_score = sense, score
+    return best if best_score >= SENSE_MATCH_THRESHOLD else None
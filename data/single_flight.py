@@ -0,0 +1,81 @@
+import asyncio
+import hashlib
+import os
+import dotenv
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Hashable
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from .db import DATABASE_URL
+
+# #LOAD ENVIRONMENT
+dotenv_file = ".env"
+if os.path.isfile(dotenv_file):
+    dotenv.load_dotenv(dotenv_file)
+
+#"local" coalesces within one worker, "advisory" also takes a Postgres advisory lock
+#so concurrent generations of the same key are serialised across workers
+SINGLE_FLIGHT_MODE = os.environ.get("SINGLE_FLIGHT_MODE", "local").lower()
+#Advisory locks held at once per worker; each one holds its own connection outside the pool
+SINGLE_FLIGHT_MAX_LOCKS = int(os.environ.get("SINGLE_FLIGHT_MAX_LOCKS", "10"))
+
+#Lock connections do not come from the app's pool: the generation a lock guards opens its own sessions,
+#and a burst of misses holding every pooled connection for its lock would leave none for the work itself
+lock_engine = create_async_engine(DATABASE_URL, poolclass=NullPool)
+_lock_slots = asyncio.Semaphore(SINGLE_FLIGHT_MAX_LOCKS)
+
+
+def advisory_lock_key(key: Hashable) -> int:
+    """
+    Map a key to the signed 64 bit integer Postgres advisory locks take.
+    """
+    digest = hashlib.sha256(repr(key).encode()).digest()
+    return int.from_bytes(digest[:8], "big", signed=True)
+
+
+@asynccontextmanager
+async def pg_advisory_lock(key: Hashable):
+    """
+    Hold a session-level advisory lock on a dedicated, unpooled connection for the duration of the block.
+    At most SINGLE_FLIGHT_MAX_LOCKS are held at once, later callers wait without holding a connection.
+    """
+    lock_key = advisory_lock_key(key)
+    async with _lock_slots, lock_engine.connect() as conn:
+        await conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": lock_key})
+        try:
+            yield
+        finally:
+            await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": lock_key})
+            await conn.commit()
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key onto one in-flight task.
+    The task is shielded, so a caller disconnecting does not cancel the work for the others.
+    """
+
+    def __init__(self, mode: str = SINGLE_FLIGHT_MODE):
+        self.mode = mode
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        self.coalesced = 0
+
+    async def _run(self, key: Hashable, fn: Callable[[], Awaitable[Any]]):
+        if self.mode == "advisory":
+            async with pg_advisory_lock(key):
+                return await fn()
+        return await fn()
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._run(key, fn))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def get_stats(self) -> dict:
+        return {"mode": self.mode, "in_flight": len(self._inflight), "coalesced": self.coalesced}
@@ -1,40 +1,129 @@
 #from typing import Union, List
-from fastapi import FastAPI, Depends, HTTPException, Header, Query, status
-from pydantic import BaseModel, HttpUrl
+from fastapi import FastAPI, Depends, HTTPException, Header, Query, Request, status
+from pydantic import BaseModel, HttpUrl, Field
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
-from typing import Optional, List
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
+from typing import Optional, List, Literal
 #from data.actions import get_or_add_user
 import os, requests, dotenv, base64, json
 from uvicorn import Config, Server
-from data.db import engine
-from data.s3_storage import upload_to_s3
+from data.db import SessionLocal, get_session, get_pool_stats
+from data.cache import translation_cache, shared_translation_cache
+from data.single_flight import SingleFlight
+from data.bundle import BundleHolder
+from data.jobs import (
+    JOB_WORKERS,
+    JobResponse,
+    JobWorkerPool,
+    PermanentJobError,
+    enqueue_job,
+    get_job,
+)
+from data.s3_storage import get_storage, close_storage
+from data.llm_cache import llm_cache_key, normalize_text
 import asyncio
+import httpx
+from openai import APIError as OpenAIAPIError, RateLimitError as OpenAIRateLimitError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import sessionmaker
 from data.db_actions import (
     TranslationResponse,
-    TranslationAudioResponse,
     TranslationWithAudioResponse,
     LinkResponse,
-    insert_translation,
-    insert_translation_audio,
     get_translation_with_audio_by_word,
-    get_translation_with_audio_by_id,
-    get_usages_by_translation_id,
-    add_usage_audio,
-    get_existing_audio_for_usage,
+    fetch_translation_response_with_etag,
+    get_translation_etag,
+    get_usages_with_audio_by_translation_id,
+    get_translations_by_words,
+    insert_translations_bulk,
+    SearchResult,
+    search_translations,
+    TranslationPage,
+    list_translations,
+    stream_translation_payloads,
+)
+from services.translation import (
+    llm_reply_cache,
+    generate_translation,
+    get_word_audio,
+    generate_word_audio,
+    generate_usage_audio,
 )
 from authentication.auth import get_api_key
-from ai.generate_audio import get_audio_from_eleven_labs, ElevenLabsAPIError
-from ai.translate_eng_jap import ai_translate_eng_word_to_jap
-import uuid
+from telemetry.logs import configure_logging
+from telemetry.metrics import REGISTRY, REQUEST_DURATION, DB_POOL_CONNECTIONS
+from telemetry.tracing import TRACE_SERVER_TIMING, span, start_trace
+from ai.generate_audio import (
+    eleven_labs_provider,
+    get_eleven_labs_client,
+    close_eleven_labs_client,
+    ElevenLabsAPIError,
+)
+from ai.rate_limit import (
+    ProviderRateLimited,
+    retry_after_header,
+    openai_limiter,
+    eleven_labs_limiter,
+)
+from ai.resilience import ProviderUnavailable, InvalidReplyError
+from ai.translate_eng_jap import (
+    API_KEY as OPENAI_API_KEY,
+    ai_translate_eng_words_to_jap,
+    openai_provider,
+    OPENAI_MODEL,
+    OPENAI_TEMPERATURE,
+    BATCH_PROMPT_VERSION,
+    get_openai_client,
+    close_openai_client,
+)
 import re
-from pathlib import Path
+import time
+import logging
+from datetime import datetime
+from contextlib import asynccontextmanager
 #import bleach
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    #Shared clients are created once per worker and reused by every request
+    if OPENAI_API_KEY:
+        get_openai_client()
+    get_eleven_labs_client()
+    get_storage()
+    vocab_bundle.load()
+    vocab_bundle.start()
+    await shared_translation_cache.start()
+    if JOB_WORKERS > 0:
+        job_workers.start()
+    llm_reply_cache.start()
+    yield
+    await llm_reply_cache.stop()
+    await job_workers.stop()
+    await close_openai_client()
+    await close_eleven_labs_client()
+    close_storage()
+    await vocab_bundle.stop()
+    vocab_bundle.close()
+    await shared_translation_cache.close()
+
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+app = FastAPI(lifespan=lifespan)
+
+#Read-only snapshot of hot words, reloaded when VOCAB_BUNDLE_PATH is replaced
+vocab_bundle = BundleHolder()
+#Every invalidation this worker sees, its own writes and other workers' through the shared cache, overrides the bundle
+translation_cache.add_listener(vocab_bundle.invalidate)
+
+#In-flight translation generations keyed by (word, voice_id)
+translation_flights = SingleFlight()
+
+#Workers for queued audio generation, keyed by job kind (handlers are defined further down)
+job_workers = JobWorkerPool({
+    "translation_audio": lambda payload: run_translation_audio_job(payload),
+})
 #basedir = os.path.abspath(os.path.dirname(__file__))
 
 
@@ -47,8 +136,70 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Server-Timing"],
 )
 
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """
+    Time every request and collect the spans of its stages into one trace.
+    """
+    with start_trace(f"{request.method} {request.url.path}") as trace:
+        response = await call_next(request)
+        #Label by endpoint function rather than path, so ids in the path don't explode the series
+        endpoint = request.scope.get("endpoint")
+        REQUEST_DURATION.observe(
+            trace.elapsed(),
+            method=request.method,
+            endpoint=endpoint.__name__ if endpoint else "unmatched",
+            status=response.status_code,
+        )
+        if TRACE_SERVER_TIMING and trace.spans:
+            response.headers["Server-Timing"] = trace.server_timing()
+    return response
+
+
+@app.exception_handler(ProviderRateLimited)
+async def provider_rate_limited(request: Request, exc: ProviderRateLimited):
+    #Our own limiter shed the call: tell the client when to come back instead of queueing it
+    return JSONResponse(
+        status_code=429,
+        content={"detail": f"Too many requests to {exc.provider}, try again later."},
+        headers={"Retry-After": retry_after_header(exc.retry_after)},
+    )
+
+
+@app.exception_handler(OpenAIRateLimitError)
+async def openai_rate_limited(request: Request, exc: OpenAIRateLimitError):
+    retry_after = exc.response.headers.get("retry-after") if exc.response is not None else None
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "Too many requests to openai, try again later."},
+        headers={"Retry-After": retry_after or "1"},
+    )
+
+
+@app.exception_handler(ProviderUnavailable)
+async def provider_unavailable(request: Request, exc: ProviderUnavailable):
+    #The provider's circuit is open: fail fast rather than wait on calls that keep failing
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"{exc.provider} is unavailable, try again later."},
+        headers={"Retry-After": retry_after_header(exc.retry_after)},
+    )
+
+
+@app.exception_handler(InvalidReplyError)
+async def openai_invalid_reply(request: Request, exc: InvalidReplyError):
+    return JSONResponse(status_code=502, content={"detail": "The translation service returned an invalid reply."})
+
+
+@app.exception_handler(OpenAIAPIError)
+async def openai_failed(request: Request, exc: OpenAIAPIError):
+    #Still failing after the retries in openai_provider
+    return JSONResponse(status_code=502, content={"detail": "The translation service failed, try again later."})
+
 # del os.environ["GL_CLIENT_REDIRECT_URI"]
 # del os.environ["FB_CLIENT_REDIRECT_URI"]
 # del os.environ["X_REDIRECT_URI"]
@@ -71,6 +222,17 @@ if os.path.isfile(dotenv_file):
 #     audio: TranslationAudioResponse
 
 
+#BATCH SETTINGS
+BATCH_MAX_WORDS = int(os.environ.get("BATCH_MAX_WORDS", "1000"))
+#Words packed into one LLM prompt, and prompts in flight at once per batch request
+BATCH_PROMPT_SIZE = int(os.environ.get("BATCH_PROMPT_SIZE", "20"))
+BATCH_LLM_CONCURRENCY = int(os.environ.get("BATCH_LLM_CONCURRENCY", "4"))
+
+#HTTP CACHING
+#Cache-Control sent with /gettranslation; clients and the CDN revalidate with If-None-Match afterwards
+GETTRANSLATION_CACHE_CONTROL = os.environ.get("GETTRANSLATION_CACHE_CONTROL", "public, max-age=60, stale-while-revalidate=300")
+
+
 #INPUT MODELS
 
 class InputWord(BaseModel):
@@ -83,200 +245,487 @@ class InputTranslationIdToVoice(BaseModel):
     voice_id : Optional[str] = None
 
 
+def audio_error_response(error: BaseException, voice_id: str) -> HTTPException:
+    """
+    Map a failed audio generation to what the client sees: upstream rate limits become 429 with
+    Retry-After so clients back off, an open circuit 503, an unknown voice 404, provider
+    failures that outlasted the retries 502, anything else 400.
+    """
+    if isinstance(error, ProviderUnavailable):
+        return HTTPException(status_code=503, detail="elevenlabs is unavailable, try again later.", headers={"Retry-After": retry_after_header(error.retry_after)})
+    if isinstance(error, ProviderRateLimited):
+        return HTTPException(status_code=429, detail="Too many requests to elevenlabs, try again later.", headers={"Retry-After": retry_after_header(error.retry_after)})
+    if isinstance(error, ElevenLabsAPIError) and error.status_code == 429:
+        return HTTPException(status_code=429, detail="Too many requests to elevenlabs, try again later.", headers={"Retry-After": retry_after_header(error.retry_after or 1)})
+    if isinstance(error, ElevenLabsAPIError) and error.status_code == 404:
+        return HTTPException(status_code=404, detail=f"A voice with the voice id ${voice_id} was not found.")
+    if (isinstance(error, ElevenLabsAPIError) and error.status_code >= 500) or isinstance(error, httpx.TransportError):
+        return HTTPException(status_code=502, detail="The audio service failed, try again later.")
+    return HTTPException(status_code=400, detail="An error occurred generating the audio.")
+
+
+async def generate_translation_with_audio(word: str, context: str, voice_id: str) -> TranslationWithAudioResponse:
+    """
+    Translate the word, generate its audio and store both. A sense that fits the context but has
+    no audio yet only gets the audio. Runs once per (word, context, voice_id) however many
+    requests are waiting on it.
+    """
+    #Another request (or worker) may have finished the same word while this one waited
+    with span("db.recheck_translation"):
+        async with SessionLocal() as session:
+            translation, audio = await get_translation_with_audio_by_word(session,word,context)
+        if translation and audio:
+            return TranslationWithAudioResponse(
+                translation=translation,
+                audio=audio
+            )
+
+    if translation:
+        #The sense fits the context but has no audio yet
+        inserted_translation, existing_audio = translation, None
+    else:
+        inserted_translation, inserted = await generate_translation(word, context)
+        #The reply can resolve to a stored sense, which may already be voiced
+        existing_audio = None if inserted else await get_word_audio(inserted_translation.id, voice_id)
+    if existing_audio:
+        return TranslationWithAudioResponse(
+            translation=inserted_translation,
+            audio=existing_audio
+        )
+
+    try:
+        inserted_audio_file = await generate_word_audio(inserted_translation.id,inserted_translation.reading,voice_id)
+    except ElevenLabsAPIError as elae:
+        logger.warning("elevenlabs error", extra={"word": word, "voice_id": voice_id, "status_code": elae.status_code, "detail": elae.detail})
+        raise audio_error_response(elae, voice_id)
+    except (ProviderRateLimited, ProviderUnavailable):
+        raise
+    except httpx.TransportError as e:
+        raise audio_error_response(e, voice_id)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail="An error occurred generating the audio.")
+
+    return TranslationWithAudioResponse(
+        translation=inserted_translation,
+        audio=inserted_audio_file
+    )
+
+
+async def run_translation_audio_job(payload: dict) -> dict:
+    """
+    Job handler for audio queued by /translatewordengtojap?background=true.
+    """
+    #Already voiced, e.g. by a synchronous request for the same sense since the job was queued
+    existing_audio = await get_word_audio(payload["translation_id"], payload["voice_id"])
+    if existing_audio:
+        return existing_audio.model_dump(mode="json")
+    try:
+        audio = await generate_word_audio(payload["translation_id"],payload["reading"],payload["voice_id"])
+    except ElevenLabsAPIError as elae:
+        #A bad voice id or request will not succeed on retry, rate limits and server errors might
+        if 400 <= elae.status_code < 500 and elae.status_code != 429:
+            raise PermanentJobError(str(elae))
+        raise
+    return audio.model_dump(mode="json")
 
 
 @app.post('/translatewordengtojap', response_model=TranslationWithAudioResponse)
-async def translate_word_eng_jap(input_word : InputWord, api_key: str = Depends(get_api_key)):
+async def translate_word_eng_jap(
+    input_word : InputWord,
+    background: bool = Query(False, description="Store the translation and queue the audio, returning 202 with a job id"),
+    api_key: str = Depends(get_api_key),
+    session: AsyncSession = Depends(get_session),
+):
     #Sanatize the input
     word = input_word.word.strip().lower()
     if not re.fullmatch(r"[a-z]+", word):
         raise HTTPException(status_code=400, detail="The input needs to be a single word.")
 
-    #Check the DB first if the word already exists
-    #Setup db session
-    async_session = sessionmaker(
-        engine, class_=AsyncSession, expire_on_commit=False
-    )
+    #Check the DB first for a sense of the word that fits the context
+    with span("db.lookup_translation"):
+        translation, audio = await get_translation_with_audio_by_word(session,word,input_word.context)
+    if translation and audio:
+        return TranslationWithAudioResponse(
+            translation=translation,
+            audio=audio
+        )
+    #Return the connection to the pool while the providers are called
+    await session.close()
 
-    async with async_session() as session:
-        translation, audio = await get_translation_with_audio_by_word(session,word)
-        print("TRANSLATION AND AUDIO",translation,audio)
-        if translation and audio:
+    voice_id = input_word.voice_id if input_word.voice_id else "EXAVITQu4vr4xnSDxMaL"
+
+    if not background:
+        #Concurrent misses for the same word and context share one generation
+        return await translation_flights.do(
+            (word, normalize_text(input_word.context), voice_id),
+            lambda: generate_translation_with_audio(word, input_word.context, voice_id),
+        )
+
+    #Background mode: only the translation is produced inline, the audio is queued
+    if translation:
+        translation = TranslationResponse.model_validate(translation)
+    else:
+        translation, inserted = await translation_flights.do(
+            (word, normalize_text(input_word.context), None),
+            lambda: generate_translation(word, input_word.context),
+        )
+        #Nothing to queue when the reply resolved to a stored sense that already has this voice
+        existing_audio = None if inserted else await get_word_audio(translation.id, voice_id)
+        if existing_audio:
             return TranslationWithAudioResponse(
                 translation=translation,
-                audio=audio
+                audio=existing_audio
             )
-        
-    print("INPUT WORD: ", input_word)
-
-    #Generate the translation
-    # # 2️⃣ Create async session
-
-    translation = ai_translate_eng_word_to_jap(word, input_word.context)
-    print("Translation", translation["translation"])
 
-    #Insert into the databse
-    async with async_session() as session:
-        inserted_translation = await insert_translation(session,translation)
-
-    print("INSERTED TRANSLATION", inserted_translation)
+    async with SessionLocal() as write_session:
+        job = await enqueue_job(
+            write_session,
+            "translation_audio",
+            {"translation_id": translation.id, "reading": translation.reading, "voice_id": voice_id},
+            dedupe_key=f"translation_audio:{translation.id}:{voice_id}",
+        )
+
+    return JSONResponse(status_code=202, content={
+        "job_id": job.id,
+        "status": job.status,
+        "translation": translation.model_dump(mode="json"),
+    })
+
+
+@app.get('/jobs/{job_id}', response_model=JobResponse)
+async def get_job_status(
+    job_id: int,
+    api_key: str = Depends(get_api_key),
+    session: AsyncSession = Depends(get_session),
+):
+    job = await get_job(session, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return JobResponse.model_validate(job)
 
-    #Generate the audio file
-    BASE_DIR = Path(__file__).resolve().parent
-    audio_dir = BASE_DIR / "audio"
-    audio_dir.mkdir(exist_ok=True)
-    audio_filename = str(uuid.uuid4()) + ".mp3"
-    audio_path = audio_dir / audio_filename
+class InputBatchWord(BaseModel):
+    word : str
+    context : str = ""
+
+class InputBatch(BaseModel):
+    words : List[InputBatchWord] = Field(..., min_length=1, max_length=BATCH_MAX_WORDS)
+
+
+def ndjson_line(data: dict) -> bytes:
+    return (json.dumps(data, ensure_ascii=False) + "\n").encode()
+
+
+@app.post('/translate/batch')
+async def translate_batch(input_batch : InputBatch, api_key: str = Depends(get_api_key)):
+    """
+    Translate a list of words. Existing words are resolved in one query, the rest are sent to
+    the LLM BATCH_PROMPT_SIZE at a time and bulk inserted. Results stream back as NDJSON lines
+    as each group finishes. Audio is not generated here.
+    """
+    items = {}
+    invalid = []
+    for input_word in input_batch.words:
+        word = input_word.word.strip().lower()
+        if not re.fullmatch(r"[a-z]+", word):
+            invalid.append(input_word.word)
+            continue
+        items.setdefault(word, input_word.context)
+
+    async with SessionLocal() as session:
+        existing = await get_translations_by_words(session, list(items), items)
+        existing_responses = {
+            word: TranslationResponse.model_validate(translation)
+            for word, translation in existing.items()
+        }
+
+    misses = [(word, context) for word, context in items.items() if word not in existing_responses]
+    chunks = [misses[i:i + BATCH_PROMPT_SIZE] for i in range(0, len(misses), BATCH_PROMPT_SIZE)]
+    semaphore = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+
+    async def translate_chunk(chunk):
+        #The whole chunk holds a slot, so its cache lookup and inserts are bounded like its prompt
+        async with semaphore:
+            chunk_words = {word for word, _ in chunk}
+            cache_keys = {
+                word: llm_cache_key(word, context, OPENAI_MODEL, OPENAI_TEMPERATURE, BATCH_PROMPT_VERSION)
+                for word, context in chunk
+            }
+            cached = await llm_reply_cache.get_many(list(cache_keys.values()))
+            replies = [cached[cache_keys[word]] for word, _ in chunk if cache_keys[word] in cached]
+            uncached = [(word, context) for word, context in chunk if cache_keys[word] not in cached]
+
+            if uncached:
+                try:
+                    replies += await ai_translate_eng_words_to_jap(uncached)
+                except Exception as e:
+                    logger.error("batch translation failed", extra={"words": len(uncached), "error": str(e)})
+
+            payloads = []
+            for reply in replies:
+                if not isinstance(reply, dict) or not reply.get("translation") or not reply.get("script"):
+                    continue
+                reply_word = str(reply.get("word", "")).strip().lower()
+                if reply_word in chunk_words:
+                    payloads.append(dict(reply, word=reply_word))
+
+            stored = {cache_keys[word] for word, _ in chunk if cache_keys[word] in cached}
+            for payload in payloads:
+                if cache_keys[payload["word"]] not in stored:
+                    stored.add(cache_keys[payload["word"]])
+                    await llm_reply_cache.set(cache_keys[payload["word"]], payload, OPENAI_MODEL, BATCH_PROMPT_VERSION)
+
+            #The 200 is already sent: a failed insert becomes error lines for the chunk's words, not a cut stream
+            try:
+                async with SessionLocal() as session:
+                    inserted = await insert_translations_bulk(session, [dict(payload, context=items[payload["word"]]) for payload in payloads])
+            except Exception as e:
+                logger.error("batch insert failed", extra={"words": len(chunk), "error": repr(e)})
+                inserted = []
+            return chunk, inserted
+
+    async def stream_results():
+        for word in invalid:
+            yield ndjson_line({"word": word, "status": "error", "detail": "The input needs to be a single word."})
+        for word, translation in existing_responses.items():
+            yield ndjson_line({"word": word, "status": "existing", "translation": translation.model_dump(mode="json")})
+
+        tasks = [asyncio.create_task(translate_chunk(chunk)) for chunk in chunks]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                chunk, inserted = await next_done
+                done_words = set()
+                for translation in inserted:
+                    word = translation.word.lower()
+                    if word in done_words:
+                        continue
+                    done_words.add(word)
+                    yield ndjson_line({"word": word, "status": "created", "translation": translation.model_dump(mode="json")})
+                for word, _ in chunk:
+                    if word not in done_words:
+                        yield ndjson_line({"word": word, "status": "error", "detail": "An error occurred generating the translation."})
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
 
 
-    voice_id = input_word.voice_id if input_word.voice_id else "EXAVITQu4vr4xnSDxMaL"
-
-    try:
-        audio_file_path = await get_audio_from_eleven_labs(translation['reading'],audio_path,voice_id)
-    except ElevenLabsAPIError as elae:
-        print("ELAE", elae)
-        if elae.status_code == 404:
-            raise HTTPException(status_code=404, detail=f"A voice with the voice id ${voice_id} was not found.")
+@app.post('/getaudioforusagephrases', response_model=List[LinkResponse])
+async def get_audio_for_usage_phrases(
+    translation_id_and_voice : InputTranslationIdToVoice,
+    api_key: str = Depends(get_api_key),
+    session: AsyncSession = Depends(get_session),
+):
+    #Usages and any audio they already have, in one query
+    with span("db.lookup_usages"):
+        usages = await get_usages_with_audio_by_translation_id(session,int(translation_id_and_voice.translation_id))
+    if len(usages) < 1:
+        raise HTTPException(status_code=404, detail=f"No usages found.")
+    #Return the connection to the pool while the providers are called
+    await session.close()
+
+    voice_id_to_send = translation_id_and_voice.voice_id if translation_id_and_voice.voice_id else "EXAVITQu4vr4xnSDxMaL"
+
+    #Existing audio is reused so we don't waste tokens for Eleven LABS
+    links_by_usage = {}
+    missing = []
+    for usage in usages:
+        if usage.usage_audio:
+            links_by_usage[usage.id] = LinkResponse.model_validate({
+                "id": usage.usage_audio.id,
+                "usage_id": usage.id,
+                "storage_url": usage.usage_audio.storage_url,
+                "created_at": usage.usage_audio.created_at,
+            })
         else:
-            raise HTTPException(status_code=400, detail="An error occurred generating the audio.")
-    except Exception as e:
-        raise HTTPException(status_code=400, detail="An error occurred generating the audio.")
+            missing.append(usage)
 
-    print("GENERATED AUDIO ", audio_file_path)
+    new_links, errors = await generate_usage_audio(missing, voice_id_to_send)
+    for link in new_links:
+        links_by_usage[link.usage_id] = link
 
-    #Upload the audio file to S3 storage
-    with open(audio_file_path, "rb") as f:
-        #Get the file data required for transferring to S3
-        audio_data = f.read()
-    storage_url = await upload_to_s3(audio_data,audio_filename)
-    print("UPLOADED FILE ", storage_url)
+    for error in errors:
+        logger.warning("usage audio failed", extra={"translation_id": translation_id_and_voice.translation_id, "error": repr(error)})
+    if errors:
+        #An unknown voice outranks a rate limit, then an open circuit, then any other failure
+        responses = [audio_error_response(error, voice_id_to_send) for error in errors]
+        raise min(responses, key=lambda response: {404: 0, 429: 1, 503: 2}.get(response.status_code, 3))
 
+    return [links_by_usage[usage.id] for usage in usages if usage.id in links_by_usage]
 
-    #Update the database
-    async with async_session() as session:
-        inserted_audio_file = await insert_translation_audio(session,inserted_translation.id,storage_url,voice_id,"mp3")
-    print("INSERTED AUDIO ", inserted_audio_file)
-    response = TranslationWithAudioResponse(
-        translation=inserted_translation,
-        audio=inserted_audio_file
-    )
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    If-None-Match uses the weak comparison, so a W/ prefix added by a proxy still matches.
+    """
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or any(candidate.removeprefix("W/") == etag for candidate in candidates)
 
-    return response
 
-@app.post('/getaudioforusagephrases', response_model=List[LinkResponse])
-async def get_audio_for_usage_phrases(translation_id_and_voice : InputTranslationIdToVoice, api_key: str = Depends(get_api_key)):
-    print("TRANSLATION ID ", translation_id_and_voice.translation_id)
-    async_session = sessionmaker(
-        engine, class_=AsyncSession, expire_on_commit=False
-    )
-
-    usages_list = []
-
-    async with async_session() as session:
-        usages = await get_usages_by_translation_id(session,int(translation_id_and_voice.translation_id))
-        print("USAGES", usages)
-        if len(usages) < 1:
-            raise HTTPException(status_code=404, detail=f"No usages found.")
-        for usage in usages[0:1]:
-            print("USAGE OBJECT", usage.id, usage.ja)
-            #Set usage ID to a variable
-            usage_id = usage.id
-
-
-            #This gets the audio link if it already exists so we don't waste tokens for Eleven LABS
-
-            existing_usage = await get_existing_audio_for_usage(session,usage.id)
-            if(existing_usage):
-                # usages_list.append(LinkResponse.model_validate({
-                #     "id": existing_usage.id,
-                #     "usage_id": existing_usage.usage_id,
-                #     "audio_id": existing_usage.audio_id,
-                #     "storage_url": existing_usage.audio.storage_url,
-                #     "created_at": existing_usage.created_at,
-                # }))
-                usages_list.append(existing_usage)
-                continue
-
-            #Generate the audio file
-            BASE_DIR = Path(__file__).resolve().parent
-            audio_dir = BASE_DIR / "audio"
-            audio_dir.mkdir(exist_ok=True)
-            audio_filename = str(uuid.uuid4()) + ".mp3"
-            audio_path = audio_dir / audio_filename
-
-            voice_id_to_send = translation_id_and_voice.voice_id if translation_id_and_voice.voice_id else "EXAVITQu4vr4xnSDxMaL"
-            print("THE VOICE ID IS", voice_id_to_send)
+def translation_payload_response(payload: bytes, etag: str | None, if_none_match: str | None) -> Response:
+    """
+    The serialized translation with its caching headers, or an empty 304 when the client's copy is current.
+    """
+    headers = {"Cache-Control": GETTRANSLATION_CACHE_CONTROL}
+    if etag:
+        headers["ETag"] = etag
+        if if_none_match and etag_matches(if_none_match, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=payload, media_type="application/json", headers=headers)
 
-            try:
-                audio_file_path = await get_audio_from_eleven_labs(usage.ja,audio_path,voice_id_to_send)
-            except ElevenLabsAPIError as elae:
-                print("ELAE", elae)
-                if elae.status_code == 404:
-                    raise HTTPException(status_code=404, detail=f"A voice with the voice id ${voice_id_to_send} was not found.")
-                else:
-                    raise HTTPException(status_code=400, detail="An error occurred generating the audio.")
-            except Exception as e:
-                raise HTTPException(status_code=400, detail="An error occurred generating the audio.")
-
-            #Upload the audio file to S3 storage
-            with open(audio_file_path, "rb") as f:
-                #Get the file data required for transferring to S3
-                audio_data = f.read()
-            storage_url = await upload_to_s3(audio_data,audio_filename)
-            print("UPLOADED FILE ", storage_url)
-
-            link = await add_usage_audio(session,usage_id,storage_url,voice_id_to_send)
-            #link_obj = LinkResponse.model_validate(link)
-            print("ADDED STORAGE LINK TO DB", link.__dict__)
-            usages_list.append(LinkResponse.model_validate({
-                "id": link.id,
-                "usage_id": usage_id,
-                "storage_url": link.storage_url,
-                "created_at": link.created_at,
-            }))
-    return usages_list
 
 @app.get('/gettranslation', response_model=TranslationWithAudioResponse)
 async def get_translation_by_word_or_id(
     translation_id: int = Query(None, ge=1, description="Page number, must be >= 1"),
     word: str = Query(None, description="Page number, must be >= 1"),
+    if_none_match: Optional[str] = Header(None),
+    session: AsyncSession = Depends(get_session),
 ):
     if(not word and not translation_id):
         raise HTTPException(status_code=400,detail="translation_id or word must be included in the query parameters")
 
-    async_session = sessionmaker(
-        engine, 
-        class_=AsyncSession, expire_on_commit=False
+    #Serve straight from the in-process cache when possible
+    cached = None
+    if translation_id:
+        cached = translation_cache.get_entry_by_id(translation_id)
+    if cached is None and word:
+        cached = translation_cache.get_entry_by_word(word)
+    if cached is not None:
+        return translation_payload_response(cached.payload, cached.etag, if_none_match)
+
+    #Then the precomputed bundle of hot words, shared by all workers through mmap
+    bundled = vocab_bundle.get(translation_id=translation_id, word=word)
+    if bundled is not None:
+        return translation_payload_response(*bundled, if_none_match)
+
+    #Then the cache shared by every worker; refresh means this request should recompute the entry early
+    shared, shared_etag, refresh = await shared_translation_cache.get(translation_id=translation_id, word=word)
+    if shared is not None and not refresh:
+        return translation_payload_response(shared, shared_etag, if_none_match)
+
+    #A revalidation the caches could not answer: compare against the version query before building the body
+    if if_none_match:
+        etag = None
+        with span("db.translation_etag"):
+            if translation_id:
+                etag = await get_translation_etag(session, translation_id=translation_id)
+            if etag is None and word:
+                etag = await get_translation_etag(session, word=word)
+        if etag is not None and etag_matches(if_none_match, etag):
+            return translation_payload_response(b"", etag, if_none_match)
+    #Taken before the read, so a write that invalidates the entry meanwhile keeps the result out of the caches
+    fill_token = translation_cache.fill_token()
+    fetch_started = time.perf_counter()
+
+    #Try the id first, then the word
+    response, etag = None, None
+    by_word = False
+    with span("db.read_translation"):
+        if translation_id:
+            response, etag = await fetch_translation_response_with_etag(session, translation_id=translation_id)
+        if response is None and word:
+            response, etag = await fetch_translation_response_with_etag(session, word=word)
+            by_word = True
+
+    if response is None:
+        raise HTTPException(status_code=404,detail="Translation not found.")
+
+    payload = response.model_dump_json().encode()
+    usage_ids = tuple(usage.id for usage in response.translation.usages)
+    if translation_cache.changed_since(fill_token, response.translation.id, response.translation.word, usage_ids):
+        translation_cache.stats.stale_fills += 1
+        return translation_payload_response(payload, etag, if_none_match)
+    #Only a lookup by word knows this is the word's oldest sense; an id may be any of its senses
+    translation_cache.set(response.translation.id, response.translation.word, payload, usage_ids=usage_ids, etag=etag, index_word=by_word)
+    await shared_translation_cache.set(
+        response.translation.id,
+        response.translation.word,
+        payload,
+        usage_ids,
+        delta=time.perf_counter() - fetch_started,
+        etag=etag,
+        index_word=by_word,
     )
+    return translation_payload_response(payload, etag, if_none_match)
 
-    translation = None
-    audio = None
 
-    async with async_session() as session:
-        #Try the id first
-        if(translation_id):
-            translation, audio = await get_translation_with_audio_by_id(session,translation_id)
-            #print(translation)
-            if not translation and word:
-                #Try getting by word
-                translation, audio = await get_translation_with_audio_by_word(session,word)
+@app.get('/translations', response_model=TranslationPage)
+async def get_translations_page(
+    after_id: int = Query(0, ge=0, description="Cursor: the next_cursor of the previous page"),
+    limit: int = Query(100, ge=1, le=1000),
+    updated_since: Optional[datetime] = Query(None, description="Only translations changed at or after this time"),
+    api_key: str = Depends(get_api_key),
+    session: AsyncSession = Depends(get_session),
+):
+    return await list_translations(session, after_id, limit, updated_since)
 
-        if not translation_id and word:
-            #Try getting by word
-            translation, audio = await get_translation_with_audio_by_word(session,word)
 
-    if not translation:
-        raise HTTPException(status_code=404,detail="Translation not found.")
-    
+@app.get('/translations/export')
+async def export_translations(
+    updated_since: Optional[datetime] = Query(None, description="Only translations changed at or after this time"),
+    api_key: str = Depends(get_api_key),
+):
+    """
+    Stream every translation as NDJSON, in id order, read through a server-side cursor.
+    """
+    async def stream_lines():
+        #The session lives inside the generator so it stays open for the whole stream
+        async with SessionLocal() as session:
+            async for payload in stream_translation_payloads(session, updated_since):
+                yield payload.encode() + b"\n"
+
+    return StreamingResponse(stream_lines(), media_type="application/x-ndjson")
+
+
+@app.get('/search', response_model=List[SearchResult])
+async def search(
+    q: str = Query(..., min_length=1, max_length=100, description="Search text"),
+    mode: Literal["prefix", "fuzzy"] = Query("prefix", description="prefix for autocomplete, fuzzy for trigram similarity"),
+    field: Literal["word", "japanese"] = Query("word", description="Search the English word or the Japanese translation and reading"),
+    limit: int = Query(10, ge=1, le=50),
+    session: AsyncSession = Depends(get_session),
+):
+    return await search_translations(session, q, mode, field, limit)
 
 
-    #Create the response
-    response = TranslationWithAudioResponse(
-        translation=translation,
-        audio=audio
-    )
-    return response
+@app.get('/metrics', response_class=PlainTextResponse)
+async def get_metrics(api_key: str = Depends(get_api_key)):
+    """
+    Prometheus text format for this worker.
+    """
+    for state, value in get_pool_stats().items():
+        DB_POOL_CONNECTIONS.set(value, state=state)
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get('/stats/providers')
+async def get_provider_stats(api_key: str = Depends(get_api_key)):
+    return {
+        "openai": dict(openai_limiter.get_stats(), resilience=openai_provider.get_stats()),
+        "elevenlabs": dict(eleven_labs_limiter.get_stats(), resilience=eleven_labs_provider.get_stats()),
+    }
+
+
+@app.get('/stats/dbpool')
+async def get_db_pool_stats(api_key: str = Depends(get_api_key)):
+    return get_pool_stats()
+
+@app.get('/stats/cache')
+async def get_cache_stats(api_key: str = Depends(get_api_key)):
+    return dict(translation_cache.get_stats(), shared=shared_translation_cache.get_stats())
+
+
+@app.get('/stats/llmcache')
+async def get_llm_cache_stats(api_key: str = Depends(get_api_key)):
+    return await llm_reply_cache.get_stats()
+
+@app.get('/stats/bundle')
+async def get_bundle_stats(api_key: str = Depends(get_api_key)):
+    return vocab_bundle.get_stats()
+
 
+@app.get('/stats/singleflight')
+async def get_single_flight_stats(api_key: str = Depends(get_api_key)):
+    return translation_flights.get_stats()
 
 
 async def start_fastapi():
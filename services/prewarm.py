@@ -0,0 +1,281 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+import dotenv
+from dataclasses import dataclass, field
+from data.db import SessionLocal, engine
+from data.db_actions import get_translation_with_audio_by_word, get_usages_with_audio_by_translation_id
+from data.prewarm import (
+    ITEM_DONE,
+    ITEM_FAILED,
+    ITEM_PENDING,
+    ITEM_RUNNING,
+    ClaimedItem,
+    read_frequency_list,
+    get_or_create_run,
+    register_words,
+    reset_interrupted,
+    claim_items,
+    complete_item,
+    fail_item,
+    release_items,
+    add_run_usage,
+    get_run_progress,
+)
+from data.s3_storage import close_storage
+from ai.generate_audio import ElevenLabsAPIError, close_eleven_labs_client
+from ai.translate_eng_jap import close_openai_client
+from ai.rate_limit import ProviderRateLimited
+from ai.resilience import ProviderUnavailable
+from telemetry.metrics import OPENAI_TOKENS, ELEVEN_LABS_CHARACTERS
+from .translation import generate_translation, get_word_audio, generate_word_audio, generate_usage_audio
+
+#Pre-warm the database and bucket from a frequency list before traffic arrives: translation, word
+#audio and usage audio for every word, most frequent first. Progress is checkpointed per word in
+#prewarm_items, so the same command resumes a run after a crash or Ctrl-C, and anything already
+#stored is skipped. Provider calls go through the same rate limiters, retries and caches as the API.
+#
+#   python -m services.prewarm words.txt --name top100k --concurrency 16
+
+# #LOAD ENVIRONMENT
+dotenv_file = ".env"
+if os.path.isfile(dotenv_file):
+    dotenv.load_dotenv(dotenv_file)
+
+#COST ESTIMATE PARAMS (USD), only used for the report
+PREWARM_OPENAI_INPUT_PRICE = float(os.environ.get("PREWARM_OPENAI_INPUT_PRICE", "0.15"))  # per 1M tokens
+PREWARM_OPENAI_OUTPUT_PRICE = float(os.environ.get("PREWARM_OPENAI_OUTPUT_PRICE", "0.60"))  # per 1M tokens
+PREWARM_ELEVEN_LABS_PRICE = float(os.environ.get("PREWARM_ELEVEN_LABS_PRICE", "0.30"))  # per 1k characters
+
+DEFAULT_VOICE_ID = "EXAVITQu4vr4xnSDxMaL"
+
+logger = logging.getLogger(__name__)
+
+
+class FatalPrewarmError(Exception):
+    """
+    Retrying other words cannot help (e.g. the voice does not exist); the run stops.
+    """
+
+
+@dataclass
+class PrewarmSession:
+    """
+    This process's share of the run: what it processed and the provider usage not yet saved.
+    """
+    run_id: int
+    voice_id: str
+    word_audio: bool
+    usage_audio: bool
+    max_attempts: int
+    started: float = field(default_factory=time.monotonic)
+    processed: int = 0
+    failed: int = 0
+    in_progress: set[int] = field(default_factory=set)
+    stop: bool = False
+    fatal: str | None = None
+    usage_saved: tuple[float, float, float] = (0.0, 0.0, 0.0)
+
+
+def provider_usage() -> tuple[float, float, float]:
+    return (
+        OPENAI_TOKENS.total(kind="prompt"),
+        OPENAI_TOKENS.total(kind="completion"),
+        ELEVEN_LABS_CHARACTERS.total(),
+    )
+
+
+def estimate_cost(input_tokens: float, output_tokens: float, characters: float) -> float:
+    return (
+        input_tokens / 1_000_000 * PREWARM_OPENAI_INPUT_PRICE
+        + output_tokens / 1_000_000 * PREWARM_OPENAI_OUTPUT_PRICE
+        + characters / 1000 * PREWARM_ELEVEN_LABS_PRICE
+    )
+
+
+async def save_usage(state: PrewarmSession):
+    """
+    Add the provider usage since the last save to the run, so the cost survives a restart.
+    """
+    current = provider_usage()
+    delta = [int(now - saved) for now, saved in zip(current, state.usage_saved)]
+    if any(delta):
+        async with SessionLocal() as session:
+            await add_run_usage(session, state.run_id, *delta)
+        state.usage_saved = current
+
+
+async def prewarm_word(word: str, state: PrewarmSession) -> tuple[bool, bool, int]:
+    """
+    Fill whatever is missing for the word. Returns (created translation, created word audio,
+    usage clips created).
+    """
+    async with SessionLocal() as session:
+        translation, audio = await get_translation_with_audio_by_word(session, word)
+    created_translation = False
+    if translation is None:
+        translation, created_translation = await generate_translation(word, "")
+        if not created_translation:
+            #Stored meanwhile, e.g. by the API: only voice it if this voice is missing
+            audio = await get_word_audio(translation.id, state.voice_id)
+
+    created_word_audio = False
+    if state.word_audio and (audio is None or audio.voice_id != state.voice_id):
+        await generate_word_audio(translation.id, translation.reading, state.voice_id)
+        created_word_audio = True
+
+    created_usage_audio = 0
+    if state.usage_audio:
+        async with SessionLocal() as session:
+            usages = await get_usages_with_audio_by_translation_id(session, translation.id)
+        missing = [usage for usage in usages if not usage.usage_audio]
+        if missing:
+            links, errors = await generate_usage_audio(missing, state.voice_id)
+            created_usage_audio = len(links)
+            if errors:
+                #The clips that worked are stored, the next attempt only makes the rest
+                raise errors[0]
+
+    return created_translation, created_word_audio, created_usage_audio
+
+
+async def process_item(item: ClaimedItem, state: PrewarmSession):
+    try:
+        created = await prewarm_word(item.word, state)
+    except (ProviderRateLimited, ProviderUnavailable) as e:
+        #Not the word's fault: put it back without using an attempt and slow down
+        async with SessionLocal() as session:
+            await fail_item(session, item.id, repr(e), retry=True, count_attempt=False)
+        await asyncio.sleep(e.retry_after)
+        return
+    except Exception as e:
+        if isinstance(e, ElevenLabsAPIError) and e.status_code in (401, 404):
+            #A bad key or voice fails every word the same way: stop, and keep the word for the next run
+            state.fatal = f"ElevenLabs error {e.status_code}: {e.detail}"
+            state.stop = True
+            async with SessionLocal() as session:
+                await fail_item(session, item.id, repr(e), retry=True, count_attempt=False)
+            return
+        retry = item.attempts < state.max_attempts
+        logger.warning("prewarm word failed", extra={"word": item.word, "attempt": item.attempts, "error": repr(e)})
+        async with SessionLocal() as session:
+            await fail_item(session, item.id, repr(e), retry=retry)
+        if not retry:
+            state.failed += 1
+        return
+
+    async with SessionLocal() as session:
+        await complete_item(session, item.id, *created)
+    state.processed += 1
+
+
+async def worker(state: PrewarmSession):
+    while not state.stop:
+        async with SessionLocal() as session:
+            items = await claim_items(session, state.run_id, 1)
+        if not items:
+            return
+        item = items[0]
+        #Left in the set if cancelled, so the word is released on the way out
+        state.in_progress.add(item.id)
+        await process_item(item, state)
+        state.in_progress.discard(item.id)
+
+
+async def report_progress(state: PrewarmSession, interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        await save_usage(state)
+        async with SessionLocal() as session:
+            progress = await get_run_progress(session, state.run_id)
+        print(format_progress(progress, state), flush=True)
+
+
+def format_progress(progress: dict, state: PrewarmSession) -> str:
+    elapsed = time.monotonic() - state.started
+    rate = state.processed / elapsed if elapsed > 0 else 0.0
+    remaining = progress[ITEM_PENDING] + progress[ITEM_RUNNING]
+    eta = f"{remaining / rate / 60:.1f} min" if rate > 0 else "-"
+    usage = progress["usage"]
+    cost = estimate_cost(usage["openai_input_tokens"], usage["openai_output_tokens"], usage["eleven_labs_characters"])
+    return (
+        f"{progress[ITEM_DONE]}/{progress['total']} done, {progress[ITEM_FAILED]} failed, "
+        f"{rate:.2f} words/s, eta {eta}, "
+        f"{usage['openai_input_tokens'] + usage['openai_output_tokens']} tokens, "
+        f"{usage['eleven_labs_characters']} characters, ~${cost:.2f}"
+    )
+
+
+async def main(args):
+    async with SessionLocal() as session:
+        run = await get_or_create_run(session, args.name, args.words, args.voice_id)
+        if run.voice_id != args.voice_id:
+            print(f"Run {run.name} uses voice {run.voice_id}, resuming with it", flush=True)
+        reset = await reset_interrupted(session, run.id, retry_failed=args.retry_failed)
+        added = await register_words(session, run.id, read_frequency_list(args.words, args.limit))
+    print(f"Run {run.name}: {added} new words, {reset} resumed", flush=True)
+
+    state = PrewarmSession(
+        run_id=run.id,
+        voice_id=run.voice_id,
+        word_audio=not args.skip_word_audio,
+        usage_audio=not args.skip_usage_audio,
+        max_attempts=args.max_attempts,
+    )
+    reporter = asyncio.create_task(report_progress(state, args.report_interval))
+    try:
+        await asyncio.gather(*[worker(state) for _ in range(args.concurrency)])
+    finally:
+        reporter.cancel()
+        await asyncio.gather(reporter, return_exceptions=True)
+        #Ctrl-C or a crash: give the claimed words back and keep the usage, then the next run resumes
+        async with SessionLocal() as session:
+            await release_items(session, list(state.in_progress))
+        await save_usage(state)
+        async with SessionLocal() as session:
+            progress = await get_run_progress(session, run.id)
+        await close_openai_client()
+        await close_eleven_labs_client()
+        close_storage()
+        await engine.dispose()
+
+        usage = progress["usage"]
+        summary = dict(
+            progress,
+            run=run.name,
+            session={
+                "processed": state.processed,
+                "failed": state.failed,
+                "elapsed_s": round(time.monotonic() - state.started, 1),
+                "words_per_s": round(state.processed / max(time.monotonic() - state.started, 1e-9), 3),
+            },
+            estimated_cost_usd=round(estimate_cost(
+                usage["openai_input_tokens"], usage["openai_output_tokens"], usage["eleven_labs_characters"],
+            ), 4),
+        )
+        print(format_progress(progress, state), flush=True)
+        print(json.dumps(summary, indent=2), flush=True)
+
+    if state.fatal:
+        raise FatalPrewarmError(state.fatal)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-warm translations and audio from a frequency word list")
+    parser.add_argument("words", help="Frequency list, one word per line (extra columns are ignored)")
+    parser.add_argument("--name", default=None, help="Run name to resume; defaults to the list's file name")
+    parser.add_argument("--limit", type=int, default=None, help="Only the first N words of the list")
+    parser.add_argument("--concurrency", type=int, default=8, help="Words processed at once")
+    parser.add_argument("--voice-id", default=DEFAULT_VOICE_ID)
+    parser.add_argument("--skip-word-audio", action="store_true")
+    parser.add_argument("--skip-usage-audio", action="store_true")
+    parser.add_argument("--max-attempts", type=int, default=3, help="Attempts per word before it is marked failed")
+    parser.add_argument("--retry-failed", action="store_true", help="Try the words that failed in earlier sessions again")
+    parser.add_argument("--report-interval", type=float, default=10.0, help="Seconds between progress lines")
+
+    args = parser.parse_args()
+    args.name = args.name or os.path.splitext(os.path.basename(args.words))[0]
+    asyncio.run(main(args))
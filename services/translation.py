@@ -0,0 +1,140 @@
+import asyncio
+import logging
+from data.db import SessionLocal
+from data.single_flight import SingleFlight
+from data.s3_storage import get_storage
+from data.llm_cache import LLMReplyCache, llm_cache_key
+from data.db_actions import (
+    TranslationResponse,
+    TranslationAudioResponse,
+    LinkResponse,
+    insert_translation,
+    insert_translation_audio,
+    get_translation_audio_for_voice,
+    add_usage_audio_bulk,
+    get_audio_object_by_hash,
+    insert_audio_object,
+)
+from telemetry.tracing import span
+from ai.generate_audio import ELEVEN_LABS_MODEL_ID, audio_content_hash, get_audio_from_eleven_labs
+from ai.translate_eng_jap import (
+    ai_translate_eng_word_to_jap,
+    OPENAI_MODEL,
+    OPENAI_TEMPERATURE,
+    TRANSLATION_PROMPT_VERSION,
+    BATCH_PROMPT_VERSION,
+)
+
+#Generating and storing translations and audio, shared by the API (main.py) and the
+#pre-warm CLI (services/prewarm.py), so both go through the same caches and limiters.
+
+logger = logging.getLogger(__name__)
+
+#In-flight audio generations keyed by content hash
+audio_flights = SingleFlight(mode="local")
+
+#Raw LLM replies kept in Postgres, so a (word, context) asked before costs no tokens
+llm_reply_cache = LLMReplyCache(prompt_versions=(TRANSLATION_PROMPT_VERSION, BATCH_PROMPT_VERSION))
+
+
+async def generate_translation(word: str, context: str) -> tuple[TranslationResponse, bool]:
+    """
+    Ask the LLM for the translation, unless it was asked before, and store it with its usages.
+    Returns (translation, inserted): the reply can match a sense that is already stored.
+    """
+    cache_key = llm_cache_key(word, context, OPENAI_MODEL, OPENAI_TEMPERATURE, TRANSLATION_PROMPT_VERSION)
+    translation = await llm_reply_cache.get(cache_key)
+    if translation is None:
+        translation = await ai_translate_eng_word_to_jap(word, context)
+        await llm_reply_cache.set(cache_key, translation, OPENAI_MODEL, TRANSLATION_PROMPT_VERSION)
+    logger.debug("translated word", extra={"word": word, "translation": translation["translation"]})
+
+    #Insert into the databse, with the context so later requests can find this sense
+    with span("db.insert_translation"):
+        async with SessionLocal() as session:
+            inserted_translation, inserted = await insert_translation(session,dict(translation, context=context))
+
+    logger.info("inserted translation", extra={"word": word, "translation_id": inserted_translation.id, "inserted": inserted})
+    return inserted_translation, inserted
+
+
+async def get_word_audio(translation_id: int, voice_id: str) -> TranslationAudioResponse | None:
+    """
+    The translation's stored audio for the voice, so a sense that already has it is not voiced again.
+    """
+    with span("db.get_word_audio"):
+        async with SessionLocal() as session:
+            return await get_translation_audio_for_voice(session, translation_id, voice_id)
+
+
+async def get_or_create_audio(jap_text: str, voice_id: str) -> tuple[int, str]:
+    """
+    Return (audio_object_id, storage_url) for the text spoken by the voice. The object is keyed
+    on a hash of the text, voice, model and settings, so TTS and upload only happen the first time.
+    """
+    content_hash = audio_content_hash(jap_text, voice_id)
+
+    async def create():
+        with span("db.get_audio_object"):
+            async with SessionLocal() as session:
+                existing = await get_audio_object_by_hash(session, content_hash)
+        if existing:
+            return existing.id, existing.storage_url
+
+        #Generate the audio in memory; eleven_labs_limiter bounds the clips in flight
+        audio_data = await get_audio_from_eleven_labs(jap_text,voice_id)
+
+        #Upload errors must propagate here, a failed upload cannot be recorded as the shared object
+        storage_url = await get_storage().upload(audio_data, f"{content_hash}.mp3")
+        logger.info("uploaded audio object", extra={"content_hash": content_hash, "storage_url": storage_url})
+
+        with span("db.insert_audio_object"):
+            async with SessionLocal() as session:
+                audio_object = await insert_audio_object(
+                    session, content_hash, storage_url, voice_id, ELEVEN_LABS_MODEL_ID, "mp3", len(audio_data)
+                )
+        return audio_object.id, audio_object.storage_url
+
+    return await audio_flights.do(content_hash, create)
+
+
+async def generate_word_audio(translation_id: int, reading: str, voice_id: str) -> TranslationAudioResponse:
+    """
+    Get or generate the audio for a translation's reading and link it. ElevenLabs errors propagate.
+    """
+    audio_object_id, storage_url = await get_or_create_audio(reading, voice_id)
+
+    #Update the database
+    with span("db.insert_translation_audio"):
+        async with SessionLocal() as session:
+            inserted_audio_file = await insert_translation_audio(
+                session,translation_id,storage_url,voice_id,"mp3",audio_object_id=audio_object_id
+            )
+    logger.info("inserted translation audio", extra={"translation_id": translation_id, "audio_id": inserted_audio_file.id})
+    return inserted_audio_file
+
+
+async def generate_usage_audio(usages, voice_id: str) -> tuple[list[LinkResponse], list[BaseException]]:
+    """
+    Generate and link audio for usages that have none, concurrently. Returns the new links and
+    the errors; every clip that was generated is stored even if another one failed.
+    """
+    async def generate_one(usage):
+        #Each clip is uploaded as soon as it is generated, identical sentences reuse the stored object
+        audio_object_id, storage_url = await get_or_create_audio(usage.ja,voice_id)
+        return usage.id, storage_url, audio_object_id
+
+    results = await asyncio.gather(
+        *[generate_one(usage) for usage in usages],
+        return_exceptions=True,
+    )
+    new_links = [result for result in results if not isinstance(result, BaseException)]
+    errors = [result for result in results if isinstance(result, BaseException)]
+
+    #One transaction for all the links
+    with span("db.link_usage_audio"):
+        async with SessionLocal() as write_session:
+            links = await add_usage_audio_bulk(write_session,new_links,voice_id)
+    return links, errors
+
+
@@ -0,0 +1,72 @@
+import json
+import logging
+import os
+import dotenv
+
+# #LOAD ENVIRONMENT
+dotenv_file = ".env"
+if os.path.isfile(dotenv_file):
+    dotenv.load_dotenv(dotenv_file)
+
+#LOGGING PARAMS
+#WARNING by default, so debug and info calls stop at the level check on the hot path
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "WARNING").upper()
+#"json" for one object per line, "text" for local development
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json").lower()
+
+#Attributes every LogRecord has; anything else came in through extra= and is logged as a field
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per record with the time, level, logger, message and any extra= fields.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in RECORD_ATTRIBUTES:
+                data[key] = value
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """
+    Human-readable lines with the extra= fields appended as key=value.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = " ".join(
+            f"{key}={value!r}" for key, value in record.__dict__.items() if key not in RECORD_ATTRIBUTES
+        )
+        return f"{line} {fields}" if fields else line
+
+
+_configured = False
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT):
+    """
+    Install one handler on the root logger. Safe to call more than once.
+    """
+    global _configured
+    root = logging.getLogger()
+    root.setLevel(level)
+    if _configured:
+        return
+    handler = logging.StreamHandler()
+    if fmt == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(TextFormatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+    root.addHandler(handler)
+    _configured = True
@@ -0,0 +1,236 @@
+import threading
+from typing import Iterable
+
+#Prometheus text exposition, kept in process. Each uvicorn worker serves its own /metrics,
+#so scrape every worker (or run one worker per container) and aggregate in Prometheus.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names: Iterable[str], values: Iterable, extra: str = "") -> str:
+    parts = [f'{name}="{escape_label_value(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+
+    def render(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def total(self, **labels) -> float:
+        """
+        Sum over every label set that has the given label values.
+        """
+        wanted = {self.labelnames.index(name): str(value) for name, value in labels.items()}
+        with self._lock:
+            return sum(
+                value for key, value in self._values.items()
+                if all(key[index] == value_ for index, value_ in wanted.items())
+            )
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = dict(self._values)
+        return self.header() + [
+            f"{self.name}{format_labels(self.labelnames, key)} {format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Gauge(Metric):
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = dict(self._values)
+        return self.header() + [
+            f"{self.name}{format_labels(self.labelnames, key)} {format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        #Per label set: non-cumulative bucket counts (last one is +Inf), sum, count
+        self._values: dict[tuple, tuple[list[int], float, int]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0, 0)
+            counts[index] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = {key: (list(counts), total, count) for key, (counts, total, count) in self._values.items()}
+        lines = self.header()
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+#Durations of the named pipeline stages (DB reads and writes, provider calls, uploads)
+STAGE_DURATION = REGISTRY.register(Histogram(
+    "stage_duration_seconds",
+    "Duration of a pipeline stage.",
+    ("stage", "outcome"),
+))
+#The same external calls grouped by provider
+PROVIDER_DURATION = REGISTRY.register(Histogram(
+    "provider_request_duration_seconds",
+    "Duration of a call to an external provider.",
+    ("provider", "stage", "outcome"),
+))
+REQUEST_DURATION = REGISTRY.register(Histogram(
+    "http_request_duration_seconds",
+    "Duration of an HTTP request, by endpoint.",
+    ("method", "endpoint", "status"),
+))
+OPENAI_TOKENS = REGISTRY.register(Counter(
+    "openai_tokens_total",
+    "Tokens reported by the OpenAI usage field.",
+    ("model", "kind"),
+))
+ELEVEN_LABS_CHARACTERS = REGISTRY.register(Counter(
+    "elevenlabs_characters_total",
+    "Characters sent to ElevenLabs text to speech.",
+    ("model",),
+))
+PROVIDER_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "provider_queue_depth",
+    "Calls waiting for the provider's rate limiter.",
+    ("provider",),
+))
+PROVIDER_IN_FLIGHT = REGISTRY.register(Gauge(
+    "provider_in_flight",
+    "Calls to the provider currently running.",
+    ("provider",),
+))
+PROVIDER_QUEUE_WAIT = REGISTRY.register(Histogram(
+    "provider_queue_wait_seconds",
+    "Time a call waited in the provider's rate limiter.",
+    ("provider",),
+))
+PROVIDER_SHED = REGISTRY.register(Counter(
+    "provider_shed_total",
+    "Calls rejected by the provider's rate limiter, by bucket rate or concurrency.",
+    ("provider", "reason"),
+))
+PROVIDER_RETRIES = REGISTRY.register(Counter(
+    "provider_retries_total",
+    "Provider calls retried, by the error that caused it.",
+    ("provider", "reason"),
+))
+PROVIDER_HEDGES = REGISTRY.register(Counter(
+    "provider_hedges_total",
+    "Hedged provider calls, by which request answered first.",
+    ("provider", "winner"),
+))
+PROVIDER_CIRCUIT_OPEN = REGISTRY.register(Gauge(
+    "provider_circuit_open",
+    "1 while the provider's circuit breaker is open.",
+    ("provider",),
+))
+LLM_CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "llm_cache_lookups_total",
+    "Lookups in the persistent LLM reply cache, by hit or miss.",
+    ("result",),
+))
+DB_QUERIES = REGISTRY.register(Counter(
+    "db_queries_total",
+    "Statements sent to Postgres.",
+))
+DB_POOL_CONNECTIONS = REGISTRY.register(Gauge(
+    "db_pool_connections",
+    "SQLAlchemy connection pool state, updated on every scrape.",
+    ("state",),
+))
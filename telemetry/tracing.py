@@ -0,0 +1,103 @@
+import logging
+import os
+import time
+import dotenv
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from .metrics import STAGE_DURATION, PROVIDER_DURATION
+
+# #LOAD ENVIRONMENT
+dotenv_file = ".env"
+if os.path.isfile(dotenv_file):
+    dotenv.load_dotenv(dotenv_file)
+
+#TRACING PARAMS
+#Requests slower than this (seconds) log their spans at WARNING, the rest only at DEBUG
+TRACE_SLOW_REQUEST_SECONDS = float(os.environ.get("TRACE_SLOW_REQUEST_SECONDS", "2"))
+#Send the span durations back in a Server-Timing header
+TRACE_SERVER_TIMING = os.environ.get("TRACE_SERVER_TIMING", "false").lower() == "true"
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Span:
+    name: str
+    #Seconds since the start of the trace
+    offset: float
+    duration: float
+    outcome: str
+
+
+@dataclass
+class Trace:
+    name: str
+    started: float = field(default_factory=time.perf_counter)
+    spans: list[Span] = field(default_factory=list)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def as_dicts(self) -> list[dict]:
+        return [
+            {
+                "name": span.name,
+                "offset_ms": round(span.offset * 1000, 1),
+                "duration_ms": round(span.duration * 1000, 1),
+                "outcome": span.outcome,
+            }
+            for span in self.spans
+        ]
+
+    def server_timing(self) -> str:
+        return ", ".join(f"{span.name};dur={span.duration * 1000:.1f}" for span in self.spans)
+
+
+#The trace of the request being handled. Tasks started from it (single flight, gather) copy the
+#context, so their spans land on the same trace.
+current_trace: ContextVar[Trace | None] = ContextVar("current_trace", default=None)
+
+
+@contextmanager
+def span(name: str, provider: str | None = None):
+    """
+    Time a stage: recorded in the stage histogram, the provider histogram when it calls one,
+    and the current request's trace.
+    """
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        STAGE_DURATION.observe(duration, stage=name, outcome=outcome)
+        if provider:
+            PROVIDER_DURATION.observe(duration, provider=provider, stage=name, outcome=outcome)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.spans.append(Span(name, started - trace.started, duration, outcome))
+
+
+@contextmanager
+def start_trace(name: str):
+    """
+    Collect the spans of one request or job, then log them.
+    """
+    trace = Trace(name)
+    token = current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        current_trace.reset(token)
+        duration = trace.elapsed()
+        level = logging.WARNING if duration >= TRACE_SLOW_REQUEST_SECONDS else logging.DEBUG
+        if logger.isEnabledFor(level):
+            logger.log(level, "trace", extra={
+                "trace": trace.name,
+                "duration_ms": round(duration * 1000, 1),
+                "spans": trace.as_dicts(),
+            })
@@ -0,0 +1,52 @@
+import asyncio
+import os
+import pytest
+
+#Tests that touch Postgres need the usual DB_* settings pointing at a throwaway database with the
+#citext and pg_trgm extensions available; they are skipped otherwise. Every table is emptied before
+#each of them, so never point these settings at a database you care about.
+
+TABLES = [
+    "prewarm_items",
+    "prewarm_runs",
+    "llm_replies",
+    "jobs",
+    "translation_usage_audio",
+    "translation_audio",
+    "translation_usages",
+    "translations",
+    "audio_objects",
+]
+
+
+@pytest.fixture(scope="session")
+def database():
+    if not os.environ.get("DB_NAME"):
+        pytest.skip("needs DB_* settings pointing at a throwaway Postgres")
+    from benchmarks import schema
+    from data.db import engine
+
+    asyncio.run(schema.main())
+    return engine
+
+
+@pytest.fixture
+def run_db(database):
+    """
+    Run a coroutine against an emptied database. Pooled connections belong to the event loop that
+    opened them, so the pool is disposed before the loop closes.
+    """
+    from sqlalchemy import text
+
+    def run(coro_fn, *args):
+        async def main():
+            try:
+                async with database.begin() as conn:
+                    await conn.execute(text(f"TRUNCATE {', '.join(TABLES)} RESTART IDENTITY CASCADE"))
+                return await coro_fn(*args)
+            finally:
+                await database.dispose()
+
+        return asyncio.run(main())
+
+    return run
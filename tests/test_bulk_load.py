@@ -0,0 +1,108 @@
+import json
+from sqlalchemy import text
+from data.bulk_load import bulk_load
+from data.db import engine
+
+BANK = {
+    "word": "bank",
+    "translation": "銀行",
+    "reading": "ぎんこう",
+    "script": "kanji",
+    "context": "",
+    "usage": [{"en": "I went to the bank.", "ja": "銀行に行った。"}, {"en": "The bank is closed.", "ja": "銀行は閉まっている。"}],
+}
+
+
+def audio(url: str) -> dict:
+    return {"storage_url": url, "voice_id": "voice", "audio_format": "mp3", "created_at": "2024-01-01T00:00:00Z"}
+
+
+#An export line, with the word's audio and one usage's audio
+RIVER = {
+    "translation": {
+        "word": "river",
+        "translation": "川",
+        "reading": "かわ",
+        "script": "kanji",
+        "context": "",
+        "usages": [
+            {"en": "The river is wide.", "ja": "川は広い。", "usage_audio": audio("https://cdn.test/river-usage.mp3")},
+            {"en": "We swam in the river.", "ja": "川で泳いだ。"},
+        ],
+    },
+    "audio": audio("https://cdn.test/river.mp3"),
+}
+
+COUNTS = """
+SELECT
+    (SELECT count(*) FROM translations),
+    (SELECT count(*) FROM translation_usages),
+    (SELECT count(*) FROM translation_audio),
+    (SELECT count(*) FROM translation_usage_audio)
+"""
+
+LINKED_AUDIO = """
+SELECT t.word, ta.storage_url, tu.en, tua.storage_url
+FROM translations t
+JOIN translation_audio ta ON ta.translation_id = t.id
+JOIN translation_usages tu ON tu.translation_id = t.id
+JOIN translation_usage_audio tua ON tua.usage_id = tu.id
+ORDER BY t.word
+"""
+
+
+def write_ndjson(path, documents: list) -> str:
+    path.write_text("".join(json.dumps(document, ensure_ascii=False) + "\n" for document in documents), encoding="utf-8")
+    return str(path)
+
+
+async def counts() -> tuple:
+    async with engine.connect() as conn:
+        return tuple((await conn.execute(text(COUNTS))).one())
+
+
+def test_loading_twice_matches_the_stored_rows_and_links_audio(run_db, tmp_path):
+    #The same sense twice in one file, across batches, and a record without a translation
+    path = write_ndjson(tmp_path / "dump.ndjson", [BANK, RIVER, {**BANK, "word": "Bank"}, {"word": "empty"}])
+
+    async def scenario():
+        first = await bulk_load(path, batch_size=2)
+        after_first = await counts()
+        second = await bulk_load(path, batch_size=2)
+        after_second = await counts()
+        async with engine.connect() as conn:
+            linked = (await conn.execute(text(LINKED_AUDIO))).all()
+        return first, after_first, second, after_second, linked
+
+    first, after_first, second, after_second, linked = run_db(scenario)
+    assert (first.records, first.skipped, first.translations, first.usages) == (4, 1, 2, 4)
+    assert (first.word_audio, first.usage_audio) == (1, 1)
+    assert after_first == (2, 4, 1, 1)
+
+    assert (second.translations, second.usages, second.word_audio, second.usage_audio) == (0, 0, 0, 0)
+    assert after_second == after_first
+
+    assert [tuple(row) for row in linked] == [
+        ("river", "https://cdn.test/river.mp3", "The river is wide.", "https://cdn.test/river-usage.mp3"),
+    ]
+
+
+def test_audio_for_a_stored_translation_attaches_to_its_usages(run_db, tmp_path):
+    plain = write_ndjson(tmp_path / "plain.ndjson", [BANK])
+    usages = [{**usage, "usage_audio": audio(f"https://cdn.test/bank-{position}.mp3")} for position, usage in enumerate(BANK["usage"])]
+    voiced = write_ndjson(tmp_path / "voiced.ndjson", [{"translation": {**BANK, "usages": usages}, "audio": audio("https://cdn.test/bank.mp3")}])
+
+    async def scenario():
+        await bulk_load(plain)
+        stats = await bulk_load(voiced)
+        async with engine.connect() as conn:
+            linked = (await conn.execute(text(LINKED_AUDIO))).all()
+        return stats, await counts(), linked
+
+    stats, after, linked = run_db(scenario)
+    assert (stats.translations, stats.usages, stats.word_audio, stats.usage_audio) == (0, 0, 1, 2)
+    assert after == (1, 2, 1, 2)
+    assert sorted((row[2], row[3]) for row in linked) == [
+        ("I went to the bank.", "https://cdn.test/bank-0.mp3"),
+        ("The bank is closed.", "https://cdn.test/bank-1.mp3"),
+    ]
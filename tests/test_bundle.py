@@ -0,0 +1,144 @@
+import json
+import time
+from data.bundle import DATABASE_NOW, BundleHolder, write_bundle
+from data.db import SessionLocal
+from data.db_actions import fetch_translation_response_with_etag, insert_translation, insert_translation_audio
+
+
+def payload(translation_id: int, word: str, usage_ids: list[int]) -> bytes:
+    return json.dumps({
+        "translation": {
+            "id": translation_id,
+            "word": word,
+            "usages": [{"id": usage_id, "usage_audio": []} for usage_id in usage_ids],
+        },
+        "audio": None,
+    }).encode()
+
+
+def holder_for(tmp_path, payloads, built_at=None) -> BundleHolder:
+    path = tmp_path / "vocab.bundle"
+    write_bundle(path, [(data, b'"etag"') for data in payloads], built_at)
+    holder = BundleHolder(str(path), check_interval=0)
+    holder.load()
+    synced(holder)
+    return holder
+
+
+def synced(holder: BundleHolder, changes=()) -> BundleHolder:
+    """
+    What sync() does after reading the database, without one.
+    """
+    holder.load()
+    holder.apply_changes(holder.bundle, list(changes), time.time())
+    return holder
+
+
+def test_lookup_by_id_and_word(tmp_path):
+    holder = holder_for(tmp_path, [payload(1, "bank", [10, 11]), payload(2, "river", [20])])
+    assert json.loads(holder.get(translation_id=2)[0])["translation"]["word"] == "river"
+    assert json.loads(holder.get(word=" Bank ")[0])["translation"]["id"] == 1
+    assert holder.get(translation_id=3) is None
+    holder.close()
+
+
+def test_invalidation_overrides_every_key_of_the_entry(tmp_path):
+    holder = holder_for(tmp_path, [payload(1, "bank", [10, 11]), payload(2, "river", [20])])
+
+    #Usage writes only know the usage id
+    holder.invalidate(usage_id=11)
+    assert holder.get(translation_id=1) is None
+    assert holder.get(word="bank") is None
+    assert holder.get(translation_id=2) is not None
+
+    holder.invalidate(translation_id=2, word="river")
+    assert holder.get(word="river") is None
+    holder.close()
+
+
+def test_newer_bundle_clears_overrides_it_already_contains(tmp_path):
+    holder = holder_for(tmp_path, [payload(1, "bank", [10])])
+    holder.invalidate(translation_id=1)
+    assert holder.get(translation_id=1) is None
+
+    #Rebuilt from a snapshot taken before the write: still overridden
+    write_bundle(holder.path, [(payload(1, "bank", [10]), b'"etag"')], built_at=time.time() - 60)
+    assert synced(holder).get(translation_id=1) is None
+
+    #Rebuilt after the write
+    write_bundle(holder.path, [(payload(1, "bank", [10]), b'"etag2"')], built_at=time.time() + 1)
+    assert synced(holder).get(translation_id=1)[1] == '"etag2"'
+    holder.close()
+
+
+def test_bundle_is_not_served_before_it_is_checked_against_the_database(tmp_path):
+    path = tmp_path / "vocab.bundle"
+    write_bundle(path, [(payload(1, "bank", [10]), b'"etag"')])
+    holder = BundleHolder(str(path), check_interval=0)
+    holder.load()
+    assert holder.get(translation_id=1) is None
+    assert holder.get_stats()["unsynced_misses"] == 1
+
+    bundle = holder.bundle
+    synced(holder, [(1, time.time()), (99, time.time())])
+    #Translation 1 changed in the database after the build: not served under any of its keys
+    assert holder.get(translation_id=1) is None
+    assert holder.get(word="bank") is None
+    assert holder.get_stats()["synced"]
+
+    #Changes read for a bundle that was replaced meanwhile are not applied to the new one
+    write_bundle(path, [(payload(2, "river", [20]), b'"etag"')], built_at=time.time() + 1)
+    holder.load()
+    holder.apply_changes(bundle, [], time.time())
+    assert holder.get(translation_id=2) is None
+    holder.close()
+
+
+def test_writes_by_another_worker_override_the_bundle_after_a_sync(run_db, tmp_path):
+    path = tmp_path / "vocab.bundle"
+
+    def reply(word: str) -> dict:
+        return {"word": word, "translation": "銀行", "reading": "ぎんこう", "script": "kanji", "usage": []}
+
+    async def scenario():
+        async with SessionLocal() as session:
+            bank, _ = await insert_translation(session, reply("bank"))
+            river, _ = await insert_translation(session, reply("river"))
+        async with SessionLocal() as session:
+            built_at = (await session.execute(DATABASE_NOW)).scalar_one()
+            payloads = []
+            for translation in (bank, river):
+                response, etag = await fetch_translation_response_with_etag(session, translation_id=translation.id)
+                payloads.append((response.model_dump_json().encode(), etag.encode()))
+        write_bundle(path, payloads, built_at)
+
+        #No overlap, so only writes after the build count
+        holder = BundleHolder(str(path), check_interval=0, sync_overlap=0)
+        await holder.sync()
+        served_before = holder.get(translation_id=bank.id) is not None
+
+        #The write happens elsewhere: this holder never sees an invalidation for it
+        time.sleep(0.01)
+        async with SessionLocal() as session:
+            await insert_translation_audio(session, bank.id, "https://bucket/bank.mp3", "voice")
+        await holder.sync()
+
+        #A worker started after the write finds it on its first sync
+        restarted = BundleHolder(str(path), check_interval=0, sync_overlap=0)
+        await restarted.sync()
+        result = (
+            served_before,
+            holder.get(translation_id=bank.id),
+            holder.get(word="bank"),
+            holder.get(translation_id=river.id) is not None,
+            restarted.get(word="bank"),
+        )
+        holder.close()
+        restarted.close()
+        return result
+
+    served_before, by_id, by_word, river_served, after_restart = run_db(scenario)
+    assert served_before
+    assert by_id is None and by_word is None
+    assert river_served
+    assert after_restart is None
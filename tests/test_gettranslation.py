@@ -0,0 +1,101 @@
+import asyncio
+import httpx
+import pytest
+from data.db import SessionLocal
+from data.db_actions import insert_translation
+
+
+def reply(translation: str, reading: str) -> dict:
+    return {
+        "word": "bank",
+        "translation": translation,
+        "reading": reading,
+        "script": "kanji",
+        "context": "",
+        "usage": [{"en": f"The {translation} bank.", "ja": f"{translation}です。"}],
+    }
+
+
+@pytest.fixture
+def app():
+    import main
+
+    main.translation_cache.clear()
+    yield main
+    main.translation_cache.clear()
+
+
+def test_word_lookup_returns_the_oldest_sense_after_another_was_read_by_id(run_db, app):
+    async def scenario():
+        async with SessionLocal() as session:
+            money, _ = await insert_translation(session, reply("銀行", "ぎんこう"))
+        async with SessionLocal() as session:
+            river, _ = await insert_translation(session, reply("土手", "どて"))
+        assert river.id != money.id
+
+        transport = httpx.ASGITransport(app=app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            by_id = await client.get("/gettranslation", params={"translation_id": river.id})
+            by_word = await client.get("/gettranslation", params={"word": "bank"})
+            #Served from the cache this time
+            by_word_again = await client.get("/gettranslation", params={"word": "bank"})
+        return money.id, river.id, by_id.json(), by_word.json(), by_word_again.json()
+
+    money_id, river_id, by_id, by_word, by_word_again = run_db(scenario)
+    assert by_id["translation"]["id"] == river_id
+    assert by_word["translation"]["id"] == money_id
+    assert by_word_again["translation"]["id"] == money_id
+
+
+@pytest.mark.parametrize("if_none_match, matches", [
+    ('"v1"', True),
+    ('W/"v1"', True),
+    ('"v0", "v1"', True),
+    ('"v0",W/"v1"', True),
+    ("*", True),
+    ('"v2"', False),
+    ('"v0", "v2"', False),
+    ('W/"v2"', False),
+])
+def test_etag_matches(app, if_none_match, matches):
+    assert app.etag_matches(if_none_match, '"v1"') is matches
+
+
+def test_payload_response_is_not_modified_when_the_etag_matches(app):
+    response = app.translation_payload_response(b'{"id": 1}', '"v1"', 'W/"v1"')
+    assert response.status_code == 304
+    assert response.body == b""
+    assert response.headers["etag"] == '"v1"'
+    assert response.headers["cache-control"] == app.GETTRANSLATION_CACHE_CONTROL
+
+
+@pytest.mark.parametrize("etag, if_none_match", [('"v1"', '"v2"'), ('"v1"', None), (None, "*")])
+def test_payload_response_sends_the_body_otherwise(app, etag, if_none_match):
+    response = app.translation_payload_response(b'{"id": 1}', etag, if_none_match)
+    assert response.status_code == 200
+    assert response.body == b'{"id": 1}'
+    assert response.headers.get("etag") == etag
+
+
+def test_revalidation_returns_not_modified_from_the_cache_and_the_database(run_db, app):
+    async def scenario():
+        async with SessionLocal() as session:
+            money, _ = await insert_translation(session, reply("銀行", "ぎんこう"))
+
+        transport = httpx.ASGITransport(app=app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            first = await client.get("/gettranslation", params={"translation_id": money.id})
+            etag = first.headers["etag"]
+            cached = await client.get("/gettranslation", params={"translation_id": money.id}, headers={"If-None-Match": etag})
+            app.translation_cache.clear()
+            from_database = await client.get("/gettranslation", params={"word": "bank"}, headers={"If-None-Match": f'"stale", W/{etag}'})
+            changed = await client.get("/gettranslation", params={"translation_id": money.id}, headers={"If-None-Match": '"stale"'})
+        return etag, cached, from_database, changed
+
+    etag, cached, from_database, changed = run_db(scenario)
+    for response in (cached, from_database):
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+    assert changed.status_code == 200
+    assert changed.json()["translation"]["word"] == "bank"
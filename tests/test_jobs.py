@@ -0,0 +1,172 @@
+import asyncio
+import pytest
+from datetime import timedelta
+from sqlalchemy import select, update, func
+from data import jobs
+from data.db import SessionLocal
+from data.jobs import (
+    JOB_DEAD,
+    JOB_DONE,
+    JOB_QUEUED,
+    JOB_RUNNING,
+    claim_job,
+    complete_job,
+    enqueue_job,
+    fail_job,
+    get_job,
+    retry_delay,
+)
+from data.models import Job
+
+
+async def expire_lock(job_id: int):
+    """
+    Make a running job look like its worker died longer ago than the lock timeout.
+    """
+    async with SessionLocal() as session:
+        await session.execute(
+            update(Job)
+            .where(Job.id == job_id)
+            .values(locked_at=func.current_timestamp() - timedelta(seconds=jobs.JOB_LOCK_TIMEOUT + 60))
+        )
+        await session.commit()
+
+
+async def load(job_id: int) -> Job:
+    async with SessionLocal() as session:
+        return await get_job(session, job_id)
+
+
+def test_retry_delay_is_capped_exponential_backoff(monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_RETRY_BASE", 2.0)
+    monkeypatch.setattr(jobs, "JOB_RETRY_MAX", 30.0)
+    for attempts, ceiling in [(1, 2.0), (2, 4.0), (3, 8.0), (4, 16.0), (5, 30.0), (20, 30.0)]:
+        delays = [retry_delay(attempts) for _ in range(200)]
+        assert all(0 <= delay <= ceiling for delay in delays)
+        assert max(delays) > ceiling / 2
+
+
+def test_claim_counts_an_attempt_and_fail_backs_off(run_db):
+    async def scenario():
+        async with SessionLocal() as session:
+            queued = await enqueue_job(session, "test", {"n": 1}, max_attempts=3)
+            claimed = await claim_job(session)
+            assert claimed.id == queued.id
+            assert claimed.attempts == 1
+            #Nothing else is due while the job runs
+            assert await claim_job(session) is None
+
+            await fail_job(session, claimed, "boom")
+        job = await load(queued.id)
+        assert job.status == JOB_QUEUED
+        assert job.locked_at is None
+        assert job.last_error == "boom"
+        assert job.run_after >= job.updated_at - timedelta(seconds=1)
+
+    run_db(scenario)
+
+
+def test_fail_on_last_attempt_or_permanent_is_dead(run_db):
+    async def scenario():
+        async with SessionLocal() as session:
+            await enqueue_job(session, "test", {}, max_attempts=1)
+            await enqueue_job(session, "test", {}, max_attempts=5)
+            last = await claim_job(session)
+            await fail_job(session, last, "out of attempts")
+            permanent = await claim_job(session)
+            await fail_job(session, permanent, "bad payload", permanent=True)
+        assert (await load(last.id)).status == JOB_DEAD
+        assert (await load(permanent.id)).status == JOB_DEAD
+
+    run_db(scenario)
+
+
+def test_job_of_a_lost_worker_is_reclaimed_with_an_attempt_counted(run_db):
+    async def scenario():
+        async with SessionLocal() as session:
+            queued = await enqueue_job(session, "test", {}, max_attempts=3)
+            first = await claim_job(session)
+            #Lock still held: not handed out again
+            assert await claim_job(session) is None
+
+        await expire_lock(first.id)
+        async with SessionLocal() as session:
+            second = await claim_job(session)
+        assert second.id == queued.id
+        assert second.attempts == 2
+        assert (await load(queued.id)).status == JOB_RUNNING
+
+    run_db(scenario)
+
+
+def test_job_of_a_lost_worker_is_dead_after_max_attempts(run_db):
+    async def scenario():
+        async with SessionLocal() as session:
+            queued = await enqueue_job(session, "test", {}, max_attempts=2)
+            await claim_job(session)
+        await expire_lock(queued.id)
+        async with SessionLocal() as session:
+            assert (await claim_job(session)).attempts == 2
+        await expire_lock(queued.id)
+
+        async with SessionLocal() as session:
+            assert await claim_job(session) is None
+        job = await load(queued.id)
+        assert job.status == JOB_DEAD
+        assert job.attempts == 2
+        assert job.locked_at is None
+        assert "Lock timed out" in job.last_error
+
+    run_db(scenario)
+
+
+@pytest.mark.parametrize("status", [JOB_QUEUED, JOB_DEAD])
+def test_enqueue_dedupes_only_pending_jobs(run_db, status):
+    async def scenario():
+        async with SessionLocal() as session:
+            first = await enqueue_job(session, "test", {}, dedupe_key="word:1")
+            await session.execute(update(Job).where(Job.id == first.id).values(status=status))
+            await session.commit()
+            second = await enqueue_job(session, "test", {}, dedupe_key="word:1")
+        return first.id, second.id
+
+    first_id, second_id = run_db(scenario)
+    assert (first_id == second_id) == (status == JOB_QUEUED)
+
+
+def test_concurrent_enqueues_of_one_key_insert_one_job(run_db):
+    async def enqueue():
+        async with SessionLocal() as session:
+            return (await enqueue_job(session, "test", {}, dedupe_key="word:1")).id
+
+    async def scenario():
+        ids = await asyncio.gather(*[enqueue() for _ in range(12)])
+        async with SessionLocal() as session:
+            rows = (await session.execute(select(func.count()).select_from(Job))).scalar_one()
+        return ids, rows
+
+    ids, rows = run_db(scenario)
+    assert rows == 1
+    assert len(set(ids)) == 1
+
+
+def test_worker_whose_job_was_reclaimed_cannot_finish_it(run_db):
+    async def scenario():
+        async with SessionLocal() as session:
+            queued = await enqueue_job(session, "test", {}, max_attempts=3)
+            lost = await claim_job(session)
+        await expire_lock(queued.id)
+        async with SessionLocal() as session:
+            owner = await claim_job(session)
+
+            #The first worker comes back after its lock timed out
+            assert not await complete_job(session, lost, {"from": "lost"})
+            assert not await fail_job(session, lost, "late failure")
+            job = await load(queued.id)
+            assert (job.status, job.attempts, job.result, job.last_error) == (JOB_RUNNING, 2, None, None)
+
+            assert await complete_job(session, owner, {"from": "owner"})
+        job = await load(queued.id)
+        assert (job.status, job.result) == (JOB_DONE, {"from": "owner"})
+
+    run_db(scenario)
@@ -0,0 +1,50 @@
+import asyncio
+from sqlalchemy import event, select, text
+from data.db import SessionLocal, engine
+from data.llm_cache import LLMReplyCache
+from data.models import LLMReply
+
+
+def reply(word: str) -> dict:
+    return {"word": word, "translation": word.upper(), "reading": None, "script": "kanji", "usage": []}
+
+
+def test_get_many_is_one_statement_and_marks_the_hits_used(run_db):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    async def scenario():
+        cache = LLMReplyCache(prompt_versions=("v1",), evict_interval=0)
+        for word in ["a", "b", "c"]:
+            await cache.set(word, reply(word), "model", "v1")
+        #An expired reply is not returned
+        async with SessionLocal() as session:
+            await session.execute(text("UPDATE llm_replies SET created_at = now() - interval '1000 days' WHERE key = 'c'"))
+            await session.commit()
+
+        event.listen(engine.sync_engine, "before_cursor_execute", record)
+        try:
+            found = await cache.get_many(["a", "b", "c", "missing", "a"])
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", record)
+
+        async with SessionLocal() as session:
+            hits = dict((await session.execute(select(LLMReply.key, LLMReply.hits))).all())
+        return found, hits, cache.stats
+
+    found, hits, stats = run_db(scenario)
+    assert found == {"a": reply("a"), "b": reply("b")}
+    assert len(statements) == 1
+    assert "UPDATE llm_replies" in statements[0]
+    assert hits == {"a": 1, "b": 1, "c": 0}
+    assert (stats.hits, stats.misses) == (2, 2)
+
+
+def test_get_many_without_keys_or_disabled_touches_nothing():
+    async def scenario():
+        assert await LLMReplyCache(prompt_versions=("v1",)).get_many([]) == {}
+        assert await LLMReplyCache(prompt_versions=("v1",), enabled=False).get_many(["a"]) == {}
+
+    asyncio.run(scenario())
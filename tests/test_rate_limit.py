@@ -0,0 +1,130 @@
+import asyncio
+import pytest
+from types import SimpleNamespace
+from ai import rate_limit
+from ai.rate_limit import ProviderLimiter, ProviderRateLimited, TokenBucket, retry_after_header
+
+
+class Clock:
+    """
+    Stands in for time.monotonic in ai.rate_limit; the event loop keeps the real clock.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(rate_limit, "time", SimpleNamespace(monotonic=clock))
+    return clock
+
+
+def test_bucket_refills_at_its_rate_up_to_capacity(clock):
+    bucket = TokenBucket(rate=2.0, capacity=10.0)
+    bucket.take(10)
+    assert bucket.current_level() == 0
+    assert bucket.wait_time(6) == pytest.approx(3.0)
+
+    clock.now += 2
+    assert bucket.current_level() == pytest.approx(4.0)
+    assert bucket.wait_time(6) == pytest.approx(1.0)
+    assert bucket.wait_time(4) == 0.0
+
+    clock.now += 100
+    assert bucket.current_level() == 10.0
+    #A cost larger than the bucket only ever waits for a full bucket
+    assert bucket.wait_time(50) == 0.0
+
+
+def test_reservations_queue_below_zero_and_refunds_are_capped(clock):
+    bucket = TokenBucket(rate=1.0, capacity=4.0)
+    bucket.take(4)
+    bucket.take(2)
+    assert bucket.current_level() == -2.0
+    #The next caller waits behind the reservation already taken
+    assert bucket.wait_time(1) == pytest.approx(3.0)
+    bucket.refund(100)
+    assert bucket.current_level() == 2.0
+
+
+def test_call_is_shed_when_the_wait_exceeds_max_wait(clock):
+    async def scenario():
+        limiter = ProviderLimiter("test", {"requests": TokenBucket(rate=1.0, capacity=1.0)}, max_in_flight=0, max_wait=0.5)
+        async with limiter.acquire(requests=1):
+            pass
+        with pytest.raises(ProviderRateLimited) as shed:
+            async with limiter.acquire(requests=1):
+                pass
+        return limiter, shed.value
+
+    limiter, error = asyncio.run(scenario())
+    assert error.provider == "test"
+    assert error.retry_after == pytest.approx(1.0)
+    #The shed call took nothing from the bucket
+    assert limiter.buckets["requests"].current_level() == pytest.approx(0.0)
+    assert limiter.waiting == 0
+
+
+def test_wait_within_max_wait_is_slept_not_shed(clock, monkeypatch):
+    slept = []
+
+    async def sleep(seconds):
+        slept.append(seconds)
+
+    monkeypatch.setattr(rate_limit.asyncio, "sleep", sleep)
+
+    async def scenario():
+        limiter = ProviderLimiter("test", {"tokens": TokenBucket(rate=100.0, capacity=100.0)}, max_in_flight=0, max_wait=5)
+        async with limiter.acquire(tokens=100):
+            pass
+        async with limiter.acquire(tokens=250, unknown=1):
+            pass
+
+    asyncio.run(scenario())
+    #Costs are capped at the capacity, and names without a bucket are ignored
+    assert slept == [pytest.approx(1.0)]
+
+
+@pytest.mark.parametrize("seconds, header", [(0.0, "1"), (0.2, "1"), (1.0, "1"), (1.01, "2"), (30.0, "30")])
+def test_retry_after_is_whole_seconds_rounded_up(seconds, header):
+    assert retry_after_header(seconds) == header
+
+
+def test_in_flight_slots_queue_then_shed(clock):
+    async def scenario():
+        limiter = ProviderLimiter("test", {}, max_in_flight=2, max_wait=0.05)
+        release = asyncio.Event()
+        entered = []
+
+        async def call(name):
+            async with limiter.acquire():
+                entered.append(name)
+                await release.wait()
+
+        running = [asyncio.create_task(call(name)) for name in ("a", "b")]
+        await asyncio.sleep(0)
+        assert limiter.in_flight == 2
+
+        #No slot frees up within max_wait
+        with pytest.raises(ProviderRateLimited):
+            async with limiter.acquire():
+                pass
+        assert limiter.waiting == 0
+
+        #A queued call gets the first slot that frees up
+        limiter.max_wait = 5
+        queued = asyncio.create_task(call("c"))
+        await asyncio.sleep(0)
+        assert (limiter.waiting, entered) == (1, ["a", "b"])
+        release.set()
+        await asyncio.gather(*running, queued)
+        return limiter, entered
+
+    limiter, entered = asyncio.run(scenario())
+    assert entered == ["a", "b", "c"]
+    assert (limiter.in_flight, limiter.waiting) == (0, 0)
@@ -0,0 +1,238 @@
+import asyncio
+import httpx
+import openai
+import pytest
+from types import SimpleNamespace
+from ai import resilience
+from ai.generate_audio import ElevenLabsAPIError, eleven_labs_retry_after, is_retryable_eleven_labs_error
+from ai.resilience import CircuitBreaker, InvalidReplyError, ProviderUnavailable, ResilientProvider
+from ai.translate_eng_jap import is_retryable_openai_error, openai_retry_after
+
+
+class Clock:
+    """
+    Stands in for time.monotonic and time.perf_counter in ai.resilience.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class Flaky(Exception):
+    pass
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(resilience, "time", SimpleNamespace(monotonic=clock, perf_counter=clock))
+    return clock
+
+
+@pytest.fixture
+def sleeps(monkeypatch) -> list[float]:
+    slept = []
+
+    async def sleep(seconds):
+        slept.append(seconds)
+
+    monkeypatch.setattr(resilience.asyncio, "sleep", sleep)
+    return slept
+
+
+def provider(attempts: int = 3, failure_threshold: int = 5, **kwargs) -> ResilientProvider:
+    resilient = ResilientProvider("test", lambda error: isinstance(error, Flaky), attempts=attempts, **kwargs)
+    resilient.breaker = CircuitBreaker("test", failure_threshold=failure_threshold, reset_timeout=30)
+    return resilient
+
+
+def calls(*outcomes):
+    """
+    A fake provider call returning or raising the outcomes in order; count[0] is how often it ran.
+    """
+    count = [0]
+
+    async def fn():
+        outcome = outcomes[min(count[0], len(outcomes) - 1)]
+        count[0] += 1
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+    return fn, count
+
+
+def test_breaker_opens_after_consecutive_failures_then_half_opens(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    clock.now += 10
+    with pytest.raises(ProviderUnavailable) as unavailable:
+        breaker.before_call()
+    assert unavailable.value.retry_after == pytest.approx(20)
+
+    #One trial call at a time once the reset timeout is over
+    clock.now += 20
+    assert breaker.state == "half_open"
+    breaker.before_call()
+    with pytest.raises(ProviderUnavailable):
+        breaker.before_call()
+
+    #A failed trial opens it again for the full timeout
+    breaker.record_failure()
+    assert breaker.state == "open"
+    clock.now += 29
+    assert breaker.state == "open"
+
+    clock.now += 1
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+
+
+def test_ignored_trial_frees_the_half_open_slot(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    breaker.before_call()
+    #Cancelled, or a client error: says nothing about the provider
+    breaker.record_ignored()
+    assert breaker.state == "half_open"
+    breaker.before_call()
+
+
+def test_retryable_errors_are_retried_with_backoff(clock, sleeps):
+    async def scenario():
+        resilient = provider(attempts=3)
+        fn, count = calls(Flaky(), Flaky(), "ok")
+        assert await resilient.call(fn) == "ok"
+        return count[0], resilient
+
+    count, resilient = asyncio.run(scenario())
+    assert count == 3
+    assert len(sleeps) == 2
+    assert all(0 <= delay <= resilience.PROVIDER_RETRY_MAX for delay in sleeps)
+    #The success reset the failure count
+    assert resilient.breaker.failures == 0
+
+
+def test_retries_stop_after_the_last_attempt(clock, sleeps):
+    async def scenario():
+        fn, count = calls(Flaky())
+        with pytest.raises(Flaky):
+            await provider(attempts=3).call(fn)
+        return count[0]
+
+    assert asyncio.run(scenario()) == 3
+    assert len(sleeps) == 2
+
+
+def test_other_errors_are_raised_at_once_and_do_not_count_against_the_provider(clock, sleeps):
+    async def scenario():
+        resilient = provider(attempts=3, failure_threshold=1)
+        fn, count = calls(ValueError("bad voice"))
+        with pytest.raises(ValueError):
+            await resilient.call(fn)
+        return count[0], resilient.breaker.state
+
+    assert asyncio.run(scenario()) == (1, "closed")
+    assert sleeps == []
+
+
+def test_retry_after_sets_the_minimum_delay(clock, sleeps):
+    async def scenario():
+        resilient = provider(attempts=2, retry_after=lambda error: 3.0)
+        fn, _ = calls(Flaky(), "ok")
+        await resilient.call(fn)
+
+    asyncio.run(scenario())
+    assert sleeps == [pytest.approx(3.0)]
+
+
+def test_open_circuit_fails_fast_without_calling(clock, sleeps):
+    async def scenario():
+        resilient = provider(attempts=1, failure_threshold=2)
+        fn, count = calls(Flaky())
+        for _ in range(2):
+            with pytest.raises(Flaky):
+                await resilient.call(fn)
+        with pytest.raises(ProviderUnavailable):
+            await resilient.call(fn)
+        return count[0], resilient.get_stats()["circuit"]
+
+    assert asyncio.run(scenario()) == (2, "open")
+
+
+def test_slow_call_is_hedged_and_the_loser_cancelled(clock, monkeypatch):
+    monkeypatch.setattr(resilience, "PROVIDER_HEDGE_MIN_DELAY", 0.01)
+
+    async def scenario():
+        resilient = provider(hedge=True)
+        resilient.latency.samples.extend([0.001] * resilience.PROVIDER_HEDGE_MIN_SAMPLES)
+        started = []
+        cancelled = asyncio.Event()
+
+        async def fn():
+            started.append(len(started))
+            if len(started) == 1:
+                #The first request hangs until the hedge wins
+                try:
+                    await asyncio.Event().wait()
+                except asyncio.CancelledError:
+                    cancelled.set()
+                    raise
+            return "hedge"
+
+        result = await resilient.call(fn)
+        await asyncio.wait_for(cancelled.wait(), timeout=1)
+        return result, started, resilient.breaker.state
+
+    result, started, state = asyncio.run(scenario())
+    assert result == "hedge"
+    assert started == [0, 1]
+    #The cancelled loser is not a failure
+    assert state == "closed"
+
+
+def test_no_hedge_without_enough_latency_samples(clock):
+    async def scenario():
+        resilient = provider(hedge=True)
+        fn, count = calls("ok")
+        assert resilient.latency.p95() is None
+        assert await resilient.call(fn) == "ok"
+        return count[0]
+
+    assert asyncio.run(scenario()) == 1
+
+
+def test_which_provider_errors_are_retryable():
+    request = httpx.Request("POST", "https://api.test")
+
+    def status_error(error_class, status: int, headers=None):
+        return error_class("error", response=httpx.Response(status, request=request, headers=headers), body=None)
+
+    assert is_retryable_eleven_labs_error(ElevenLabsAPIError(429, {}))
+    assert is_retryable_eleven_labs_error(ElevenLabsAPIError(503, {}))
+    assert is_retryable_eleven_labs_error(httpx.ConnectTimeout("timeout"))
+    assert not is_retryable_eleven_labs_error(ElevenLabsAPIError(404, {}))
+    assert not is_retryable_eleven_labs_error(ElevenLabsAPIError(400, {}))
+    assert not is_retryable_eleven_labs_error(ValueError())
+    assert eleven_labs_retry_after(ElevenLabsAPIError(429, {}, retry_after=7.0)) == 7.0
+
+    assert is_retryable_openai_error(status_error(openai.RateLimitError, 429, {"retry-after": "2"}))
+    assert is_retryable_openai_error(status_error(openai.InternalServerError, 500))
+    assert is_retryable_openai_error(openai.APIConnectionError(request=request))
+    assert is_retryable_openai_error(InvalidReplyError("not JSON"))
+    assert not is_retryable_openai_error(status_error(openai.BadRequestError, 400))
+    assert not is_retryable_openai_error(status_error(openai.AuthenticationError, 401))
+    assert openai_retry_after(status_error(openai.RateLimitError, 429, {"retry-after": "2"})) == 2.0
+    assert openai_retry_after(status_error(openai.InternalServerError, 500)) is None
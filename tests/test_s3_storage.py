@@ -0,0 +1,95 @@
+import asyncio
+import hashlib
+import pytest
+
+pytest.importorskip("moto")
+import boto3
+from moto import mock_aws
+from data import s3_storage
+from data.s3_storage import S3Storage
+
+BUCKET = "test-bucket"
+ENDPOINT = "https://s3.amazonaws.com"
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket=BUCKET)
+        storage = S3Storage(bucket=BUCKET, endpoint_url=ENDPOINT, access_key="test", secret_key="test", max_workers=2)
+        yield storage
+        storage.close()
+
+
+def read_object(storage: S3Storage, key: str) -> dict:
+    response = storage.client.get_object(Bucket=BUCKET, Key=key)
+    return {"body": response["Body"].read(), "etag": response["ETag"], "content_type": response["ContentType"]}
+
+
+async def chunked(data: bytes, size: int):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def test_upload_small_payload_uses_put_object(storage):
+    data = b"\xff\xf3" + bytes(1000)
+    url = asyncio.run(storage.upload(data, "small.mp3"))
+
+    assert url == f"{ENDPOINT}/{BUCKET}/small.mp3"
+    stored = read_object(storage, "small.mp3")
+    assert stored["body"] == data
+    assert stored["content_type"] == "audio/mpeg"
+    #A single put_object has a plain MD5 ETag, multipart ones end in -<parts>
+    assert stored["etag"].strip('"') == hashlib.md5(data).hexdigest()
+
+
+def test_upload_large_payload_is_multipart(storage, monkeypatch):
+    monkeypatch.setattr(s3_storage, "S3_MULTIPART_THRESHOLD", 6 * MB)
+    storage.transfer_config.multipart_threshold = 6 * MB
+    storage.transfer_config.multipart_chunksize = 5 * MB
+    data = bytes(range(256)) * (11 * MB // 256)
+
+    asyncio.run(storage.upload(data, "large.mp3"))
+
+    stored = read_object(storage, "large.mp3")
+    assert stored["body"] == data
+    assert stored["etag"].strip('"').endswith("-3")
+
+
+def test_upload_stream_short_stream_falls_back_to_put(storage):
+    data = b"x" * 4096
+    asyncio.run(storage.upload_stream(chunked(data, 1000), "short.mp3"))
+
+    stored = read_object(storage, "short.mp3")
+    assert stored["body"] == data
+    assert "-" not in stored["etag"].strip('"')
+
+
+def test_upload_stream_sends_parts_as_they_fill(storage, monkeypatch):
+    monkeypatch.setattr(s3_storage, "S3_MULTIPART_CHUNKSIZE", 5 * MB)
+    data = bytes(range(256)) * (12 * MB // 256)
+
+    url = asyncio.run(storage.upload_stream(chunked(data, MB), "stream.mp3"))
+
+    assert url == f"{ENDPOINT}/{BUCKET}/stream.mp3"
+    stored = read_object(storage, "stream.mp3")
+    assert stored["body"] == data
+    #Two full 5MB parts and the 2MB remainder
+    assert stored["etag"].strip('"').endswith("-3")
+    assert stored["content_type"] == "audio/mpeg"
+
+
+def test_upload_stream_aborts_multipart_upload_on_error(storage, monkeypatch):
+    monkeypatch.setattr(s3_storage, "S3_MULTIPART_CHUNKSIZE", 5 * MB)
+
+    async def failing():
+        yield bytes(6 * MB)
+        raise RuntimeError("provider stream broke")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(storage.upload_stream(failing(), "broken.mp3"))
+
+    assert storage.client.list_multipart_uploads(Bucket=BUCKET).get("Uploads", []) == []
+    assert storage.client.list_objects_v2(Bucket=BUCKET).get("KeyCount") == 0
@@ -0,0 +1,55 @@
+import pytest
+from data import senses
+from data.senses import choose_sense, cosine, sense_signature, sense_vector
+
+MONEY = ("money", None, ["I deposited money at the bank.", "The bank gave me a loan."])
+RIVER = ("river", "we sat on the river bank", ["The river bank was muddy.", "Fish swim near the bank of the river."])
+
+
+def score(context: str, sense) -> float:
+    _, stored_context, usage_examples = sense
+    return cosine(sense_vector(context, "bank"), sense_vector(sense_signature(stored_context, usage_examples), "bank"))
+
+
+def test_context_picks_the_closest_sense():
+    assert choose_sense("bank", "a loan from the bank", [MONEY, RIVER]) == "money"
+    assert choose_sense("bank", "sitting by the river", [MONEY, RIVER]) == "river"
+
+
+def test_trigrams_match_other_forms_of_a_word():
+    assert choose_sense("bank", "fishing by rivers", [MONEY, RIVER]) == "river"
+
+
+def test_unrelated_context_asks_the_llm():
+    assert choose_sense("bank", "the quick brown fox", [MONEY, RIVER]) is None
+
+
+@pytest.mark.parametrize("context", [None, "", "   ", "the bank", "Bank!"])
+def test_no_usable_context_gets_the_sense_created_without_one(context):
+    assert choose_sense("bank", context, [RIVER, MONEY]) == "money"
+    #Without such a sense, the first one
+    assert choose_sense("bank", context, [RIVER, ("other", "a blood bank", [])]) == "river"
+
+
+def test_threshold_is_inclusive(monkeypatch):
+    context = "a loan from the bank"
+    best = score(context, MONEY)
+    assert 0 < best < 1
+
+    monkeypatch.setattr(senses, "SENSE_MATCH_THRESHOLD", best)
+    assert choose_sense("bank", context, [MONEY, RIVER]) == "money"
+
+    monkeypatch.setattr(senses, "SENSE_MATCH_THRESHOLD", best + 1e-9)
+    assert choose_sense("bank", context, [MONEY, RIVER]) is None
+
+
+def test_no_senses():
+    assert choose_sense("bank", "money", []) is None
+    assert choose_sense("bank", "", []) is None
+
+
+def test_vectors_are_normalized_and_stable():
+    vector = sense_vector("Deposit money at the bank", "bank")
+    assert vector == sense_vector("deposit MONEY at the Bank", "bank")
+    assert cosine(vector, vector) == pytest.approx(1.0)
+    assert sense_vector("the a of", "bank") == {}
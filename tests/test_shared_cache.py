@@ -0,0 +1,170 @@
+import asyncio
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+from data import cache
+from data.cache import (
+    InMemoryCacheBackend,
+    NullCacheBackend,
+    RedisCacheBackend,
+    SharedTranslationCache,
+    TranslationCache,
+    create_cache_backend,
+)
+
+
+def worker(server) -> SharedTranslationCache:
+    """
+    One app worker: its own first level in front of the Redis both workers share.
+    """
+    backend = RedisCacheBackend(client=fakeredis.FakeAsyncRedis(server=server))
+    return SharedTranslationCache(backend, TranslationCache(max_size=100, ttl=300), ttl=3600, beta=1.0)
+
+
+async def eventually(condition, timeout: float = 2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "condition not met in time"
+        await asyncio.sleep(0.01)
+
+
+def test_hit_fills_the_first_level(monkeypatch):
+    monkeypatch.setattr(cache.random, "random", lambda: 1.0)
+
+    async def scenario():
+        shared = worker(fakeredis.FakeServer())
+        await shared.set(7, "Bank", b'{"id": 7}', (70, 71), delta=0.05, etag='"v1"')
+
+        assert await shared.get(translation_id=7) == (b'{"id": 7}', '"v1"', False)
+        assert await shared.get(word="bank") == (b'{"id": 7}', '"v1"', False)
+        assert shared.local.get_entry_by_word("BANK").usage_ids == (70, 71)
+        assert await shared.get(translation_id=8) == (None, None, True)
+        assert (shared.stats.hits, shared.stats.misses) == (2, 1)
+        await shared.close()
+
+    asyncio.run(scenario())
+
+
+def test_xfetch_refreshes_early_near_expiry(monkeypatch):
+    async def scenario():
+        shared = worker(fakeredis.FakeServer())
+        #An entry that took 10s to compute, with an hour to live
+        await shared.set(7, "bank", b"payload", (), delta=10.0)
+
+        #random() near 1 adds almost nothing to now: not yet
+        monkeypatch.setattr(cache.random, "random", lambda: 0.999)
+        assert (await shared.get(translation_id=7))[2] is False
+
+        #random() near 0 pushes the check past expiry: this one request recomputes, still getting the payload
+        monkeypatch.setattr(cache.random, "random", lambda: 1e-300)
+        assert await shared.get(translation_id=7) == (b"payload", None, True)
+        assert shared.stats.early_refreshes == 1
+        await shared.close()
+
+    asyncio.run(scenario())
+
+
+def test_invalidation_reaches_every_worker(monkeypatch):
+    monkeypatch.setattr(cache.random, "random", lambda: 1.0)
+
+    async def scenario():
+        server = fakeredis.FakeServer()
+        writer, reader = worker(server), worker(server)
+        await writer.start()
+        await reader.start()
+
+        await writer.set(7, "bank", b"old", (70,), delta=0.01)
+        assert (await reader.get(translation_id=7))[0] == b"old"
+        assert reader.local.get_by_id(7) == b"old"
+
+        #A usage write only knows the usage id; the shared pointer resolves the translation
+        await writer.invalidate(usage_id=70)
+        await eventually(lambda: reader.stats.invalidations_received == 1)
+        assert reader.local.get_by_id(7) is None
+        assert await reader.get(translation_id=7) == (None, None, True)
+        #A worker ignores its own message
+        assert writer.stats.invalidations_received == 0
+
+        await writer.close()
+        await reader.close()
+
+    asyncio.run(scenario())
+
+
+def test_invalidation_blocks_a_fill_read_before_it():
+    async def scenario():
+        shared = worker(fakeredis.FakeServer())
+        token = shared.local.fill_token()
+        await shared.invalidate(translation_id=7, word="bank")
+        assert shared.local.changed_since(token, 7, "bank")
+        assert not shared.local.changed_since(shared.local.fill_token(), 7, "bank")
+        await shared.close()
+
+    asyncio.run(scenario())
+
+
+def test_outage_reads_as_a_miss():
+    class Down:
+        async def get(self, key):
+            raise ConnectionError("redis is down")
+
+        async def aclose(self):
+            pass
+
+    async def scenario():
+        shared = SharedTranslationCache(RedisCacheBackend(client=Down()), TranslationCache())
+        assert await shared.get(translation_id=7) == (None, None, True)
+
+    asyncio.run(scenario())
+
+
+def test_memory_backend_is_bounded_and_capped_at_the_first_level_ttl():
+    async def scenario():
+        backend = InMemoryCacheBackend(max_size=2, max_ttl=300)
+        await backend.set("a", b"1", 3600)
+        await backend.set("b", b"2", 3600)
+        await backend.get("a")
+        await backend.set("c", b"3", 3600)
+        assert await backend.get("b") is None
+        assert await backend.get("a") == b"1"
+        assert SharedTranslationCache(backend, TranslationCache(), ttl=3600).ttl == 300
+
+    asyncio.run(scenario())
+
+
+def test_no_second_level_without_redis():
+    assert isinstance(create_cache_backend("none"), NullCacheBackend)
+    assert isinstance(create_cache_backend("memory"), InMemoryCacheBackend)
+
+
+def test_only_the_words_own_sense_is_found_by_word(monkeypatch):
+    monkeypatch.setattr(cache.random, "random", lambda: 1.0)
+
+    async def scenario():
+        server = fakeredis.FakeServer()
+        shared = worker(server)
+        #"bank" has senses 7 (the oldest, what a lookup by word returns) and 9
+        await shared.set(7, "bank", b"money", (), delta=0.01)
+        shared.local.set(7, "bank", b"money")
+        #Then sense 9 is read by id
+        await shared.set(9, "bank", b"river", (), delta=0.01, index_word=False)
+        shared.local.set(9, "bank", b"river", index_word=False)
+
+        assert shared.local.get_by_word("bank") == b"money"
+        assert shared.local.get_by_id(9) == b"river"
+        assert (await shared.get(word="bank"))[0] == b"money"
+
+        #Another worker filling its first level from the shared entry of sense 9 does not index it by word
+        other = worker(server)
+        assert (await other.get(translation_id=9))[0] == b"river"
+        assert other.local.get_entry_by_word("bank") is None
+        assert (await other.get(word="bank"))[0] == b"money"
+        assert other.local.get_by_word("bank") == b"money"
+
+        #Refilling the word's own sense by id keeps it reachable by word
+        shared.local.set(7, "bank", b"money v2", index_word=False)
+        assert shared.local.get_by_word("bank") == b"money v2"
+        await shared.close()
+        await other.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,96 @@
+import asyncio
+import pytest
+from data.single_flight import SingleFlight
+
+
+def test_concurrent_calls_for_a_key_share_one_run():
+    async def scenario():
+        flights = SingleFlight(mode="local")
+        release = asyncio.Event()
+        runs = []
+
+        async def generate(key):
+            runs.append(key)
+            await release.wait()
+            return f"{key} done"
+
+        waiters = [asyncio.create_task(flights.do("bank", lambda: generate("bank"))) for _ in range(5)]
+        other = asyncio.create_task(flights.do("river", lambda: generate("river")))
+        await asyncio.sleep(0)
+        in_flight = flights.get_stats()["in_flight"]
+        release.set()
+        results = await asyncio.gather(*waiters, other)
+        return runs, results, in_flight, flights.get_stats()
+
+    runs, results, in_flight, stats = asyncio.run(scenario())
+    assert sorted(runs) == ["bank", "river"]
+    assert results == ["bank done"] * 5 + ["river done"]
+    assert in_flight == 2
+    assert stats == {"mode": "local", "in_flight": 0, "coalesced": 4}
+
+
+def test_a_finished_key_runs_again():
+    async def scenario():
+        flights = SingleFlight(mode="local")
+        runs = []
+
+        async def generate():
+            runs.append(1)
+            return len(runs)
+
+        return await flights.do("bank", generate), await flights.do("bank", generate), flights.coalesced
+
+    assert asyncio.run(scenario()) == (1, 2, 0)
+
+
+def test_cancelling_a_caller_does_not_cancel_the_run():
+    async def scenario():
+        flights = SingleFlight(mode="local")
+        release = asyncio.Event()
+        cancelled = []
+
+        async def generate():
+            try:
+                await release.wait()
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+            return "done"
+
+        #The caller that started the run disconnects, then one that joined it
+        leader = asyncio.create_task(flights.do("bank", generate))
+        follower = asyncio.create_task(flights.do("bank", generate))
+        survivor = asyncio.create_task(flights.do("bank", generate))
+        await asyncio.sleep(0)
+        leader.cancel()
+        follower.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        result = await survivor
+        return leader.cancelled(), follower.cancelled(), result, cancelled
+
+    assert asyncio.run(scenario()) == (True, True, "done", [])
+
+
+def test_an_error_reaches_every_caller():
+    async def scenario():
+        flights = SingleFlight(mode="local")
+        release = asyncio.Event()
+        runs = []
+
+        async def generate():
+            runs.append(1)
+            await release.wait()
+            raise RuntimeError("provider down")
+
+        waiters = [asyncio.create_task(flights.do("bank", generate)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        return runs, results, flights.get_stats()["in_flight"]
+
+    runs, results, in_flight = asyncio.run(scenario())
+    assert runs == [1]
+    assert all(isinstance(result, RuntimeError) and str(result) == "provider down" for result in results)
+    #A failed run is not kept, the next call tries again
+    assert in_flight == 0
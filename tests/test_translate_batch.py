@@ -0,0 +1,56 @@
+import json
+import httpx
+import pytest
+
+
+def reply(word: str) -> dict:
+    return {
+        "word": word,
+        "translation": f"{word}訳",
+        "reading": None,
+        "script": "kanji",
+        "usage": [{"en": f"A {word}.", "ja": f"{word}です。"}],
+    }
+
+
+@pytest.fixture
+def app(monkeypatch):
+    import main
+    from authentication.auth import get_api_key
+
+    async def translate(words):
+        return [reply(word) for word, _ in words]
+
+    insert_translations_bulk = main.insert_translations_bulk
+
+    async def insert_or_fail(session, payloads):
+        if any(payload["word"] == "broken" for payload in payloads):
+            raise ConnectionError("the database went away")
+        return await insert_translations_bulk(session, payloads)
+
+    monkeypatch.setattr(main, "ai_translate_eng_words_to_jap", translate)
+    monkeypatch.setattr(main, "insert_translations_bulk", insert_or_fail)
+    monkeypatch.setattr(main, "BATCH_PROMPT_SIZE", 2)
+    main.app.dependency_overrides[get_api_key] = lambda: "test"
+    yield main
+    main.app.dependency_overrides.clear()
+
+
+def test_failed_insert_streams_error_lines_for_its_words(run_db, app):
+    async def scenario():
+        transport = httpx.ASGITransport(app=app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post("/translate/batch", json={"words": [
+                {"word": "apple"}, {"word": "pear"}, {"word": "broken"}, {"word": "plum"}, {"word": "no word"},
+            ]})
+        return response
+
+    response = run_db(scenario)
+    assert response.status_code == 200
+    lines = {line["word"]: line for line in map(json.loads, response.text.splitlines())}
+    assert set(lines) == {"apple", "pear", "broken", "plum", "no word"}
+    assert lines["apple"]["status"] == lines["pear"]["status"] == "created"
+    #"plum" shares the failed chunk with "broken"
+    assert lines["broken"]["status"] == lines["plum"]["status"] == "error"
+    assert lines["broken"]["detail"] == "An error occurred generating the translation."
+    assert lines["no word"]["status"] == "error"
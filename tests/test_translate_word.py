@@ -0,0 +1,107 @@
+import httpx
+import pytest
+from sqlalchemy import select, func
+from data.db import SessionLocal
+from data.db_actions import insert_translation, insert_translation_audio
+from data.models import Job, TranslationAudio
+
+VOICE = "voice-a"
+
+
+def reply() -> dict:
+    return {
+        "word": "bank",
+        "translation": "銀行",
+        "reading": "ぎんこう",
+        "script": "kanji",
+        "usage": [{"en": "I keep my money at the bank.", "ja": "銀行にお金を預けています。"}],
+    }
+
+
+@pytest.fixture
+def app(monkeypatch):
+    import main
+    from authentication.auth import get_api_key
+    from services import translation
+
+    async def translate(word, context):
+        return reply()
+
+    async def no_audio(*args):
+        raise AssertionError("the stored audio should have been reused")
+
+    #The request's context matches no stored sense, so the LLM is asked and its reply is the stored sense
+    monkeypatch.setattr(translation, "ai_translate_eng_word_to_jap", translate)
+    monkeypatch.setattr(main, "generate_word_audio", no_audio)
+    main.app.dependency_overrides[get_api_key] = lambda: "test"
+    main.translation_cache.clear()
+    yield main
+    main.app.dependency_overrides.clear()
+    main.translation_cache.clear()
+
+
+async def count(model) -> int:
+    async with SessionLocal() as session:
+        return (await session.execute(select(func.count()).select_from(model))).scalar_one()
+
+
+async def post(app, voice_id: str, background: bool = False, context: str = "the quick brown fox") -> httpx.Response:
+    transport = httpx.ASGITransport(app=app.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.post(
+            "/translatewordengtojap",
+            params={"background": "true"} if background else None,
+            json={"word": "bank", "context": context, "voice_id": voice_id},
+        )
+
+
+async def store_voiced_sense():
+    async with SessionLocal() as session:
+        translation, inserted = await insert_translation(session, dict(reply(), context="money and savings"))
+    assert inserted
+    async with SessionLocal() as session:
+        audio = await insert_translation_audio(session, translation.id, "https://bucket/a.mp3", VOICE)
+    return translation, audio
+
+
+def test_reply_resolving_to_a_voiced_sense_reuses_its_audio(run_db, app):
+    async def scenario():
+        translation, audio = await store_voiced_sense()
+        response = await post(app, VOICE)
+        return translation, audio, response, await count(TranslationAudio)
+
+    translation, audio, response, audio_rows = run_db(scenario)
+    assert response.status_code == 200
+    assert response.json()["translation"]["id"] == translation.id
+    assert response.json()["audio"]["id"] == audio.id
+    assert audio_rows == 1
+
+
+def test_background_request_queues_nothing_for_a_voiced_sense(run_db, app):
+    async def scenario():
+        translation, audio = await store_voiced_sense()
+        voiced = await post(app, VOICE, background=True)
+        jobs_after_voiced = await count(Job)
+        #Another voice is still missing, so that one is queued
+        other_voice = await post(app, "voice-b", background=True, context="a lazy dog sleeping")
+        return audio, voiced, jobs_after_voiced, other_voice, await count(Job)
+
+    audio, voiced, jobs_after_voiced, other_voice, jobs = run_db(scenario)
+    assert voiced.status_code == 200
+    assert voiced.json()["audio"]["id"] == audio.id
+    assert jobs_after_voiced == 0
+    assert other_voice.status_code == 202
+    assert jobs == 1
+
+
+def test_insert_reports_whether_the_row_is_new(run_db):
+    async def scenario():
+        async with SessionLocal() as session:
+            first = await insert_translation(session, reply())
+        async with SessionLocal() as session:
+            second = await insert_translation(session, reply())
+        return first, second
+
+    (first, first_inserted), (second, second_inserted) = run_db(scenario)
+    assert (first_inserted, second_inserted) == (True, False)
+    assert first.id == second.id
@@ -0,0 +1,72 @@
+import asyncio
+from sqlalchemy import select, func
+from data.db import SessionLocal
+from data.db_actions import insert_translation
+from data.models import Translation, TranslationUsage
+
+
+def reply(context: str = "") -> dict:
+    return {
+        "word": "bank",
+        "translation": "銀行",
+        "reading": "ぎんこう",
+        "script": "kanji",
+        "context": context,
+        "usage": [
+            {"en": "I went to the bank.", "ja": "銀行に行きました。"},
+            {"en": "The bank is closed.", "ja": "銀行は閉まっています。"},
+        ],
+    }
+
+
+async def insert(payload: dict):
+    async with SessionLocal() as session:
+        translation, _ = await insert_translation(session, payload)
+        return translation
+
+
+async def count(model) -> int:
+    async with SessionLocal() as session:
+        return (await session.execute(select(func.count()).select_from(model))).scalar_one()
+
+
+def test_insert_returns_usages_in_reply_order(run_db):
+    async def scenario():
+        created = await insert(reply())
+        assert [usage.en for usage in created.usages] == ["I went to the bank.", "The bank is closed."]
+        assert all(usage.usage_audio is None for usage in created.usages)
+        return created
+
+    created = run_db(scenario)
+    assert created.word == "bank"
+    assert created.reading == "ぎんこう"
+
+
+def test_repeat_insert_returns_the_stored_row_without_new_usages(run_db):
+    async def scenario():
+        first = await insert(reply("money and loans"))
+        #Same sense asked for in another context: no new row or usages, the context is added to the sense
+        second = await insert(reply("savings account"))
+        assert second.id == first.id
+        assert [usage.id for usage in second.usages] == [usage.id for usage in first.usages]
+        async with SessionLocal() as session:
+            context = (await session.execute(select(Translation.context))).scalar_one()
+        return context, await count(Translation), await count(TranslationUsage)
+
+    context, translations, usages = run_db(scenario)
+    assert context == "money and loans | savings account"
+    assert (translations, usages) == (1, 2)
+
+
+def test_concurrent_inserts_of_one_word_store_it_once(run_db):
+    async def scenario():
+        results = await asyncio.gather(*[insert(reply()) for _ in range(12)])
+        return results, await count(Translation), await count(TranslationUsage)
+
+    results, translations, usages = run_db(scenario)
+    assert (translations, usages) == (1, 2)
+    assert len({result.id for result in results}) == 1
+    #Losers of the race still answer with the winner's usages
+    usage_ids = {tuple(usage.id for usage in result.usages) for result in results}
+    assert len(usage_ids) == 1
+    assert len(next(iter(usage_ids))) == 2